@@ -0,0 +1,24 @@
+"""
+Small, dependency-free statistics helpers shared by the benchmark drivers.
+"""
+
+import math
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of floats (0.0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+
+def latency_summary(latencies):
+    """Mean and p50/p95/p99 of a list of latencies in seconds"""
+    return {
+        'count': len(latencies),
+        'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
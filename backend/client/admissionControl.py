@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Admission control in front of the Ollama backends.
+
+Without it every request goes straight to Ollama, and a burst piles up in
+Ollama's own queue until the requests all time out together. With
+max_in_flight > 0 the client service instead:
+
+- sends at most `max_in_flight` requests to each backend at a time
+  (the per-backend limit; adaptive, see below)
+- makes further requests wait in a FIFO queue of at most `max_queue`
+  entries; a request arriving at a full queue is rejected at once
+  (queue_full, HTTP 429)
+- rejects a request up front when its estimated queue wait plus the
+  typical service time would overrun its deadline (deadline, HTTP 503), and
+  drops it from the queue once it can no longer finish in time or has
+  waited `queue_timeout` seconds (timeout, HTTP 503)
+
+With `adaptive`, each backend's limit follows an AIMD rule on the time per
+output token (latency per request when token counts are unknown): +1/limit
+per request at most `tolerance` x the best value seen, x0.9 above it or on
+an error, within [min_limit, max_limit]. Decode time per token rises as
+Ollama's batch grows, so the limit settles where more concurrency stops
+paying off.
+
+stats() reports admitted and rejected counts by reason, the queue length
+(now and peak), queue-wait percentiles and the current per-backend limits.
+"""
+
+import threading
+import time
+from collections import deque
+
+from benchStats import latency_summary
+
+
+class Rejected(Exception):
+    """A request turned away by admission control; `status` is the HTTP code to answer with"""
+
+    def __init__(self, reason, status):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+
+
+class AdmissionController:
+    def __init__(self, pool, max_in_flight=0, max_queue=64, queue_timeout=30.0, adaptive=False,
+                 min_limit=1, max_limit=64, tolerance=2.0):
+        self.pool = pool
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.limits = {}
+        self.best = {}
+        self.service_ewma = None
+        self.configure(max_in_flight=max_in_flight, max_queue=max_queue, queue_timeout=queue_timeout,
+                       adaptive=adaptive, min_limit=min_limit, max_limit=max_limit, tolerance=tolerance)
+        self.reset_stats()
+
+    def configure(self, **settings):
+        """Change settings at runtime; limits restart from max_in_flight"""
+        with self.cond:
+            for key in ('max_in_flight', 'max_queue', 'min_limit', 'max_limit'):
+                if key in settings:
+                    setattr(self, key, int(settings[key]))
+            for key in ('queue_timeout', 'tolerance'):
+                if key in settings:
+                    setattr(self, key, float(settings[key]))
+            if 'adaptive' in settings:
+                self.adaptive = bool(settings['adaptive'])
+            self.limits = {}
+            self.best = {}
+            self.cond.notify_all()
+
+    @property
+    def enabled(self):
+        return self.max_in_flight > 0
+
+    def reset_stats(self):
+        with self.cond:
+            self.admitted = 0
+            self.rejected = {'queue_full': 0, 'deadline': 0, 'timeout': 0}
+            self.queue_waits = []
+            self.max_queue_length = 0
+
+    def _limit(self, backend):
+        return self.limits.setdefault(backend.host, float(self.max_in_flight))
+
+    def _estimated_wait(self, position):
+        """Queue wait of the request at `position`, at the current limits and service time"""
+        if self.service_ewma is None:
+            return 0.0
+        capacity = sum(int(self._limit(b)) for b in list(self.pool.backends.values())) or 1
+        return (position + 1) * self.service_ewma / capacity
+
+    def _reject(self, reason, status):
+        self.rejected[reason] += 1
+        raise Rejected(reason, status)
+
+    def _acquire(self, allowed, exclude):
+        """Pool pick among `allowed` endpoints, avoiding `exclude` hosts when possible"""
+        if exclude:
+            backend = self.pool.acquire(lambda b: b.host not in exclude and (allowed is None or allowed(b)))
+            if backend is not None:
+                return backend
+        return self.pool.acquire(allowed)
+
+    def admit(self, deadline=None, exclude=()):
+        """Wait for a backend with spare capacity; returns (backend, queue wait in s)
+
+        `deadline` is a time.monotonic() value by which the response is needed.
+        `exclude` lists hosts to avoid if another one is free (hedged attempts).
+        Raises Rejected when the request is turned away.
+        """
+        if not self.enabled:
+            return self._acquire(None, exclude), 0.0
+
+        arrived = time.monotonic()
+        with self.cond:
+            if len(self.queue) >= self.max_queue:
+                self._reject('queue_full', 429)
+            service = self.service_ewma or 0.0
+            if deadline is not None and arrived + self._estimated_wait(len(self.queue)) + service > deadline:
+                self._reject('deadline', 503)
+
+            ticket = object()
+            self.queue.append(ticket)
+            self.max_queue_length = max(self.max_queue_length, len(self.queue))
+            try:
+                give_up = arrived + self.queue_timeout
+                reason = 'timeout'
+                if deadline is not None and deadline - service < give_up:
+                    give_up, reason = deadline - service, 'deadline'
+                while True:
+                    # FIFO: only the head of the queue may take a free slot
+                    if self.queue[0] is ticket:
+                        backend = self._acquire(lambda b: b.outstanding < int(self._limit(b)), exclude)
+                        if backend is not None:
+                            break
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(reason, 503)
+                    # Wake up now and then: ejected backends come back without a release()
+                    self.cond.wait(min(remaining, 0.5))
+            finally:
+                self.queue.remove(ticket)
+                self.cond.notify_all()
+
+            wait = time.monotonic() - arrived
+            self.admitted += 1
+            self.queue_waits.append(wait)
+        return backend, wait
+
+    def release(self, backend, latency, ok, tokens=None, cancelled=False, adapt=True):
+        """Return the slot of a finished request and adapt the backend's limit
+
+        adapt=False (e.g. embedding batches, whose latency is not comparable
+        to generation's) frees the slot without feeding the service time
+        estimate or the adaptive limit.
+        """
+        self.pool.release(backend, latency, ok, cancelled)
+        if not self.enabled:
+            return
+        with self.cond:
+            if cancelled or not adapt:
+                self.cond.notify_all()
+                return
+            if ok:
+                self.service_ewma = latency if self.service_ewma is None else 0.9 * self.service_ewma + 0.1 * latency
+            if self.adaptive:
+                limit = self._limit(backend)
+                sample = latency / tokens if tokens else latency
+                best = min(self.best.get(backend.host, sample), sample)
+                self.best[backend.host] = best
+                if ok and sample <= self.tolerance * best:
+                    limit += 1.0 / limit
+                else:
+                    limit *= 0.9
+                self.limits[backend.host] = min(max(limit, self.min_limit), self.max_limit)
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "enabled": self.enabled,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "adaptive": self.adaptive,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "queue_length": len(self.queue),
+                "max_queue_length": self.max_queue_length,
+                "queue_wait": latency_summary(self.queue_waits),
+                "service_time": self.service_ewma,
+                "limits": {host: round(limit, 2) for host, limit in self.limits.items()},
+            }
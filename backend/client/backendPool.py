@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Routing of client traffic across every live Ollama replica.
+
+Each Ollama job publishes output/ollama_ip_<jobid>.txt; the pool picks all
+of them up (and re-scans while running, so late replicas join) and routes
+each request to one endpoint:
+
+- least_outstanding   the endpoint with the fewest requests in flight
+                      (ties broken at random)
+- p2c                 power of two choices: the less loaded of two
+                      endpoints picked at random
+- round_robin         for comparison
+
+Endpoints are health-checked in the background (GET /api/version). An
+endpoint is ejected for `eject_seconds` after failing a health check or
+`max_failures` requests in a row, and re-admitted once a check passes
+after that. If every endpoint is ejected, requests still go to the least
+loaded one rather than failing outright.
+
+stats() reports per endpoint: requests, errors, in-flight now and at peak,
+share of traffic, latency percentiles and ejections, so horizontal scaling
+can be measured per replica.
+"""
+
+import glob
+import os
+import random
+import threading
+import time
+
+import requests
+from benchStats import latency_summary
+
+POLICIES = ('least_outstanding', 'p2c', 'round_robin')
+
+
+class Backend:
+    """One Ollama endpoint and its counters (guarded by the pool's lock)"""
+
+    def __init__(self, host, port=11434):
+        self.host = host
+        self.port = port
+        self.url = f"http://{host}:{port}"
+        self.outstanding = 0
+        self.max_outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.latencies = []
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.healthy = True
+
+    def available(self, now):
+        return self.healthy and now >= self.ejected_until
+
+
+class BackendPool:
+    def __init__(self, ip_glob='/app/output/ollama_ip_*.txt', policy='least_outstanding', port=11434,
+                 health_interval=5.0, max_failures=3, eject_seconds=30.0, fallback_host='localhost'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy {policy!r} (expected one of {POLICIES})")
+        self.ip_glob = ip_glob
+        self.policy = policy
+        self.port = port
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.fallback_host = fallback_host
+        self.lock = threading.Lock()
+        self.backends = {}
+        self._rr = 0
+        self.discover()
+        threading.Thread(target=self._health_loop, name="backend-health", daemon=True).start()
+
+    def discover(self):
+        """Add endpoints from new IP files (or OLLAMA_HOSTS / the fallback if there are none)"""
+        hosts = []
+        for path in sorted(glob.glob(self.ip_glob), key=os.path.getmtime):
+            try:
+                with open(path, 'r') as f:
+                    hosts.append(f.read().strip())
+            except OSError:
+                continue
+        if not hosts:
+            hosts = [h.strip() for h in os.getenv('OLLAMA_HOSTS', '').split(',') if h.strip()]
+        if not hosts and not self.backends:
+            hosts = [self.fallback_host]
+        with self.lock:
+            for host in hosts:
+                if host and host not in self.backends:
+                    self.backends[host] = Backend(host, self.port)
+                    print(f"Routing: added backend {host}:{self.port}")
+        return list(self.backends)
+
+    @property
+    def hosts(self):
+        return list(self.backends)
+
+    def _candidates(self):
+        now = time.time()
+        backends = list(self.backends.values())
+        live = [b for b in backends if b.available(now)]
+        return live or backends
+
+    def acquire(self, allowed=None):
+        """Pick an endpoint for one request and count it as in flight
+
+        `allowed(backend)` restricts the choice (admission control); returns
+        None when it rules out every endpoint.
+        """
+        with self.lock:
+            candidates = self._candidates()
+            if allowed is not None:
+                candidates = [b for b in candidates if allowed(b)]
+                if not candidates:
+                    return None
+            if self.policy == 'p2c' and len(candidates) > 1:
+                a, b = random.sample(candidates, 2)
+                backend = a if a.outstanding <= b.outstanding else b
+            elif self.policy == 'round_robin':
+                backend = candidates[self._rr % len(candidates)]
+                self._rr += 1
+            else:
+                least = min(b.outstanding for b in candidates)
+                backend = random.choice([b for b in candidates if b.outstanding == least])
+            backend.outstanding += 1
+            backend.max_outstanding = max(backend.max_outstanding, backend.outstanding)
+            return backend
+
+    def release(self, backend, latency, ok, cancelled=False):
+        """Record the outcome of a request sent to `backend`
+
+        A `cancelled` request (a hedging loser) only frees its slot: it says
+        nothing about the backend's health or latency.
+        """
+        with self.lock:
+            backend.outstanding -= 1
+            if cancelled:
+                backend.cancelled += 1
+                return
+            backend.requests += 1
+            if ok:
+                backend.latencies.append(latency)
+                backend.consecutive_failures = 0
+            else:
+                backend.errors += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.max_failures:
+                    self._eject(backend, f"{backend.consecutive_failures} failed requests in a row")
+
+    def _eject(self, backend, reason):
+        if time.time() >= backend.ejected_until:
+            backend.ejections += 1
+            print(f"Routing: ejecting {backend.host} for {self.eject_seconds:.0f}s ({reason})")
+        backend.ejected_until = time.time() + self.eject_seconds
+        backend.consecutive_failures = 0
+
+    def check(self, backend):
+        try:
+            healthy = requests.get(f"{backend.url}/api/version", timeout=2).status_code == 200
+        except Exception:
+            healthy = False
+        with self.lock:
+            if not healthy and backend.healthy:
+                self._eject(backend, "health check failed")
+            backend.healthy = healthy
+        return healthy
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.discover()
+            for backend in list(self.backends.values()):
+                self.check(backend)
+
+    def reset_stats(self):
+        with self.lock:
+            for backend in self.backends.values():
+                backend.requests = backend.errors = backend.cancelled = backend.max_outstanding = 0
+                backend.latencies = []
+                backend.ejections = 0
+
+    def stats(self):
+        """Per-endpoint load and latency since the last reset_stats()"""
+        with self.lock:
+            total = sum(b.requests for b in self.backends.values())
+            now = time.time()
+            return {
+                host: {
+                    "requests": b.requests,
+                    "errors": b.errors,
+                    "cancelled": b.cancelled,
+                    "share": b.requests / total if total else 0.0,
+                    "outstanding": b.outstanding,
+                    "max_outstanding": b.max_outstanding,
+                    "healthy": b.healthy,
+                    "ejected": now < b.ejected_until,
+                    "ejections": b.ejections,
+                    "latency": latency_summary(b.latencies),
+                }
+                for host, b in self.backends.items()
+            }
@@ -1,89 +1,388 @@
 #!/usr/bin/env python3
 
 from flask import Flask, request, jsonify
+import http.client
+import json
 import os
+import socket
+import threading
 import time
 import requests
 from concurrent.futures import ThreadPoolExecutor
+from benchStats import latency_summary
+import requestTrace
+from profilingHooks import debug, profiled
+from backendPool import BackendPool, POLICIES
+from admissionControl import AdmissionController, Rejected
+from requestPolicy import Cancel, RequestPolicy, RETRYABLE_STATUS
+from responseCache import ResponseCache
+import trafficCapture
+import workloads
 
 app = Flask(__name__)
+app.register_blueprint(debug)
 
 # Thread pool for parallel client simulation
 executor = ThreadPoolExecutor(max_workers=20)
 # No longer need ThreadPoolExecutor - each client does sequential requests
 
+def _abort(conn):
+    """Shut down the socket of an http.client connection owned by another thread"""
+    sock = conn.sock
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
 class OllamaClientService:
     def __init__(self):
-        self.ollama_host = self._get_ollama_ip()
         self.ollama_port = 11434
         self.default_model = "mistral"
+        # Every published Ollama replica, see backendPool.py
+        self.default_routing = os.getenv('CLIENT_ROUTING', 'least_outstanding')
+        self.pool = BackendPool('/app/output/ollama_ip_*.txt',
+                                policy=self.default_routing,
+                                port=self.ollama_port,
+                                fallback_host=os.getenv('OLLAMA_HOST', 'localhost'))
+        print(f"Routing over {self.pool.hosts} ({self.pool.policy})")
+        # Per-backend in-flight limit and bounded queue, see admissionControl.py (0 = off)
+        self.admission = AdmissionController(
+            self.pool,
+            max_in_flight=int(os.getenv('CLIENT_MAX_INFLIGHT', '0')),
+            max_queue=int(os.getenv('CLIENT_MAX_QUEUE', '64')),
+            queue_timeout=float(os.getenv('CLIENT_QUEUE_TIMEOUT', '30')),
+            adaptive=os.getenv('CLIENT_ADAPTIVE', '0') == '1')
+        # Deadlines, retries and hedging, see requestPolicy.py (off until configured)
+        self.policy = RequestPolicy(**json.loads(os.getenv('CLIENT_REQUEST_POLICY') or '{}'))
+        # Responses to deterministic requests, see responseCache.py (off by default)
+        self.cache = ResponseCache(enabled=os.getenv('CLIENT_CACHE', '0') == '1',
+                                   max_mb=float(os.getenv('CLIENT_CACHE_MB', '64')),
+                                   ttl=float(os.getenv('CLIENT_CACHE_TTL', '300')))
+        # Request traces for deterministic replay, see trafficCapture.py
+        self.capture = trafficCapture.TrafficCapture()
+
+    @property
+    def ollama_host(self):
+        return ",".join(self.pool.hosts)
     
-    def _get_ollama_ip(self):
-        """Get Ollama server IP from file"""
-        try:
-            # Look for ollama_ip_*.txt files
-            import glob
-            print(f"DEBUG: Looking for files in /app/output/")
-            all_files = glob.glob('/app/output/*')
-            print(f"DEBUG: Found {len(all_files)} files: {all_files[:5]}")
-            
-            ollama_files = sorted(glob.glob('/app/output/ollama_ip_*.txt'), key=os.path.getmtime, reverse=True)
-            print(f"DEBUG: Found {len(ollama_files)} ollama_ip files")
-            
-            if ollama_files:
-                print(f"DEBUG: Using {ollama_files[0]}")
-                with open(ollama_files[0], 'r') as f:
-                    ip = f.read().strip()
-                    print(f"DEBUG: Loaded IP: {ip}")
-                    return ip
-            
-            # Fallback to environment variable
-            print("DEBUG: No ollama_ip file found, using fallback")
-            return os.getenv('OLLAMA_HOST', 'localhost')
-        except Exception as e:
-            print(f"Error loading Ollama IP: {e}")
-            return os.getenv('OLLAMA_HOST', 'localhost')
-    
-    def query_ollama(self, prompt, model=None):
-        """Query Ollama server with a prompt"""
+    def query_ollama(self, prompt, model=None, scheduled=None, deadline=None, options=None):
+        """Query Ollama server with a prompt
+
+        The result carries a 'trace' (see requestTrace.py); `scheduled` is the
+        monotonic time the caller decided to send the request (default: now).
+        `deadline` is the time budget in seconds: admission control turns the
+        request away (result with 'rejected') if it cannot be served in time.
+        `options` are Ollama generation options; with the response cache on,
+        deterministic requests (temperature 0 or a seed) may be answered from
+        it ('cache' in the result).
+        """
         model = model or self.default_model
-        print(f"Querying Ollama at {self.ollama_host} with model {model}")
+        arrived = requestTrace.now()
+        result = self.cache.fetch(model, prompt, options,
+                                  lambda: self._query(prompt, model, scheduled or arrived, deadline, options))
+        if 'trace' not in result:
+            # Served from the cache (or by an identical request in flight)
+            result['trace'] = requestTrace.span(scheduled or arrived, arrived, None, requestTrace.now())
+        result.setdefault('model', model)
+        return result
+
+    def _query(self, prompt, model, scheduled, deadline=None, options=None):
+        """One upstream query: through the request policy if configured, else a single call"""
+        if self.policy.enabled:
+            return self.query_with_policy(prompt, model, scheduled, deadline, options)
+        arrived = requestTrace.now()
+        timeout = 120
+        try:
+            deadline_at = time.monotonic() + deadline if deadline else None
+            backend, queue_wait = self.admission.admit(deadline_at)
+            if deadline_at is not None:
+                timeout = max(min(timeout, deadline_at - time.monotonic()), 0.1)
+        except Rejected as e:
+            return {"error": f"Rejected by admission control ({e.reason})", "rejected": e.reason,
+                    "status": e.status, "model": model, "start_time": time.time(), "request_time": 0.0,
+                    "trace": requestTrace.span(scheduled or arrived, None, None, requestTrace.now())}
+        print(f"Querying Ollama at {backend.host} with model {model}")
         
-        url = f"http://{self.ollama_host}:{self.ollama_port}/api/generate"
+        url = f"{backend.url}/api/generate"
         payload = {
             "model": model,
             "prompt": prompt,
             "stream": False
         }
+        if options:
+            payload["options"] = options
         
+        first_byte = connection = None
+        dispatched = requestTrace.now()
+        start_time = time.time()
         try:
-            start_time = time.time()
+            # stream=True returns at the response headers, before the body is read
             response = requests.post(
                 url,
                 json=payload,
-                timeout=120,
-                headers={'Content-Type': 'application/json'}
+                timeout=timeout,
+                headers={'Content-Type': 'application/json'},
+                stream=True
             )
+            first_byte = requestTrace.now()
+            connection = requestTrace.connection_id(response)
+            body = response.content
+            completed = requestTrace.now()
             elapsed = time.time() - start_time
+            trace = requestTrace.span(scheduled or arrived, dispatched, first_byte, completed, connection)
             
             if response.status_code == 200:
                 response_data = response.json()
+                self.admission.release(backend, elapsed, True, response_data.get('eval_count'))
+                response_data['queue_wait'] = queue_wait
                 response_data['request_time'] = elapsed
+                response_data['start_time'] = start_time
+                response_data['trace'] = trace
+                response_data['backend'] = backend.host
                 return response_data
             else:
-                return {"error": f"HTTP {response.status_code}: {response.text}"}
+                self.admission.release(backend, elapsed, False)
+                return {"error": f"HTTP {response.status_code}: {body.decode('utf-8', 'replace')}",
+                        "model": model, "start_time": start_time, "request_time": elapsed, "trace": trace,
+                        "backend": backend.host}
                 
         except Exception as e:
             print(f"Request failed: {e}")
+            self.admission.release(backend, time.time() - start_time, False)
+            trace = requestTrace.span(scheduled or arrived, dispatched, first_byte, requestTrace.now(),
+                                      connection if connection is not None else -1)
+            return {"error": f"Request failed: {str(e)}",
+                    "model": model, "start_time": start_time, "request_time": time.time() - start_time,
+                    "trace": trace, "backend": backend.host}
+
+    def query_with_policy(self, prompt, model, scheduled=None, deadline=None, options=None):
+        """Query Ollama under the request policy (deadline, retries, hedging)
+
+        The result is the winning attempt's, with the end-to-end request_time
+        and a 'policy' entry listing every attempt (see requestPolicy.py).
+        """
+        scheduled = scheduled or requestTrace.now()
+        start_time = time.time()
+
+        def attempt(record, exclude, cancel, deadline_at):
+            return self.stream_attempt(prompt, model, record, exclude, cancel, deadline_at, options)
+
+        result = self.policy.execute(attempt, deadline)
+        completed = requestTrace.now()
+        attempts = result['policy']['attempts']
+        trace = dict(result.get('trace') or requestTrace.span(None, None, None, completed))
+        # The request was in flight from the first attempt on
+        trace['scheduled'] = requestTrace.wall(scheduled)
+        trace['dispatched'] = attempts[0].get('dispatched', trace['dispatched'])
+        trace['completed'] = requestTrace.wall(completed)
+        result.update(model=model, start_time=start_time, request_time=time.time() - start_time, trace=trace)
+        return result
+
+    def stream_attempt(self, prompt, model, record, exclude, cancel, deadline_at, options=None):
+        """One attempt for the request policy: a streamed /api/generate that stops at `cancel`
+
+        Streaming lets a losing hedge be cancelled mid-generation: closing the
+        connection makes Ollama drop the request. The request goes through
+        http.client so that `cancel` (a requestPolicy.Cancel) can shut the
+        socket down from the policy thread, which also ends a wait for the
+        response headers. The result's 'ttft' is the time from dispatch to
+        the first streamed chunk (the first token).
+        """
+        try:
+            backend, queue_wait = self.admission.admit(deadline_at, exclude)
+        except Rejected as e:
+            return {"error": f"Rejected by admission control ({e.reason})", "rejected": e.reason,
+                    "status": e.status, "retryable": e.status in RETRYABLE_STATUS}
+        record['backend'] = backend.host
+        timeout = 120
+        if deadline_at is not None:
+            timeout = max(min(timeout, deadline_at - time.monotonic()), 0.1)
+
+        payload = {"model": model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+        first_byte, first_token, connection = None, None, -1
+        dispatched = requestTrace.now()
+        record['dispatched'] = requestTrace.wall(dispatched)
+        start = time.time()
+        ok = cancelled = False
+        conn = http.client.HTTPConnection(backend.host, backend.port, timeout=timeout)
+        try:
+            conn.connect()
+            connection = conn.sock.getsockname()[1]
+            cancel.on_set(lambda: _abort(conn))
+            conn.request("POST", "/api/generate", body=json.dumps(payload),
+                         headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            first_byte = requestTrace.now()
+            if response.status != 200:
+                result = {"error": f"HTTP {response.status}: {response.read(500).decode(errors='replace')}",
+                          "status": response.status,
+                          "retryable": response.status in RETRYABLE_STATUS}
+            else:
+                text, final = [], None
+                for line in response:
+                    if cancel.is_set():
+                        cancelled = True
+                        break
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if first_token is None:
+                        first_token = requestTrace.now()
+                    chunk = json.loads(line)
+                    if 'error' in chunk:
+                        final = chunk
+                        break
+                    text.append(chunk.get('response', ''))
+                    if chunk.get('done'):
+                        final = chunk
+                        break
+                if cancelled:
+                    result = {"error": "Cancelled", "cancelled": True}
+                elif final is None or 'error' in final:
+                    result = {"error": (final or {}).get('error', "Stream ended before done"), "retryable": True}
+                else:
+                    ok = True
+                    final.pop('context', None)
+                    result = dict(final, response="".join(text), ttft=first_token - dispatched)
+        except (OSError, http.client.HTTPException) as e:
+            if cancel.is_set():
+                cancelled = True
+                result = {"error": "Cancelled", "cancelled": True}
+            else:
+                result = {"error": f"Request failed: {str(e)}", "retryable": True}
+        except ValueError as e:
+            result = {"error": f"Bad response: {str(e)}", "retryable": False}
+        finally:
+            conn.close()
+
+        elapsed = time.time() - start
+        self.admission.release(backend, elapsed, ok, result.get('eval_count'), cancelled)
+        result.update(backend=backend.host, queue_wait=queue_wait, attempt_time=elapsed,
+                      trace=requestTrace.span(dispatched, dispatched, first_byte, requestTrace.now(), connection))
+        return result
+
+    def generate_streamed(self, prompt, model, options=None):
+        """One streamed /api/generate outside any request policy (reports 'ttft')"""
+        result = self.stream_attempt(prompt, model, {}, (), Cancel(), None, options)
+        result['request_time'] = result.pop('attempt_time')
+        return result
+
+    def context_window(self, model):
+        """Trained context length of `model` from /api/show (None if unknown)"""
+        try:
+            backend_url = f"http://{self.pool.hosts[0]}:{self.ollama_port}"
+            info = requests.post(f"{backend_url}/api/show", json={"model": model}, timeout=30).json()
+            return next((v for k, v in info.get('model_info', {}).items() if k.endswith('.context_length')), None)
+        except Exception as e:
+            print(f"Could not read the context window of {model}: {e}")
+            return None
+
+    def running_models(self):
+        """/api/ps of every backend: host -> list of loaded models (size, size_vram, ...)"""
+        running = {}
+        for host in self.pool.hosts:
+            try:
+                response = requests.get(f"http://{host}:{self.ollama_port}/api/ps", timeout=5)
+                running[host] = response.json().get('models', [])
+            except Exception as e:
+                print(f"/api/ps failed on {host}: {e}")
+                running[host] = []
+        return running
+
+    def chat_ollama(self, messages, model, options=None):
+        """Send a message history to /api/chat; returns the reply and its token timings"""
+        try:
+            backend, queue_wait = self.admission.admit()
+        except Rejected as e:
+            return {"error": f"Rejected by admission control ({e.reason})", "rejected": e.reason}
+        url = f"{backend.url}/api/chat"
+        payload = {"model": model, "messages": messages, "stream": False, "options": options or {}}
+        start_time = time.time()
+        try:
+            response = requests.post(url, json=payload, timeout=300)
+            elapsed = time.time() - start_time
+
+            if response.status_code == 200:
+                response_data = response.json()
+                self.admission.release(backend, elapsed, True, response_data.get('eval_count'))
+                return {
+                    "content": response_data.get('message', {}).get('content', ''),
+                    "prompt_tokens": response_data.get('prompt_eval_count', 0),
+                    "output_tokens": response_data.get('eval_count', 0),
+                    "prefill_s": response_data.get('prompt_eval_duration', 0) / 1e9,
+                    "decode_s": response_data.get('eval_duration', 0) / 1e9,
+                    "queue_wait": queue_wait,
+                    "request_time": elapsed,
+                    "start_time": start_time,
+                    "backend": backend.host,
+                }
+            else:
+                self.admission.release(backend, elapsed, False)
+                return {"error": f"HTTP {response.status_code}: {response.text}", "backend": backend.host}
+
+        except Exception as e:
+            print(f"Chat request failed: {e}")
+            self.admission.release(backend, time.time() - start_time, False)
+            return {"error": f"Request failed: {str(e)}", "backend": backend.host}
+
+    def embed_ollama(self, inputs, model):
+        """Embed a batch of inputs with one /api/embed call
+
+        The vectors themselves are dropped: only counts and timings are returned.
+        Batches pass admission control like generations, but do not train its
+        adaptive limits.
+        """
+        try:
+            backend, queue_wait = self.admission.admit()
+        except Rejected as e:
+            return {"error": f"Rejected by admission control ({e.reason})", "rejected": e.reason}
+        url = f"{backend.url}/api/embed"
+        start_time = time.time()
+        try:
+            response = requests.post(url, json={"model": model, "input": inputs}, timeout=300)
+            elapsed = time.time() - start_time
+
+            if response.status_code == 200:
+                response_data = response.json()
+                # Released after the body parsed, so a parse error is released once, below
+                self.admission.release(backend, elapsed, True, adapt=False)
+                embeddings = response_data.get('embeddings', [])
+                return {
+                    "n_vectors": len(embeddings),
+                    "dim": len(embeddings[0]) if embeddings else 0,
+                    "prompt_eval_count": response_data.get('prompt_eval_count', 0),
+                    "total_duration": response_data.get('total_duration', 0),
+                    "queue_wait": queue_wait,
+                    "request_time": elapsed,
+                }
+            else:
+                self.admission.release(backend, elapsed, False, adapt=False)
+                return {"error": f"HTTP {response.status_code}: {response.text}"}
+
+        except Exception as e:
+            print(f"Embed request failed: {e}")
+            self.admission.release(backend, time.time() - start_time, False, adapt=False)
             return {"error": f"Request failed: {str(e)}"}
 
+
+def synthetic_inputs(n, input_words, offset=0):
+    """n distinct texts of input_words words each (distinct so no caching can kick in)"""
+    words = workloads.WORDS
+    return [" ".join([f"doc{offset + i}"] + [words[(offset + i + j) % len(words)] for j in range(input_words - 1)])
+            for i in range(n)]
+
 # Initialize service
 client_service = OllamaClientService()
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "ollama_host": client_service.ollama_host})
+    return jsonify({"status": "healthy", "ollama_host": client_service.ollama_host,
+                    "routing": client_service.pool.policy, "backends": client_service.pool.stats()})
 
 @app.route('/query', methods=['POST'])
 def query():
@@ -95,8 +394,16 @@ def query():
         
         print(f"Querying Ollama: {prompt[:50]}...")
         
-        response = client_service.query_ollama(prompt, model)
+        scheduled = requestTrace.now()
+        client_service.capture.record(scheduled, data.get('client_id', -1), -1, model, prompt, data.get('options'))
+        response = client_service.query_ollama(prompt, model, scheduled=scheduled, deadline=data.get('deadline'),
+                                               options=data.get('options'))
         
+        if 'rejected' in response:
+            headers = {'Retry-After': '1'} if response['status'] == 429 else {}
+            return jsonify(response), response['status'], headers
+        if response.get('deadline_exceeded'):
+            return jsonify(response), 504
         if 'response' in response:
             print(f"Response: {len(response['response'])} chars")
         
@@ -106,6 +413,42 @@ def query():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/admission', methods=['GET', 'POST'])
+def admission():
+    """Admission control stats; POST changes its settings (see admissionControl.py)"""
+    try:
+        if request.method == 'POST':
+            client_service.admission.configure(**(request.get_json() or {}))
+        return jsonify(client_service.admission.stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/policy', methods=['GET', 'POST'])
+def policy():
+    """Request policy stats; POST replaces its settings (see requestPolicy.py)"""
+    try:
+        if request.method == 'POST':
+            client_service.policy.configure(**(request.get_json() or {}))
+            client_service.policy.reset_stats()
+        return jsonify(client_service.policy.stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/cache', methods=['GET', 'POST', 'DELETE'])
+def cache():
+    """Response cache stats; POST changes its settings, DELETE empties it (see responseCache.py)"""
+    try:
+        if request.method == 'POST':
+            client_service.cache.configure(**(request.get_json() or {}))
+        elif request.method == 'DELETE':
+            client_service.cache.clear()
+        return jsonify(client_service.cache.stats())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
 @app.route('/benchmark', methods=['POST'])
 def benchmark():
     """Run benchmark with n_clients doing n_requests each (in parallel)"""
@@ -115,63 +458,396 @@ def benchmark():
         n_requests_per_client = data.get('n_requests_per_client', 5)
         prompt = data.get('prompt', 'Hello, how are you?')
         model = data.get('model', client_service.default_model)
+        routing = data.get('routing', client_service.default_routing)
+        if routing not in POLICIES:
+            return jsonify({"error": f"Unknown routing policy {routing!r} (expected one of {POLICIES})"}), 400
+        client_service.pool.policy = routing
+        client_service.pool.reset_stats()
+        client_service.admission.reset_stats()
+        if 'policy' in data:
+            client_service.policy.configure(**(data['policy'] or {}))
+        client_service.policy.reset_stats()
+        deadline = data.get('deadline')
+        options = data.get('options')
+        # "cache": true / false / {settings} switches the response cache for this and later runs
+        cache_setting = data.get('cache')
+        if isinstance(cache_setting, dict):
+            client_service.cache.configure(**cache_setting)
+        elif cache_setting is not None:
+            client_service.cache.configure(enabled=cache_setting)
+        client_service.cache.reset_stats()
+        # Generated prompts instead of the fixed one (see workloads.py)
+        workload = data.get('workload')
+        if workload and workload.get('type') != 'shared_prefix':
+            return jsonify({"error": f"Unknown workload type {workload.get('type')!r} (expected 'shared_prefix')"}), 400
         
-        print(f"Starting benchmark: {n_clients} clients × {n_requests_per_client} requests")
+        print(f"Starting benchmark: {n_clients} clients × {n_requests_per_client} requests "
+              f"over {len(client_service.pool.hosts)} backend(s), {routing} routing")
         
-        start_time = time.time()
+        capture = data.get('capture')
+        if capture:
+            client_service.capture.start(label=f"benchmark {n_clients}x{n_requests_per_client} {model}")
+        try:
+            start_time = time.time()
         
-        def client_worker(client_id):
-            """Each client does n_requests_per_client sequential requests"""
-            import threading
-            print(f"[Client {client_id}] Starting on thread {threading.current_thread().name}")
-            results = []
-            for i in range(n_requests_per_client):
-                result = client_service.query_ollama(prompt, model)
-                result['client_id'] = client_id
-                result['request_id'] = i
-                results.append(result)
-                print(f"[Client {client_id}] Request {i+1}/{n_requests_per_client} completed in {result.get('request_time', 0):.2f}s")
-            print(f"[Client {client_id}] Finished all {n_requests_per_client} requests")
-            return results
-        
-        # Execute n_clients in parallel (each doing sequential requests)
-        all_results = []
-        futures = []
-        for client_id in range(n_clients):
-            future = executor.submit(client_worker, client_id)
-            futures.append(future)
-        
-        # Collect all results
-        for future in futures:
-            client_results = future.result(timeout=600)
-            all_results.extend(client_results)
+            def client_worker(client_id, submitted):
+                """Each client does n_requests_per_client sequential requests"""
+                import threading
+                print(f"[Client {client_id}] Starting on thread {threading.current_thread().name}")
+                results = []
+                for i in range(n_requests_per_client):
+                    # The first request was due when the client was submitted: waiting
+                    # for a free pool thread is recorded as queueing
+                    scheduled = submitted if i == 0 else requestTrace.now()
+                    request_prompt, prefix_id, ordering = prompt, None, None
+                    if workload:
+                        request_prompt, prefix_id, ordering = workloads.shared_prefix_prompt(workload, client_id, i)
+                    client_service.capture.record(scheduled, client_id, i, model, request_prompt, options)
+                    with profiled():
+                        result = client_service.query_ollama(request_prompt, model, scheduled=scheduled, deadline=deadline,
+                                                             options=options)
+                    result['client_id'] = client_id
+                    result['request_id'] = i
+                    if workload:
+                        result['prefix_id'] = prefix_id
+                        result['ordering'] = ordering
+                    results.append(result)
+                    print(f"[Client {client_id}] Request {i+1}/{n_requests_per_client} completed in {result.get('request_time', 0):.2f}s")
+                print(f"[Client {client_id}] Finished all {n_requests_per_client} requests")
+                return results
         
-        total_time = time.time() - start_time
+            # Execute n_clients in parallel (each doing sequential requests)
+            all_results = []
+            futures = []
+            for client_id in range(n_clients):
+                future = executor.submit(client_worker, client_id, requestTrace.now())
+                futures.append(future)
+        
+            # Collect all results
+            for future in futures:
+                client_results = future.result(timeout=600)
+                all_results.extend(client_results)
+        
+            total_time = time.time() - start_time
+        finally:
+            # A failed run must not leave the capture recording later /query traffic
+            capture_summary = client_service.capture.stop() if capture else None
         
         # Calculate stats
         total_queries = n_clients * n_requests_per_client
         successful = sum(1 for r in all_results if 'error' not in r)
         failed = total_queries - successful
-        avg_request_time = sum(r.get('request_time', 0) for r in all_results if 'error' not in r) / successful if successful > 0 else 0
+        latencies = [r.get('request_time', 0) for r in all_results if 'error' not in r]
+        avg_request_time = sum(latencies) / successful if successful > 0 else 0
         
-        return jsonify({
+        response = {
             "n_clients": n_clients,
             "n_requests_per_client": n_requests_per_client,
             "total_queries": total_queries,
             "successful": successful,
             "failed": failed,
+            "rejected": sum(1 for r in all_results if 'rejected' in r),
             "total_time": total_time,
             "avg_request_time": avg_request_time,
+            "latency": latency_summary(latencies),
             "queries_per_second": total_queries / total_time if total_time > 0 else 0,
+            "routing": routing,
+            "backends": client_service.pool.stats(),
+            "admission": client_service.admission.stats(),
+            "policy": client_service.policy.stats(),
+            "cache": client_service.cache.stats(),
             "results": all_results
-        })
+        }
+        if workload:
+            response["workload"] = workload
+            response["prefix_cache"] = workloads.prefix_cache_summary(all_results)
+        if capture_summary:
+            response["capture"] = capture_summary
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/capture', methods=['GET', 'POST'])
+def capture():
+    """Traffic capture state; POST {"action": "start" | "stop", "label": ...} (see trafficCapture.py)"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            action = data.get('action')
+            if action == 'start':
+                client_service.capture.start(data.get('label'))
+            elif action == 'stop':
+                if client_service.capture.stop() is None:
+                    return jsonify({"error": "no capture running"}), 409
+            else:
+                return jsonify({"error": f"unknown action {action!r} (start, stop)"}), 400
+        return jsonify(client_service.capture.status())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/replay', methods=['POST'])
+def replay():
+    """Replay a captured trace with its original timing and order (see trafficCapture.py)"""
+    try:
+        data = request.get_json()
+        try:
+            capture = trafficCapture.load_capture(data['capture'])
+        except (OSError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        speed = float(data.get('speed', 1.0))
+        model_override = data.get('model')
+        columns = capture['columns']
+        client_service.pool.reset_stats()
+        client_service.admission.reset_stats()
+        client_service.policy.reset_stats()
+        client_service.cache.reset_stats()
+
+        def send(i, scheduled):
+            model = model_override or capture['models'][columns['model'][i]]
+            result = client_service.query_ollama(capture['prompts'][columns['prompt'][i]], model,
+                                                 scheduled=scheduled,
+                                                 options=capture['options'][columns['options'][i]] or None)
+            result['client_id'] = columns['client'][i]
+            result['request_id'] = columns['request'][i]
+            result['replay_index'] = i
+            return result
+
+        print(f"Replaying {len(capture['t'])} requests from {capture['path']} at {speed}x speed")
+        start_time = time.time()
+        all_results, timing = trafficCapture.replay(capture, send, speed=speed,
+                                                    max_workers=int(data.get('max_workers', 256)),
+                                                    limit=data.get('limit'))
+        total_time = time.time() - start_time
+        late = timing['start_lateness']
+        print(f"✓ Replay done: {timing['achieved_rate'] or 0:.1f} req/s (target {timing['target_rate'] or 0:.1f}), "
+              f"start lateness p50 {late['p50'] * 1e3:.2f} ms, p99 {late['p99'] * 1e3:.2f} ms")
+
+        successful = sum(1 for r in all_results if 'error' not in r)
+        latencies = [r.get('request_time', 0) for r in all_results if 'error' not in r]
+        return jsonify({
+            "capture": os.path.basename(capture['path']),
+            "capture_label": capture.get('label'),
+            "total_queries": len(all_results),
+            "successful": successful,
+            "failed": len(all_results) - successful,
+            "rejected": sum(1 for r in all_results if 'rejected' in r),
+            "total_time": total_time,
+            "avg_request_time": sum(latencies) / successful if successful else 0,
+            "latency": latency_summary(latencies),
+            "queries_per_second": len(all_results) / total_time if total_time > 0 else 0,
+            "replay": timing,
+            "backends": client_service.pool.stats(),
+            "admission": client_service.admission.stats(),
+            "policy": client_service.policy.stats(),
+            "cache": client_service.cache.stats(),
+            "results": all_results,
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/embed-benchmark', methods=['POST'])
+def embed_benchmark():
+    """Sweep /api/embed batch sizes: n_clients parallel clients send n_batches batches each"""
+    try:
+        data = request.get_json()
+        model = data.get('model', 'nomic-embed-text')
+        batch_sizes = data.get('batch_sizes', [1, 8, 32, 128])
+        input_words = data.get('input_words', 128)
+        n_clients = data.get('n_clients', 1)
+        n_batches = data.get('n_batches', 10)
+
+        print(f"Starting embedding benchmark: batch sizes {batch_sizes}, {n_clients} clients × {n_batches} batches")
+        client_service.pool.reset_stats()
+        client_service.admission.reset_stats()
+
+        sweep = []
+        for batch_size in batch_sizes:
+            def client_worker(client_id):
+                results = []
+                for i in range(n_batches):
+                    offset = (client_id * n_batches + i) * batch_size
+                    with profiled():
+                        results.append(client_service.embed_ollama(synthetic_inputs(batch_size, input_words, offset), model))
+                return results
+
+            start_time = time.time()
+            futures = [executor.submit(client_worker, client_id) for client_id in range(n_clients)]
+            all_results = [r for future in futures for r in future.result(timeout=1200)]
+            total_time = time.time() - start_time
+
+            ok = [r for r in all_results if 'error' not in r]
+            vectors = sum(r['n_vectors'] for r in ok)
+            tokens = sum(r['prompt_eval_count'] for r in ok)
+            point = {
+                "batch_size": batch_size,
+                "batches": len(all_results),
+                "failed": len(all_results) - len(ok),
+                "rejected": sum(1 for r in all_results if 'rejected' in r),
+                "total_time": total_time,
+                "vectors": vectors,
+                "tokens": tokens,
+                "dim": ok[0]['dim'] if ok else 0,
+                "vectors_per_second": vectors / total_time if total_time > 0 else 0,
+                "tokens_per_second": tokens / total_time if total_time > 0 else 0,
+                "batch_latency": latency_summary([r['request_time'] for r in ok]),
+            }
+            print(f"  batch={batch_size}: {point['vectors_per_second']:.1f} vectors/s, "
+                  f"{point['tokens_per_second']:.0f} tokens/s, p50 {point['batch_latency']['p50']:.3f}s")
+            sweep.append(point)
+
+        return jsonify({
+            "model": model,
+            "input_words": input_words,
+            "n_clients": n_clients,
+            "n_batches": n_batches,
+            "sweep": sweep,
+            "backends": client_service.pool.stats(),
+            "admission": client_service.admission.stats(),
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/chat-benchmark', methods=['POST'])
+def chat_benchmark():
+    """n_clients parallel chat sessions of n_turns turns each (see workloads.py)"""
+    try:
+        data = request.get_json()
+        model = data.get('model', client_service.default_model)
+        n_clients = data.get('n_clients', 1)
+        n_turns = data.get('n_turns', 8)
+        user_words = data.get('user_words', 64)
+        reply_tokens = data.get('reply_tokens', 128)
+        num_ctx = data.get('num_ctx')
+
+        print(f"Starting chat benchmark: {n_clients} sessions × {n_turns} turns "
+              f"({user_words} words in, {reply_tokens} tokens out, num_ctx={num_ctx or 'default'})")
+        client_service.pool.reset_stats()
+
+        def session(client_id):
+            with profiled():
+                return workloads.run_chat_session(client_service.chat_ollama, client_id, model, n_turns,
+                                                  user_words, reply_tokens, num_ctx)
+
+        start_time = time.time()
+        futures = [executor.submit(session, client_id) for client_id in range(n_clients)]
+        all_results = [r for future in futures for r in future.result(timeout=3600)]
+        total_time = time.time() - start_time
+
+        turns = workloads.per_turn_summary(all_results, n_turns, num_ctx)
+        for t in turns:
+            print(f"  turn {t['turn'] + 1}: ~{t['context_tokens']:.0f} context tokens, "
+                  f"p50 {t['latency']['p50']:.2f}s, prefill {t['prefill_tps']:.0f} tokens/s")
+
+        return jsonify({
+            "model": model,
+            "n_clients": n_clients,
+            "n_turns": n_turns,
+            "user_words": user_words,
+            "reply_tokens": reply_tokens,
+            "num_ctx": num_ctx,
+            "total_time": total_time,
+            "sessions_completed": sum(1 for r in all_results if r['turn'] == n_turns - 1 and 'error' not in r),
+            "turns": turns,
+            "backends": client_service.pool.stats(),
+            "results": all_results,
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/prefill-sweep', methods=['POST'])
+def prefill_sweep():
+    """Long-context sweep: prompt length x client count, num_ctx sized per length (see workloads.py)"""
+    try:
+        data = request.get_json()
+        model = data.get('model', client_service.default_model)
+        lengths = sorted(data.get('lengths', [512, 1024, 2048, 4096, 8192]))
+        clients = sorted(data.get('clients', [1, 2, 4, 8]))
+        n_requests = data.get('n_requests', 2)
+        reply_tokens = data.get('reply_tokens', 16)
+        gpu_memory_gb = data.get('gpu_memory_gb')
+
+        window = client_service.context_window(model)
+        skipped = [length for length in lengths if window and length + reply_tokens > window]
+        lengths = [length for length in lengths if length not in skipped]
+        if skipped:
+            print(f"Skipping lengths {skipped}: past the {window}-token context window of {model}")
+            # ... but still go up to the window itself
+            longest = window - reply_tokens - 64
+            if not lengths or longest > lengths[-1]:
+                lengths.append(longest)
+
+        # Prompt tokens = overhead + slope x words, from two probes at the default num_ctx
+        probes = [client_service.generate_streamed(workloads.document_prompt(f"probe-{n}", n), model,
+                                                   {"num_predict": 1})
+                  for n in (100, 300)]
+        if any('error' in probe for probe in probes):
+            return jsonify({"error": f"Calibration failed: {[p.get('error') for p in probes]}"}), 500
+        slope = (probes[1]['prompt_eval_count'] - probes[0]['prompt_eval_count']) / 200
+        overhead = probes[0]['prompt_eval_count'] - 100 * slope
+        print(f"Starting prefill sweep: lengths {lengths} × clients {clients}, "
+              f"{slope:.2f} tokens/word + {overhead:.0f} tokens of template")
+        client_service.pool.reset_stats()
+
+        points = []
+        for length in lengths:
+            num_ctx = workloads.context_for(length, reply_tokens)
+            options = {"num_ctx": num_ctx, "num_predict": reply_tokens}
+            n_words = workloads.words_for(length - overhead, slope)
+            # A new num_ctx reloads the model: keep that out of the timed requests
+            warmup = client_service.generate_streamed(workloads.document_prompt(f"warmup-{length}", n_words),
+                                                      model, options)
+            memory = workloads.model_memory(client_service.running_models(), model)
+            if gpu_memory_gb and memory['vram_gb'] is not None:
+                memory['headroom_gb'] = gpu_memory_gb - memory['vram_gb']
+            memory['load_s'] = warmup.get('load_duration', 0) / 1e9
+
+            for n_clients in clients:
+                def client_worker(client_id):
+                    results = []
+                    for i in range(n_requests):
+                        prompt = workloads.document_prompt(f"{length}-{n_clients}-{client_id}-{i}", n_words)
+                        with profiled():
+                            results.append(client_service.generate_streamed(prompt, model, options))
+                    return results
+
+                start_time = time.time()
+                futures = [executor.submit(client_worker, client_id) for client_id in range(n_clients)]
+                all_results = [r for future in futures for r in future.result(timeout=3600)]
+                point = workloads.sweep_point(all_results, length, n_clients, num_ctx, time.time() - start_time)
+                point.update(memory)
+                print(f"  length={length} clients={n_clients}: TTFT p50 {point['ttft']['p50']:.2f}s, "
+                      f"prefill {point['prefill_tps']:.0f} tokens/s per request, "
+                      f"{point['aggregate_prefill_tps']:.0f} in total, VRAM {memory['vram_gb'] or 0:.1f} GB")
+                points.append(point)
+
+        return jsonify({
+            "model": model,
+            "context_window": window,
+            "lengths": lengths,
+            "skipped_lengths": skipped,
+            "clients": clients,
+            "n_requests": n_requests,
+            "reply_tokens": reply_tokens,
+            "tokens_per_word": slope,
+            "points": points,
+            "surface": {metric: workloads.surface(points, lengths, clients, metric)
+                        for metric in ('ttft.p50', 'ttft.p95', 'latency.p95', 'prefill_tps',
+                                       'aggregate_prefill_tps')},
+            "backends": client_service.pool.stats(),
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     print("Starting Ollama Client Service...")
-    print(f"Ollama server: {client_service.ollama_host}:{client_service.ollama_port}")
+    print(f"Ollama servers: {client_service.pool.hosts} (port {client_service.ollama_port})")
     
     # Check available CPUs
     import multiprocessing
@@ -1,6 +1,38 @@
 import json
+import shlex
 import subprocess
 import os
+import hashlib
+
+
+def _def_sources(def_path, build_dir):
+    """List the host-side source files copied by the %files section of a .def"""
+    sources = []
+    in_files = False
+    with open(def_path, 'r') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith('%'):
+                in_files = stripped == '%files'
+                continue
+            if in_files and stripped and not stripped.startswith('#'):
+                sources.append(os.path.join(build_dir, stripped.split()[0]))
+    return sources
+
+
+def image_build_hash(def_path, build_dir):
+    """Content hash of a container definition and every file it copies in
+
+    The hash keys the built SIF, so the image is rebuilt exactly when the
+    definition or one of its sources changes.
+    """
+    digest = hashlib.sha256()
+    for path in [def_path] + sorted(_def_sources(def_path, build_dir)):
+        digest.update(os.path.relpath(path, build_dir).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
 
 def setup_client_service(data):
     """Setup containerized client service on SLURM"""
@@ -26,6 +58,19 @@ def setup_client_service(data):
     
     # We need 1 CPU per client (each client makes requests sequentially)
     cpus_needed = n_clients
+
+    # Routing across Ollama replicas (see backendPool.py)
+    routing = service.get('routing', 'least_outstanding')
+    # Admission control in front of the backends (see admissionControl.py); off by default
+    admission = service.get('admission', {})
+    # Deadlines, retries and hedging for /query traffic (see requestPolicy.py); off by default
+    request_policy = service.get('request_policy', {})
+    # Response cache for deterministic requests (see responseCache.py); off by default
+    cache = service.get('cache', {})
+
+    # Content-addressed image: rebuilt only when client_service.def or its sources change
+    build_hash = image_build_hash(os.path.join(backend_dir, 'client', 'client_service.def'), backend_dir)
+    client_sif = f"output/containers/client_service_{build_hash}.sif"
     
     job_script = f"""#!/bin/bash -l
 #SBATCH --job-name=ollama_client
@@ -93,9 +138,13 @@ echo "✓ Node Exporter started (PID: $NODE_EXPORTER_PID) on port 9100"
 # ========================================
 # BUILD AND START CLIENT SERVICE
 # ========================================
-if [ ! -f "output/containers/client_service.sif" ]; then
-    echo "Building client service container..."
-    apptainer build output/containers/client_service.sif client/client_service.def
+if [ ! -f "{client_sif}" ]; then
+    echo "Building client service container ({build_hash})..."
+    mkdir -p output/containers
+    apptainer build "{client_sif}.tmp_${{JOB_ID}}" client/client_service.def && \\
+      mv "{client_sif}.tmp_${{JOB_ID}}" "{client_sif}"
+else
+    echo "✓ Reusing cached client service container ({build_hash})"
 fi
 
 echo ""
@@ -113,13 +162,35 @@ echo ""
 export OMP_NUM_THREADS={cpus_needed}
 export SLURM_CPUS_ON_NODE={cpus_needed}
 
-apptainer exec --bind {backend_dir}/output:/app/output:ro output/containers/client_service.sif python /app/clientService.py
+# Token for the /debug profiling endpoints (localhost needs none)
+DEBUG_TOKEN=$(head -c 16 /dev/urandom | od -An -tx1 | tr -d ' \\n')
+(umask 077 && echo "$DEBUG_TOKEN" > output/client_debug_token_${{JOB_ID}}.txt)
+
+# Writable data directory: profiles from the /debug endpoints land here
+mkdir -p output/client_data
+
+# JSON holds commas, which --env would split on
+export APPTAINERENV_CLIENT_REQUEST_POLICY={shlex.quote(json.dumps(request_policy))}
+
+apptainer exec --bind {backend_dir}/output:/app/output:ro \\
+    --bind {backend_dir}/output/client_data:/app/data \\
+    --env CLIENT_DEBUG_TOKEN=$DEBUG_TOKEN \\
+    --env CLIENT_ROUTING={routing} \\
+    --env CLIENT_MAX_INFLIGHT={admission.get('max_in_flight', 0)} \\
+    --env CLIENT_MAX_QUEUE={admission.get('max_queue', 64)} \\
+    --env CLIENT_QUEUE_TIMEOUT={admission.get('queue_timeout', 30)} \\
+    --env CLIENT_ADAPTIVE={1 if admission.get('adaptive') else 0} \\
+    --env CLIENT_CACHE={1 if cache.get('enabled') else 0} \\
+    --env CLIENT_CACHE_MB={cache.get('max_mb', 64)} \\
+    --env CLIENT_CACHE_TTL={cache.get('ttl', 300)} \\
+    {client_sif} python /app/clientService.py
 """
 
     
     # Debug logging
     print("Setting up client service...")
     print(f"Using infrastructure: partition={partition}, account={account}, mem={mem_gb}GB")
+    print(f"Client image: {client_sif}")
     print(f"Resource allocation: 1 task, {cpus_needed} CPUs ({n_clients} clients, each doing {n_requests_per_client} sequential requests)")
     
     # Ensure output directories exist
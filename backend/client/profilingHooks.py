@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling of the client service while it runs.
+
+A Flask blueprint with /debug endpoints, allowed from localhost or with the
+job's debug token (X-Debug-Token header; the SLURM script generates one per
+job, passes it in as CLIENT_DEBUG_TOKEN and saves it to
+output/client_debug_token_<jobid>.txt):
+
+- POST /debug/profile      {"mode": "sample" | "cprofile", "seconds": 30,
+                            "interval": 0.005}
+                           starts a profiling window in the background
+- GET  /debug/profile      state of the current / last window
+- POST /debug/tracemalloc  {"seconds": 30, "top": 25}: allocations made
+                           during the window, top allocators by line
+- GET  /debug/threads      stack of every thread right now
+
+Results are written to CLIENT_DATA_DIR/profiles (/app/data/profiles,
+bound to output/client_data/profiles on the host):
+
+- sample_<ts>.folded     flame-graph-ready folded stacks of all threads
+                         (flamegraph.pl, speedscope, inferno)
+- cprofile_<ts>.pstats   cProfile stats of the benchmark request paths
+                         (pstats / snakeviz), plus a text top list
+- tracemalloc_<ts>.txt   top allocators by line
+- threads_<ts>.txt       thread dump
+
+cProfile only sees the thread that enables it, so it covers code run inside
+`profiled()` blocks (the benchmark workers wrap each request in one). The
+sampling profiler reads sys._current_frames() and covers every thread. When
+no window is open, `profiled()` costs a single attribute check.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Blueprint, jsonify, request
+
+debug = Blueprint('debug', __name__, url_prefix='/debug')
+
+DATA_DIR = os.getenv('CLIENT_DATA_DIR', '/app/data')
+DEBUG_TOKEN = os.getenv('CLIENT_DEBUG_TOKEN', '')
+MAX_SECONDS = 600
+
+
+class _Window:
+    """State of the profiling window (only one at a time)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mode = None
+        self.started = None
+        self.ends = None
+        self.last = None
+        self.stats = None
+        self.cprofile_active = False
+
+
+window = _Window()
+
+
+def _profile_dir():
+    path = os.path.join(DATA_DIR, 'profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _out_path(kind, ext):
+    return os.path.join(_profile_dir(), f"{kind}_{time.strftime('%Y%m%d_%H%M%S')}.{ext}")
+
+
+@debug.before_request
+def _authorize():
+    if request.remote_addr in ('127.0.0.1', '::1'):
+        return None
+    token = request.headers.get('X-Debug-Token', '')
+    if DEBUG_TOKEN and hmac.compare_digest(token, DEBUG_TOKEN):
+        return None
+    return jsonify({"error": "debug endpoints need localhost or a valid X-Debug-Token"}), 403
+
+
+# ---- sampling profiler ----
+
+def _frame_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return stack[::-1]
+
+
+def _sample(seconds, interval):
+    """Sample the stacks of all other threads every `interval` s; write folded stacks"""
+    me = threading.get_ident()
+    names = {}
+    folded = Counter()
+    n_samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if len(names) != threading.active_count():
+            names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            folded[";".join([names.get(ident, str(ident))] + _frame_stack(frame))] += 1
+        n_samples += 1
+        time.sleep(interval)
+
+    path = _out_path('sample', 'folded')
+    with open(path, 'w') as f:
+        for stack, count in folded.most_common():
+            f.write(f"{stack} {count}\n")
+    return {"path": path, "samples": n_samples, "stacks": len(folded)}
+
+
+# ---- cProfile over profiled() blocks ----
+
+@contextmanager
+def profiled():
+    """Run the block under cProfile while a cprofile window is open"""
+    if not window.cprofile_active:
+        yield
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python >= 3.12: one cProfile at a time across threads
+        profile = None
+    if profile is None:
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        with window.lock:
+            if window.stats is None:
+                window.stats = pstats.Stats(profile)
+            else:
+                window.stats.add(profile)
+
+
+def _cprofile(seconds, top=40):
+    window.stats = None
+    window.cprofile_active = True
+    time.sleep(seconds)
+    window.cprofile_active = False
+    # Blocks still running finish into window.stats; give them a moment
+    time.sleep(0.5)
+    with window.lock:
+        stats, window.stats = window.stats, None
+    if stats is None:
+        return {"path": None, "note": "no profiled() block ran during the window"}
+
+    path = _out_path('cprofile', 'pstats')
+    stats.dump_stats(path)
+    text = io.StringIO()
+    stats.stream = text
+    stats.sort_stats('cumulative').print_stats(top)
+    with open(path.replace('.pstats', '.txt'), 'w') as f:
+        f.write(text.getvalue())
+    return {"path": path, "calls": stats.total_calls}
+
+
+# ---- tracemalloc ----
+
+def _tracemalloc(seconds, top=25):
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(10)
+    before = tracemalloc.take_snapshot()
+    time.sleep(seconds)
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    if not was_tracing:
+        tracemalloc.stop()
+
+    diff = after.compare_to(before, 'lineno')
+    path = _out_path('tracemalloc', 'txt')
+    with open(path, 'w') as f:
+        f.write(f"# {seconds}s window, traced now {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n")
+        for stat in diff[:top]:
+            f.write(f"{stat}\n")
+        f.write("\n# Largest live allocations (traceback)\n")
+        for stat in after.statistics('traceback')[:5]:
+            f.write(f"{stat.size / 1e3:.1f} kB in {stat.count} blocks\n")
+            f.write("\n".join(stat.traceback.format()) + "\n\n")
+    return {"path": path, "top": [str(s) for s in diff[:top]],
+            "traced_mb": current / 1e6, "peak_mb": peak / 1e6}
+
+
+def _run_window(mode, target, *args):
+    try:
+        result = target(*args)
+    except Exception as e:
+        result = {"error": str(e)}
+    with window.lock:
+        window.last = {"mode": mode, "started": window.started, "finished": time.time(), **result}
+        window.mode = None
+    print(f"✓ {mode} profile window finished: {result.get('path') or result}")
+
+
+def _start(mode, target, seconds, *args):
+    with window.lock:
+        if window.mode is not None:
+            return jsonify({"error": f"a {window.mode} window is already running until {window.ends:.0f}"}), 409
+        window.mode, window.started, window.ends = mode, time.time(), time.time() + seconds
+    threading.Thread(target=_run_window, args=(mode, target, seconds) + args,
+                     name=f"debug-{mode}", daemon=True).start()
+    print(f"Started {mode} profile window ({seconds}s)")
+    return jsonify({"mode": mode, "seconds": seconds, "ends": window.ends}), 202
+
+
+def _seconds(data):
+    return min(max(float(data.get('seconds', 30)), 0.1), MAX_SECONDS)
+
+
+@debug.route('/profile', methods=['POST'])
+def start_profile():
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode', 'sample')
+    seconds = _seconds(data)
+    if mode == 'sample':
+        interval = min(max(float(data.get('interval', 0.005)), 0.001), 1.0)
+        return _start('sample', _sample, seconds, interval)
+    if mode == 'cprofile':
+        return _start('cprofile', _cprofile, seconds, int(data.get('top', 40)))
+    return jsonify({"error": f"unknown mode {mode!r} (sample, cprofile)"}), 400
+
+
+@debug.route('/profile', methods=['GET'])
+def profile_state():
+    with window.lock:
+        return jsonify({"running": window.mode, "ends": window.ends if window.mode else None,
+                        "last": window.last})
+
+
+@debug.route('/tracemalloc', methods=['POST'])
+def start_tracemalloc():
+    data = request.get_json(silent=True) or {}
+    return _start('tracemalloc', _tracemalloc, _seconds(data), int(data.get('top', 25)))
+
+
+@debug.route('/threads', methods=['GET'])
+def thread_dump():
+    names = {t.ident: t for t in threading.enumerate()}
+    lines = []
+    for ident, frame in sys._current_frames().items():
+        thread = names.get(ident)
+        label = f"{thread.name} (daemon={thread.daemon})" if thread else str(ident)
+        lines.append(f"--- {label} ident={ident}")
+        lines.extend(line.rstrip() for line in traceback.format_stack(frame))
+        lines.append("")
+    text = "\n".join(lines)
+    path = _out_path('threads', 'txt')
+    with open(path, 'w') as f:
+        f.write(text)
+    return jsonify({"path": path, "threads": len(names), "dump": text})
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Deadlines, retries and hedging for latency-sensitive requests.
+
+A RequestPolicy runs one logical request as one or more attempts:
+
+- deadline      time budget in seconds for the whole request; attempts
+                still running when it expires are cancelled
+- retries       after a retryable failure (connection error, timeout,
+                HTTP 429/500/502/503/504) a new attempt is made after a
+                full-jitter exponential backoff, uniform in
+                [0, min(backoff_max, backoff x 2^n)], unless the sleep would
+                overrun the deadline
+- hedging       if the request is still running after the p<hedge_quantile>
+                latency of recent attempts (or a fixed hedge_delay), a
+                duplicate is sent, preferably to another backend. The first
+                success wins and the other attempts are cancelled: the policy
+                thread closes their connections at once, also while they
+                still wait for response headers, which stops the generation
+                in Ollama
+
+The attempt itself is supplied by the caller: attempt(record, exclude,
+cancel, deadline_at) -> result dict, where `record` is the attempt's log
+entry (the callee sets 'backend'), `exclude` the backends already in use,
+`cancel` a Cancel to stop at (the callee registers how to abort its blocking
+call with cancel.on_set()) and `deadline_at` a time.monotonic() value. A
+result with 'error' fails the attempt; 'retryable' says whether a retry may
+help.
+
+Every result carries 'policy': its attempts (kind, backend, start offset,
+latency, outcome), the index and kind of the winning attempt, and the
+retries and hedges sent. stats() sums these over requests: the extra load
+(attempts per request - 1) is what hedging costs, the p99 latency of the
+same workload with and without the policy is what it buys.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from benchStats import percentile
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# Attempts run here, so the calling thread can wait on several at once
+attempt_executor = ThreadPoolExecutor(max_workers=128, thread_name_prefix="attempt")
+
+
+class Cancel(threading.Event):
+    """An Event whose on_set() callbacks run in the thread that sets it"""
+
+    def __init__(self):
+        super().__init__()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def on_set(self, callback):
+        """Run callback() when the event is set (at once if it already is)"""
+        with self._callbacks_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def set(self):
+        with self._callbacks_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class LatencyTracker:
+    """Rolling window of successful attempt latencies for the hedge delay"""
+
+    def __init__(self, window=1000, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def add(self, latency):
+        with self.lock:
+            self.samples.append(latency)
+
+    def quantile(self, q):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            return percentile(list(self.samples), q)
+
+
+class RequestPolicy:
+    DEFAULTS = {'deadline': None, 'max_retries': 0, 'backoff': 0.5, 'backoff_max': 8.0,
+                'hedge': False, 'hedge_quantile': 95.0, 'hedge_delay': None, 'max_hedges': 1}
+
+    def __init__(self, **settings):
+        self.tracker = LatencyTracker()
+        self.lock = threading.Lock()
+        self.configure(**settings)
+        self.reset_stats()
+
+    def configure(self, **settings):
+        """Replace the settings (missing keys fall back to DEFAULTS); the latency window is kept"""
+        unknown = set(settings) - set(self.DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown request policy settings {sorted(unknown)} (expected {list(self.DEFAULTS)})")
+        with self.lock:
+            for key, default in self.DEFAULTS.items():
+                setattr(self, key, settings.get(key, default))
+
+    @property
+    def enabled(self):
+        return bool(self.deadline or self.max_retries or self.hedge)
+
+    def reset_stats(self):
+        with self.lock:
+            self.counts = {'requests': 0, 'succeeded': 0, 'attempts': 0, 'retries': 0, 'hedges': 0,
+                           'hedges_won': 0, 'cancelled': 0, 'deadline_exceeded': 0}
+
+    def current_hedge_delay(self):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        return self.tracker.quantile(self.hedge_quantile)
+
+    def _backoff(self, retry):
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** retry))
+
+    def execute(self, attempt, deadline=None):
+        """Run one request under the policy; returns the winning (or last failed) result
+
+        `deadline` (seconds) overrides the policy's own for this request.
+        """
+        deadline = deadline or self.deadline
+        start = time.monotonic()
+        deadline_at = start + deadline if deadline else None
+        attempts, running, cancels = [], {}, {}
+        winner, last = None, None
+        retries = hedges = 0
+
+        def launch(kind):
+            record = {'attempt': len(attempts), 'kind': kind, 'backend': None,
+                      'offset': time.monotonic() - start}
+            attempts.append(record)
+            exclude = {r['backend'] for r in attempts if r['backend']}
+            cancel = Cancel()
+            future = attempt_executor.submit(attempt, record, exclude, cancel, deadline_at)
+            running[future] = record
+            cancels[future] = cancel
+
+        def next_hedge_at():
+            delay = self.current_hedge_delay() if self.hedge and hedges < self.max_hedges else None
+            return time.monotonic() + delay if delay is not None else None
+
+        launch('primary')
+        hedge_at = next_hedge_at()
+        while running:
+            now = time.monotonic()
+            timeouts = [t - now for t in (hedge_at, deadline_at) if t is not None]
+            done, _ = wait(list(running), timeout=max(min(timeouts), 0) if timeouts else None,
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                record = running.pop(future)
+                cancels.pop(future)
+                result = future.result()
+                record['latency'] = time.monotonic() - start - record['offset']
+                if 'error' in result:
+                    record['outcome'] = f"error: {result['error']}"[:200]
+                    last = result
+                elif winner is None:
+                    record['outcome'] = 'won'
+                    winner = (record, result)
+                    self.tracker.add(record['latency'])
+            if winner is not None:
+                break
+
+            now = time.monotonic()
+            if deadline_at is not None and now >= deadline_at:
+                last = {"error": f"Deadline of {deadline}s exceeded", "deadline_exceeded": True}
+                break
+            if not running:
+                if last is None or not last.get('retryable') or retries >= self.max_retries:
+                    break
+                sleep = self._backoff(retries)
+                if deadline_at is not None and now + sleep >= deadline_at:
+                    break
+                time.sleep(sleep)
+                retries += 1
+                launch('retry')
+                hedge_at = next_hedge_at()
+            elif hedge_at is not None and now >= hedge_at:
+                hedges += 1
+                launch('hedge')
+                hedge_at = next_hedge_at()
+
+        # Losers and stragglers: stop them, they release their backends when they notice
+        for future, record in running.items():
+            cancels[future].set()
+            record['outcome'] = 'cancelled'
+
+        record, result = winner if winner is not None else (None, dict(last or {"error": "No attempt made"}))
+        result['policy'] = {
+            'attempts': attempts,
+            'winner': record['attempt'] if record else None,
+            'winning_kind': record['kind'] if record else None,
+            'retries': retries,
+            'hedges': hedges,
+        }
+        with self.lock:
+            c = self.counts
+            c['requests'] += 1
+            c['succeeded'] += record is not None
+            c['attempts'] += len(attempts)
+            c['retries'] += retries
+            c['hedges'] += hedges
+            c['hedges_won'] += record is not None and record['kind'] == 'hedge'
+            c['cancelled'] += len(running)
+            c['deadline_exceeded'] += bool(result.get('deadline_exceeded'))
+        return result
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counts)
+        c['extra_load'] = c['attempts'] / c['requests'] - 1 if c['requests'] else 0.0
+        c['hedge_delay'] = self.current_hedge_delay() if self.hedge else None
+        c['enabled'] = self.enabled
+        c['config'] = {key: getattr(self, key) for key in self.DEFAULTS}
+        return c
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Response cache for deterministic /query and benchmark requests.
+
+Identical prompts (health probes, templated summaries) need not reach the
+GPU twice. When enabled, the client service keeps responses keyed on
+model, prompt and generation options, for the requests whose output is
+reproducible: options.temperature == 0 or a fixed options.seed. Anything
+else bypasses the cache.
+
+- size-aware LRU   entries are weighed by their serialized size; the least
+                   recently used ones go until the cache fits max_mb again
+                   (a response larger than the whole cache is not stored)
+- TTL              entries older than `ttl` seconds are dropped on lookup
+- single flight    concurrent misses on the same key wait for the first
+                   one's upstream call instead of sending their own
+                   ("coalesced"); failed responses are passed to the waiters
+                   but not stored
+
+Each result carries 'cache': bypass | miss | hit | coalesced. stats()
+reports the counts, hit rate, entries, bytes and evictions by reason.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+STATUSES = ('bypass', 'miss', 'hit', 'coalesced')
+
+# Per-request fields recomputed on every answer, not stored
+VOLATILE = ('request_time', 'start_time', 'trace', 'queue_wait', 'policy', 'cache')
+
+
+def cacheable(options):
+    """Whether a request with these generation options has a reproducible output"""
+    options = options or {}
+    return options.get('temperature') == 0 or options.get('seed') is not None
+
+
+def cache_key(model, prompt, options):
+    blob = json.dumps([model, prompt, options or {}], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """An upstream call in progress that identical requests wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class ResponseCache:
+    def __init__(self, enabled=False, max_mb=64.0, ttl=300.0, wait_timeout=300.0):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.flights = {}
+        self.bytes = 0
+        self.configure(enabled=enabled, max_mb=max_mb, ttl=ttl, wait_timeout=wait_timeout)
+        self.reset_stats()
+
+    def configure(self, **settings):
+        """Change settings at runtime; shrinking max_mb evicts at once"""
+        with self.lock:
+            for key in ('max_mb', 'ttl', 'wait_timeout'):
+                if key in settings:
+                    setattr(self, key, float(settings[key]))
+            if 'enabled' in settings:
+                self.on = bool(settings['enabled'])
+            self.max_bytes = int(self.max_mb * 1e6)
+            self._evict_to(self.max_bytes)
+
+    @property
+    def enabled(self):
+        return self.on and self.max_bytes > 0
+
+    def reset_stats(self):
+        with self.lock:
+            self.counts = dict.fromkeys(STATUSES, 0)
+            self.evictions = {'size': 0, 'ttl': 0}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def _evict_to(self, limit):
+        while self.entries and self.bytes > limit:
+            _, (_, size, _) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions['size'] += 1
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, size, stored = entry
+        if time.time() - stored > self.ttl:
+            del self.entries[key]
+            self.bytes -= size
+            self.evictions['ttl'] += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def _store(self, key, result):
+        value = {k: v for k, v in result.items() if k not in VOLATILE}
+        size = len(json.dumps(value, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size, time.time())
+        self.bytes += size
+        self._evict_to(self.max_bytes)
+
+    def fetch(self, model, prompt, options, compute):
+        """The cached response for this request, or compute() it (once for concurrent callers)"""
+        if not self.enabled or not cacheable(options):
+            with self.lock:
+                self.counts['bypass'] += 1
+            result = compute()
+            result['cache'] = 'bypass'
+            return result
+
+        key = cache_key(model, prompt, options)
+        started = time.time()
+        with self.lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.counts['hit'] += 1
+                return dict(copy.deepcopy(value), cache='hit', start_time=started,
+                            request_time=time.time() - started)
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+                self.counts['miss'] += 1
+            else:
+                self.counts['coalesced'] += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout) or flight.result is None:
+                return {"error": "Timed out waiting for an identical in-flight request", "cache": 'coalesced',
+                        "start_time": started, "request_time": time.time() - started}
+            return dict(copy.deepcopy(flight.result), cache='coalesced', start_time=started,
+                        request_time=time.time() - started)
+
+        snapshot = None
+        try:
+            result = compute()
+            result['cache'] = 'miss'
+            # The waiters get their own copy: the caller may still change `result`
+            snapshot = copy.deepcopy({k: v for k, v in result.items() if k not in VOLATILE})
+            with self.lock:
+                if 'error' not in result:
+                    self._store(key, snapshot)
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.result = snapshot
+            flight.done.set()
+        return result
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counts['miss'] + self.counts['hit'] + self.counts['coalesced']
+            return {
+                "enabled": self.enabled,
+                "max_mb": self.max_mb,
+                "ttl": self.ttl,
+                **self.counts,
+                "hit_rate": (self.counts['hit'] + self.counts['coalesced']) / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "in_flight": len(self.flights),
+                "evictions": dict(self.evictions),
+            }
@@ -4,6 +4,8 @@ import requests
 import sys
 import os
 import glob
+import json
+import time
 
 
 def _load_pushgateway_ip():
@@ -15,6 +17,46 @@ def _load_pushgateway_ip():
         return None
 
 
+def _load_client_ip():
+    """Load the client service IP from the newest client_ip_*.txt"""
+    client_files = sorted(glob.glob('output/client_ip_*.txt'), key=lambda x: x, reverse=True)
+    if not client_files:
+        raise FileNotFoundError("No client_ip_*.txt found. Is client service running?")
+    
+    with open(client_files[0], 'r') as f:
+        return f.read().strip()
+
+
+def _load_debug_token():
+    """Token of the client service's /debug endpoints (newest client_debug_token_*.txt)"""
+    token_files = sorted(glob.glob('output/client_debug_token_*.txt'), reverse=True)
+    if not token_files:
+        return ""
+    with open(token_files[0], 'r') as f:
+        return f.read().strip()
+
+
+def start_client_profile(mode="sample", seconds=30, **options):
+    """Open a profiling window in the running client service (see profilingHooks.py)
+
+    mode is 'sample', 'cprofile' or 'tracemalloc'; results are written to
+    output/client_data/profiles when the window closes.
+    """
+    try:
+        client_ip = _load_client_ip()
+        endpoint = "tracemalloc" if mode == "tracemalloc" else "profile"
+        response = requests.post(f"http://{client_ip}:5000/debug/{endpoint}",
+                                 json={"mode": mode, "seconds": seconds, **options},
+                                 headers={"X-Debug-Token": _load_debug_token()}, timeout=10)
+        if response.status_code != 202:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+        print(f"✓ Client {mode} profile running for {seconds}s (output/client_data/profiles)")
+        return response.json()
+    except Exception as e:
+        print(f"WARNING: could not start client profile: {e}")
+        return None
+
+
 def _calculate_tokens(response_data):
     """Calculate token count from response"""
     if 'eval_count' in response_data:
@@ -26,15 +68,16 @@ def _calculate_tokens(response_data):
     return 0
 
 
-def _push_to_pushgateway(tps, model, client_id, pushgateway_ip):
-    """Push TPS metric to Pushgateway"""
+def push_gauge(name, value, labels, instance, pushgateway_ip, job="benchmark"):
+    """Push a single gauge sample to Pushgateway; returns True on success"""
     if not pushgateway_ip:
-        return
+        return False
     
-    metric_data = f"""# TYPE tokens_per_second gauge
-tokens_per_second{{client_id="{client_id}",model="{model}"}} {tps}
+    label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    metric_data = f"""# TYPE {name} gauge
+{name}{{{label_str}}} {value}
 """
-    url = f"http://{pushgateway_ip}:9091/metrics/job/benchmark/instance/{client_id}"
+    url = f"http://{pushgateway_ip}:9091/metrics/job/{job}/instance/{instance}"
     
     try:
         response = requests.put(
@@ -43,19 +86,39 @@ tokens_per_second{{client_id="{client_id}",model="{model}"}} {tps}
             headers={'Content-Type': 'text/plain'},
             timeout=5
         )
-        if response.status_code == 200:
-            print(f"  ✓ Pushed TPS={tps:.2f} to Pushgateway")
+        return response.status_code == 200
     except Exception as e:
         print(f"  Pushgateway push failed: {e}")
+        return False
 
 
-def run_benchmark(n_clients=1, n_requests_per_client=5, model="llama2"):
+def _push_to_pushgateway(tps, model, client_id, pushgateway_ip):
+    """Push TPS metric to Pushgateway"""
+    labels = {"client_id": client_id, "model": model}
+    if push_gauge("tokens_per_second", tps, labels, client_id, pushgateway_ip):
+        print(f"  ✓ Pushed TPS={tps:.2f} to Pushgateway")
+
+
+def run_benchmark(n_clients=1, n_requests_per_client=5, model="llama2", routing=None, deadline=None,
+                  policy=None, workload=None, cache=None, options=None, capture=False):
     """Run parallel benchmark via client service
     
     Args:
         n_clients: Number of parallel clients to simulate
         n_requests_per_client: Number of requests each client makes
         model: Model name to use
+        routing: Policy across Ollama replicas (least_outstanding, p2c,
+            round_robin); default: the client service's CLIENT_ROUTING
+        deadline: Per-request time budget in seconds for admission control
+        policy: Request policy settings (deadline, retries, hedging; see
+            requestPolicy.py); default: no policy
+        workload: Generated prompts instead of the fixed one, e.g.
+            {"type": "shared_prefix", "prefix_tokens": 1024} (see workloads.py)
+        cache: Response cache on (True), off (False) or settings dict
+            (see responseCache.py); default: left as configured
+        options: Ollama generation options; the cache only serves
+            deterministic ones ({"temperature": 0} or a "seed")
+        capture: Record the run's requests for /replay (see trafficCapture.py)
     """
     total_queries = n_clients * n_requests_per_client
     print(f"\nPARALLEL BENCHMARK")
@@ -64,20 +127,27 @@ def run_benchmark(n_clients=1, n_requests_per_client=5, model="llama2"):
     print(f"  Total queries: {total_queries}\n")
     
     try:
-        # Load client service IP
-        client_files = sorted(glob.glob('output/client_ip_*.txt'), key=lambda x: x, reverse=True)
-        if not client_files:
-            raise FileNotFoundError("No client_ip_*.txt found. Is client service running?")
-        
-        with open(client_files[0], 'r') as f:
-            client_ip = f.read().strip()
-        
+        client_ip = _load_client_ip()
         url = f"http://{client_ip}:5000/benchmark"
         payload = {
             "n_clients": n_clients,
             "n_requests_per_client": n_requests_per_client,
             "model": model
         }
+        if routing:
+            payload["routing"] = routing
+        if deadline:
+            payload["deadline"] = deadline
+        if policy is not None:
+            payload["policy"] = policy
+        if workload:
+            payload["workload"] = workload
+        if cache is not None:
+            payload["cache"] = cache
+        if options:
+            payload["options"] = options
+        if capture:
+            payload["capture"] = True
         
         print(f"Sending benchmark request to {url}...")
         print(f"Server will run {n_clients} clients in parallel\n")
@@ -127,6 +197,48 @@ def run_benchmark(n_clients=1, n_requests_per_client=5, model="llama2"):
         print(f"Total tokens:     {total_tokens}")
         print(f"Avg TPS:          {avg_tps:.2f}")
         print(f"Throughput:       {result.get('queries_per_second', 0):.2f} queries/sec")
+        latency = result.get('latency')
+        if latency:
+            print(f"Latency:          p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s, p99 {latency['p99']:.2f}s")
+        policy_stats = result.get('policy', {})
+        if policy_stats.get('enabled'):
+            print(f"Request policy:   {policy_stats['attempts']} attempts for {policy_stats['requests']} requests "
+                  f"(+{policy_stats['extra_load']:.1%} load), {policy_stats['retries']} retries, "
+                  f"{policy_stats['hedges']} hedges ({policy_stats['hedges_won']} won), "
+                  f"{policy_stats['deadline_exceeded']} past deadline")
+        cache_stats = result.get('cache', {})
+        if cache_stats.get('enabled'):
+            print(f"Response cache:   {cache_stats['hit']} hits, {cache_stats['coalesced']} coalesced, "
+                  f"{cache_stats['miss']} misses, {cache_stats['bypass']} bypassed "
+                  f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} entries, "
+                  f"{cache_stats['bytes'] / 1e6:.1f} MB)")
+        prefix_cache = result.get('prefix_cache')
+        if prefix_cache:
+            for ordering in ('friendly', 'hostile'):
+                o = prefix_cache[ordering]
+                print(f"Prefix {ordering + ':':<9}  {o['requests']} requests, {o['prompt_tokens']:.0f} tokens "
+                      f"prefilled, {o['prefill_s'] * 1000:.0f} ms prefill, p50 {o['latency']['p50']:.2f}s")
+            speedup = prefix_cache['prefill_speedup']
+            cached = prefix_cache['cached_share']
+            print(f"Prefix cache:     saves {prefix_cache['prefill_saved_s'] * 1000:.0f} ms of prefill per request"
+                  + (f" ({speedup:.1f}x)" if speedup else "") + (f", {cached:.0%} of tokens cached" if cached is not None else ""))
+        captured = result.get('capture')
+        if captured:
+            print(f"Captured:         {captured['requests']} requests to {captured['name']} "
+                  f"({captured['bytes'] / 1e3:.1f} kB)")
+        admission = result.get('admission', {})
+        if admission.get('enabled'):
+            wait = admission['queue_wait']
+            print(f"Admission:        {admission['admitted']} admitted, rejected {admission['rejected']}")
+            print(f"Queue wait:       p50 {wait['p50']:.2f}s, p95 {wait['p95']:.2f}s "
+                  f"(peak queue {admission['max_queue_length']}, limits {admission['limits']})")
+        backends = result.get('backends', {})
+        if len(backends) > 1:
+            print(f"Routing:          {result.get('routing')} over {len(backends)} backends")
+            print(f"  {'backend':<16} {'requests':>8} {'share':>6} {'errors':>6} {'peak':>5} {'p50':>8} {'p95':>8}")
+            for host, b in backends.items():
+                print(f"  {host:<16} {b['requests']:>8} {b['share']:>6.1%} {b['errors']:>6} "
+                      f"{b['max_outstanding']:>5} {b['latency']['p50']:>7.2f}s {b['latency']['p95']:>7.2f}s")
         print("="*60 + "\n")
         
         return result
@@ -137,6 +249,258 @@ def run_benchmark(n_clients=1, n_requests_per_client=5, model="llama2"):
         return {"error": str(e), "total": total_queries, "successful": 0, "failed": total_queries}
 
 
+def run_embedding_benchmark(model="nomic-embed-text", batch_sizes=(1, 8, 32, 128), input_words=128,
+                            n_clients=1, n_batches=10, gpus=1):
+    """Sweep /api/embed batch sizes via the client service
+
+    Reports vectors/s, tokens/s and per-batch latency for every batch size,
+    normalised per GPU, and picks the batch size with the best inputs/s.
+    `gpus` counts every GPU serving the model (per node x replicas): the
+    client service spreads the batches over all replicas.
+    Results are saved to output/results/embedding_<timestamp>.json.
+    """
+    print(f"\nEMBEDDING BENCHMARK")
+    print(f"  Model: {model}")
+    print(f"  Batch sizes: {list(batch_sizes)} ({input_words} words per input)")
+    print(f"  Clients: {n_clients} × {n_batches} batches, GPUs: {gpus}\n")
+    
+    try:
+        client_ip = _load_client_ip()
+        url = f"http://{client_ip}:5000/embed-benchmark"
+        payload = {
+            "model": model,
+            "batch_sizes": list(batch_sizes),
+            "input_words": input_words,
+            "n_clients": n_clients,
+            "n_batches": n_batches
+        }
+        
+        response = requests.post(url, json=payload, timeout=3600)
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+        
+        result = response.json()
+        result['gpus'] = gpus
+        pushgateway_ip = _load_pushgateway_ip()
+        
+        for point in result['sweep']:
+            point['vectors_per_second_per_gpu'] = point['vectors_per_second'] / gpus
+            labels = {"model": model, "batch_size": point['batch_size']}
+            push_gauge("embedding_vectors_per_second", point['vectors_per_second'], labels,
+                       f"embed_bs{point['batch_size']}", pushgateway_ip)
+        
+        ok_points = [p for p in result['sweep'] if p['failed'] == 0]
+        best = max(ok_points, key=lambda p: p['vectors_per_second'], default=None)
+        result['best_batch_size'] = best['batch_size'] if best else None
+        
+        print("\n" + "="*60)
+        print("EMBEDDING RESULTS")
+        print("="*60)
+        print(f"{'batch':>6} {'vectors/s':>11} {'vec/s/GPU':>10} {'tokens/s':>10} {'p50':>8} {'p95':>8} {'failed':>7}")
+        for point in result['sweep']:
+            latency = point['batch_latency']
+            print(f"{point['batch_size']:>6} {point['vectors_per_second']:>11.1f} "
+                  f"{point['vectors_per_second_per_gpu']:>10.1f} {point['tokens_per_second']:>10.0f} "
+                  f"{latency['p50']:>7.3f}s {latency['p95']:>7.3f}s {point['failed']:>7}")
+        if best:
+            print(f"Best batch size:  {best['batch_size']} "
+                  f"({best['vectors_per_second_per_gpu']:.1f} inputs/s per GPU)")
+        print("="*60 + "\n")
+        
+        result['timestamp'] = time.time()
+        os.makedirs("output/results", exist_ok=True)
+        with open(f"output/results/embedding_{int(result['timestamp'])}.json", 'w') as f:
+            json.dump(result, f, indent=2)
+        
+        return result
+        
+    except Exception as e:
+        print(f"ERROR: {e}")
+        return {"error": str(e), "sweep": []}
+
+
+def run_chat_benchmark(model="llama2", n_clients=1, n_turns=8, user_words=64, reply_tokens=128, num_ctx=None):
+    """Multi-turn chat sessions on /api/chat via the client service
+
+    Each client keeps its message history across n_turns turns; latency and
+    prefill throughput are reported per turn index as the context grows.
+    Results are saved to output/results/chat_<timestamp>.json.
+    """
+    print(f"\nCHAT SESSION BENCHMARK")
+    print(f"  Model: {model}")
+    print(f"  Sessions: {n_clients} × {n_turns} turns")
+    print(f"  User message: {user_words} words, reply: {reply_tokens} tokens, num_ctx: {num_ctx or 'default'}\n")
+
+    try:
+        client_ip = _load_client_ip()
+        url = f"http://{client_ip}:5000/chat-benchmark"
+        payload = {
+            "model": model,
+            "n_clients": n_clients,
+            "n_turns": n_turns,
+            "user_words": user_words,
+            "reply_tokens": reply_tokens,
+            "num_ctx": num_ctx
+        }
+
+        response = requests.post(url, json=payload, timeout=3600)
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+
+        result = response.json()
+        pushgateway_ip = _load_pushgateway_ip()
+        for t in result['turns']:
+            labels = {"model": model, "turn": t['turn'] + 1}
+            push_gauge("chat_turn_latency_seconds", t['latency']['p50'], labels,
+                       f"chat_turn{t['turn'] + 1}", pushgateway_ip)
+
+        print("\n" + "="*60)
+        print("CHAT SESSION RESULTS")
+        print("="*60)
+        print(f"{'turn':>4} {'context':>8} {'fill':>6} {'prefill':>8} {'p50':>8} {'p95':>8} "
+              f"{'prefill/s':>10} {'decode/s':>9} {'trunc':>6} {'failed':>7}")
+        for t in result['turns']:
+            latency = t['latency']
+            fill = f"{t['context_fill']:.0%}" if t['context_fill'] is not None else "-"
+            print(f"{t['turn'] + 1:>4} {t['context_tokens']:>8.0f} {fill:>6} {t['prompt_tokens']:>8.0f} "
+                  f"{latency['p50']:>7.2f}s {latency['p95']:>7.2f}s {t['prefill_tps']:>10.0f} "
+                  f"{t['decode_tps']:>9.1f} {t['truncated']:>6} {t['failed']:>7}")
+        print(f"Sessions completed: {result['sessions_completed']}/{n_clients}")
+        print("="*60 + "\n")
+
+        result['timestamp'] = time.time()
+        os.makedirs("output/results", exist_ok=True)
+        with open(f"output/results/chat_{int(result['timestamp'])}.json", 'w') as f:
+            json.dump(result, f, indent=2)
+
+        return result
+
+    except Exception as e:
+        print(f"ERROR: {e}")
+        return {"error": str(e), "turns": []}
+
+
+def run_prefill_sweep(model="llama2", lengths=(512, 1024, 2048, 4096, 8192), clients=(1, 2, 4, 8),
+                      n_requests=2, reply_tokens=16, gpu_memory_gb=None):
+    """Long-context prefill sweep via the client service
+
+    Measures TTFT, latency, prefill tokens/s and model memory for every
+    prompt length x client count, with num_ctx sized to each length.
+    Results, including the length x clients surfaces, are saved to
+    output/results/prefill_<timestamp>.json.
+    """
+    print(f"\nPREFILL SWEEP")
+    print(f"  Model: {model}")
+    print(f"  Prompt lengths: {list(lengths)} tokens")
+    print(f"  Clients: {list(clients)} × {n_requests} requests, reply: {reply_tokens} tokens\n")
+
+    try:
+        client_ip = _load_client_ip()
+        url = f"http://{client_ip}:5000/prefill-sweep"
+        payload = {
+            "model": model,
+            "lengths": list(lengths),
+            "clients": list(clients),
+            "n_requests": n_requests,
+            "reply_tokens": reply_tokens,
+            "gpu_memory_gb": gpu_memory_gb
+        }
+
+        response = requests.post(url, json=payload, timeout=7200)
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+
+        result = response.json()
+        pushgateway_ip = _load_pushgateway_ip()
+        for point in result['points']:
+            labels = {"model": model, "length": point['length'], "clients": point['clients']}
+            push_gauge("prefill_ttft_seconds", point['ttft']['p50'], labels,
+                       f"prefill_{point['length']}_{point['clients']}", pushgateway_ip)
+
+        print("\n" + "="*60)
+        print("PREFILL SWEEP RESULTS")
+        print("="*60)
+        for title, metric, fmt in (("TTFT p50 (s)", 'ttft.p50', '.2f'),
+                                   ("Aggregate prefill tokens/s", 'aggregate_prefill_tps', '.0f')):
+            print(f"{title}, rows: prompt tokens, columns: clients")
+            print(f"{'':>8}" + "".join(f"{n:>10}" for n in result['clients']))
+            for length, row in zip(result['lengths'], result['surface'][metric]):
+                print(f"{length:>8}" + "".join(f"{v:>10{fmt}}" if v is not None else f"{'-':>10}" for v in row))
+        print(f"{'length':>8} {'num_ctx':>8} {'VRAM':>8} {'offload':>8} {'headroom':>9}")
+        for point in result['points']:
+            if point['clients'] != result['clients'][0]:
+                continue
+            headroom = point.get('headroom_gb')
+            print(f"{point['length']:>8} {point['num_ctx']:>8} {point['vram_gb'] or 0:>6.1f}GB "
+                  f"{point['offload_gb'] or 0:>6.1f}GB " + (f"{headroom:>7.1f}GB" if headroom is not None else f"{'-':>9}"))
+        if result['skipped_lengths']:
+            print(f"Skipped (past the {result['context_window']}-token context window): {result['skipped_lengths']}")
+        print("="*60 + "\n")
+
+        result['timestamp'] = time.time()
+        os.makedirs("output/results", exist_ok=True)
+        with open(f"output/results/prefill_{int(result['timestamp'])}.json", 'w') as f:
+            json.dump(result, f, indent=2)
+
+        return result
+
+    except Exception as e:
+        print(f"ERROR: {e}")
+        return {"error": str(e), "points": []}
+
+
+def run_replay(capture, speed=1.0, max_workers=256, model=None, limit=None):
+    """Replay a captured trace via the client service
+
+    Sends the capture's requests with their original timing, order, prompts
+    and options (speed scales the timing), so two deployments can be
+    compared under identical load. Returns the benchmark-like result, with
+    the replay's dispatch precision under 'replay'.
+    """
+    print(f"\nTRAFFIC REPLAY")
+    print(f"  Capture: {capture}")
+    print(f"  Speed: {speed}x, workers: {max_workers}" + (f", model: {model}" if model else "") + "\n")
+
+    try:
+        client_ip = _load_client_ip()
+        url = f"http://{client_ip}:5000/replay"
+        payload = {"capture": capture, "speed": speed, "max_workers": max_workers}
+        if model:
+            payload["model"] = model
+        if limit:
+            payload["limit"] = limit
+
+        response = requests.post(url, json=payload, timeout=7200)
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+
+        result = response.json()
+        timing = result['replay']
+        latency = result['latency']
+
+        print("\n" + "="*60)
+        print("REPLAY RESULTS")
+        print("="*60)
+        print(f"Capture:          {result['capture']}" + (f" ({result['capture_label']})" if result['capture_label'] else ""))
+        print(f"Total queries:    {result['total_queries']}")
+        print(f"Successful:       {result['successful']}")
+        print(f"Failed:           {result['failed']}")
+        print(f"Total time:       {result['total_time']:.2f}s")
+        print(f"Latency:          p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s, p99 {latency['p99']:.2f}s")
+        print(f"Send rate:        {timing['achieved_rate'] or 0:.1f} req/s (target {timing['target_rate'] or 0:.1f})")
+        for label, name in (("Dispatch late:", 'dispatch_lateness'), ("Start late:", 'start_lateness')):
+            late = timing[name]
+            print(f"{label:<18}p50 {late['p50'] * 1e3:.2f} ms, p99 {late['p99'] * 1e3:.2f} ms")
+        print(f"Late over 1 ms:   {timing['late_over_1ms']} requests")
+        print("="*60 + "\n")
+
+        return result
+
+    except Exception as e:
+        print(f"ERROR: {e}")
+        return {"error": str(e), "successful": 0, "failed": 0}
+
+
 if __name__ == "__main__":
     n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1
     n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 5
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Traffic capture and deterministic replay.
+
+Two deployments (Ollama versions, memory settings) are only comparable
+under the same load. Each benchmark generates its own arrival pattern, so
+instead one run's requests are captured and replayed against the other.
+
+Capture (POST /capture {"action": "start" | "stop"}, or "capture": true on
+/benchmark) records every /query and benchmark request: send time relative
+to the start of the capture, client and request id, model, prompt and
+options. stop() writes CLIENT_DATA_DIR/captures/capture_<ts>.json.gz
+(output/client_data/captures on the host), a gzipped columnar JSON file:
+
+    {"version": 1, "created": ..., "label": ..., "duration": ...,
+     "models": [...], "prompts": [...], "options": [...],
+     "columns": {"dt_us": [...], "client": [...], "request": [...],
+                 "model": [...], "prompt": [...], "options": [...]}}
+
+Prompts, models and options are interned (columns hold indices), send
+times are delta-encoded integer microseconds in send order, so thousands of
+requests with a few distinct prompts take a few kB.
+
+Replay (POST /replay) reproduces the trace open-loop: one dispatcher thread
+sleeps until each request's send time (scaled by 1 / speed) and hands it to
+a worker pool in capture order; the workers are all started beforehand.
+Near the send time it yields instead of sleeping. While a replay runs, the
+interpreter's thread switch interval is lowered from 5 ms to
+`switch_interval`, so busy workers cannot hold the GIL for long when the
+dispatcher wakes up. Two lateness figures are reported: `dispatch` (the
+dispatcher behind its schedule) and `start` (the request started late
+because every worker was busy). If `start` grows, max_workers is too small
+for the replayed load.
+"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requestTrace
+from benchStats import latency_summary
+
+DATA_DIR = os.getenv('CLIENT_DATA_DIR', '/app/data')
+CAPTURE_VERSION = 1
+
+
+def capture_dir():
+    path = os.path.join(DATA_DIR, 'captures')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class _Interned:
+    """Values and their indices, first seen first"""
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def __call__(self, value):
+        key = json.dumps(value, sort_keys=True) if isinstance(value, dict) else value
+        i = self.index.get(key)
+        if i is None:
+            i = self.index[key] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+class TrafficCapture:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.last = None
+        self._reset(None)
+
+    def _reset(self, label):
+        self.label = label
+        self.t0 = requestTrace.now()
+        self.started = time.time()
+        self.models, self.prompts, self.options = _Interned(), _Interned(), _Interned()
+        self.rows = []
+
+    def start(self, label=None):
+        """Start a new capture (discarding one in progress)"""
+        with self.lock:
+            self._reset(label)
+            self.active = True
+        print(f"Traffic capture started{f' ({label})' if label else ''}")
+
+    def record(self, scheduled, client_id, request_id, model, prompt, options=None):
+        """Add one request; `scheduled` is its requestTrace.now() send time"""
+        if not self.active:
+            return
+        with self.lock:
+            if self.active:
+                self.rows.append((scheduled - self.t0, client_id, request_id, self.models(model),
+                                  self.prompts(prompt), self.options(options or {})))
+
+    def stop(self):
+        """End the capture and write it; returns its summary (None if none was running)"""
+        with self.lock:
+            if not self.active:
+                return None
+            self.active = False
+            rows = sorted(self.rows, key=lambda row: row[0])
+            columns = {'dt_us': [], 'client': [], 'request': [], 'model': [], 'prompt': [], 'options': []}
+            previous = 0
+            for t, client_id, request_id, model, prompt, options in rows:
+                t_us = max(int(round(t * 1e6)), previous)
+                columns['dt_us'].append(t_us - previous)
+                previous = t_us
+                columns['client'].append(client_id)
+                columns['request'].append(request_id)
+                columns['model'].append(model)
+                columns['prompt'].append(prompt)
+                columns['options'].append(options)
+            capture = {
+                'version': CAPTURE_VERSION,
+                'created': self.started,
+                'label': self.label,
+                'duration': previous / 1e6,
+                'models': self.models.values,
+                'prompts': self.prompts.values,
+                'options': self.options.values,
+                'columns': columns,
+            }
+
+        stem = os.path.join(capture_dir(), f"capture_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started))}")
+        path, n = f"{stem}.json.gz", 1
+        while os.path.exists(path):
+            n += 1
+            path = f"{stem}_{n}.json.gz"
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump(capture, f, separators=(',', ':'))
+        self.last = {'path': path, 'name': os.path.basename(path), 'requests': len(rows),
+                     'duration': capture['duration'], 'prompts': len(capture['prompts']),
+                     'bytes': os.path.getsize(path)}
+        print(f"✓ Captured {len(rows)} requests over {capture['duration']:.1f}s to {path} "
+              f"({self.last['bytes'] / 1e3:.1f} kB)")
+        return self.last
+
+    def status(self):
+        with self.lock:
+            return {'active': self.active, 'label': self.label,
+                    'requests': len(self.rows) if self.active else 0, 'last': self.last}
+
+
+def load_capture(name):
+    """A capture file in the captures directory, with send times decoded to 't' (s)
+
+    `name` comes from /replay requests, so only a file name is accepted:
+    nothing outside capture_dir() can be read.
+    """
+    directory = os.path.realpath(capture_dir())
+    path = os.path.realpath(os.path.join(directory, os.path.basename(name)))
+    if os.path.dirname(path) != directory or not os.path.isfile(path):
+        raise ValueError(f"No capture {name!r} in {directory}")
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        capture = json.load(f)
+    if capture.get('version') != CAPTURE_VERSION:
+        raise ValueError(f"{path}: capture version {capture.get('version')}, expected {CAPTURE_VERSION}")
+    t, total = [], 0
+    for dt in capture['columns']['dt_us']:
+        total += dt
+        t.append(total / 1e6)
+    capture['t'] = t
+    capture['path'] = path
+    return capture
+
+
+def replay(capture, send, speed=1.0, max_workers=256, limit=None, spin=0.0005, switch_interval=0.0002):
+    """Replay a loaded capture open-loop; returns (results in capture order, timing summary)
+
+    `send(i, scheduled)` issues request i of the capture; `scheduled` is its
+    requestTrace.now() send time.
+    """
+    n = len(capture['t']) if limit is None else min(limit, len(capture['t']))
+    dispatch_late = [0.0] * n
+    start_late = [0.0] * n
+    futures = []
+
+    def run(i, target):
+        start_late[i] = requestTrace.now() - target
+        return send(i, target)
+
+    previous_interval = sys.getswitchinterval()
+    sys.setswitchinterval(min(previous_interval, switch_interval))
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="replay") as pool:
+            # Start every worker now: the pool would otherwise spawn them inside the dispatch loop
+            ready = threading.Barrier(max_workers + 1)
+            for _ in range(max_workers):
+                pool.submit(ready.wait)
+            ready.wait()
+            t0 = requestTrace.now() + 0.05
+            for i in range(n):
+                target = t0 + capture['t'][i] / speed
+                remaining = target - requestTrace.now()
+                if remaining > spin:
+                    time.sleep(remaining - spin)
+                # Yield rather than sleep for the last stretch: sleep() overshoots
+                while requestTrace.now() < target:
+                    time.sleep(0)
+                dispatch_late[i] = requestTrace.now() - target
+                futures.append(pool.submit(run, i, target))
+            dispatched = requestTrace.now()
+            results = [future.result() for future in futures]
+    finally:
+        sys.setswitchinterval(previous_interval)
+
+    span = dispatched - t0
+    timing = {
+        'requests': n,
+        'speed': speed,
+        'max_workers': max_workers,
+        'captured_duration': capture['t'][n - 1] if n else 0.0,
+        'replayed_duration': span,
+        'target_rate': n / (capture['t'][n - 1] / speed) if n and capture['t'][n - 1] > 0 else None,
+        'achieved_rate': n / span if span > 0 else None,
+        'dispatch_lateness': latency_summary(dispatch_late),
+        'start_lateness': latency_summary(start_late),
+        'late_over_1ms': sum(1 for late in start_late if late > 0.001),
+    }
+    return results, timing
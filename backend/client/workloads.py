@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Workloads beyond single independent prompts.
+
+Chat sessions (/chat-benchmark): each simulated client holds one
+conversation on /api/chat and sends its whole message history every turn,
+so the context grows by one user message and one reply per turn:
+
+- n_turns        turns per session
+- user_words     words per user message (distinct per client and turn)
+- reply_tokens   reply length (options.num_predict)
+- num_ctx        context window to run with (default: the server's)
+
+Per turn index the summary reports latency percentiles, prompt tokens
+prefilled, the estimated context size, prefill and decode tokens/s, and the
+fill of num_ctx. Ollama reuses the cached prefix of a session, so
+prompt_tokens (what was actually prefilled) can stay far below the context
+size; the context size is estimated from the characters sent, calibrated on
+each session's first turn, where nothing is cached yet. Once the context
+outgrows num_ctx, Ollama drops the oldest messages: those turns are counted
+as `truncated`.
+
+Long-context prefill sweep (/prefill-sweep): prompts of each target length
+(in tokens, capped at the model's trained context window), run with num_ctx
+set to fit the prompt plus the reply, at each client count:
+
+- lengths        prompt lengths in tokens
+- clients        concurrency levels
+- n_requests     sequential requests per client per point
+- reply_tokens   kept short so prefill dominates
+
+Every prompt starts with a unique tag, so no prefix is served from the KV
+cache. Tokens per word are calibrated with two probe requests of 100 and
+300 words: the difference of their prompt_eval_count gives the slope, the
+rest is the template overhead. A changed num_ctx makes Ollama reload the
+model, so each length starts with an untimed warm-up request, after which
+/api/ps gives the model's memory (VRAM and what spilled to the CPU). Each
+point reports TTFT (first streamed token), latency, prefill tokens/s per
+request and in aggregate; surface() arranges any of them as a length x
+clients grid.
+
+Shared-prefix prompts (/benchmark with "workload": {"type": "shared_prefix"}):
+every prompt is one of n_prefixes long shared texts (~prefix_tokens tokens,
+like a system prompt) plus a short suffix unique to the client and request
+(suffix_words words). A fraction hostile_fraction of the requests get the
+same two parts in the cache-hostile order, suffix first, so no prefix can
+be reused. The token counts are equal, so the difference in prefill time
+between the two orderings is what the server's prompt / KV cache saves.
+With more distinct prefixes than Ollama has parallel slots
+(OLLAMA_NUM_PARALLEL), even cache-friendly prompts start to miss.
+"""
+
+import random
+
+from benchStats import latency_summary
+
+WORDS = ["cluster", "node", "memory", "vector", "token", "batch", "kernel", "queue",
+         "latency", "storage", "network", "model", "tensor", "cache", "thread", "scheduler"]
+
+SYSTEM_PROMPT = "You are a helpful assistant for an HPC benchmarking team. Answer concisely."
+
+
+def user_message(client_id, turn, words):
+    """A user turn of `words` words, distinct per client and turn"""
+    body = " ".join(WORDS[(client_id * 7 + turn * 3 + j) % len(WORDS)] for j in range(max(words - 8, 0)))
+    return f"Session {client_id}, question {turn + 1}: explain how these relate: {body}"
+
+
+def _rate(tokens, seconds):
+    return tokens / seconds if seconds > 0 else 0.0
+
+
+def run_chat_session(chat, client_id, model, n_turns, user_words, reply_tokens, num_ctx=None):
+    """One conversation of n_turns turns; returns one result dict per turn
+
+    `chat(messages, model, options)` sends the history to /api/chat. The
+    session stops at the first failed turn (its history would be wrong).
+    """
+    options = {"num_predict": reply_tokens}
+    if num_ctx:
+        options["num_ctx"] = num_ctx
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    chars_per_token = None
+    results = []
+    for turn in range(n_turns):
+        messages.append({"role": "user", "content": user_message(client_id, turn, user_words)})
+        context_chars = sum(len(m["content"]) for m in messages)
+        result = chat(messages, model, options)
+        result.update(client_id=client_id, turn=turn, context_chars=context_chars)
+        results.append(result)
+        if 'error' in result:
+            break
+
+        if chars_per_token is None and result['prompt_tokens']:
+            chars_per_token = context_chars / result['prompt_tokens']
+        result['context_tokens'] = int(context_chars / chars_per_token) if chars_per_token else 0
+        result['truncated'] = bool(num_ctx) and result['context_tokens'] + reply_tokens > num_ctx
+        messages.append({"role": "assistant", "content": result.pop('content')})
+    return results
+
+
+def per_turn_summary(results, n_turns, num_ctx=None):
+    """Latency and throughput per turn index over all sessions"""
+    turns = []
+    for turn in range(n_turns):
+        at_turn = [r for r in results if r['turn'] == turn]
+        ok = [r for r in at_turn if 'error' not in r]
+        n = len(ok) or 1
+        context = sum(r['context_tokens'] for r in ok) / n
+        turns.append({
+            "turn": turn,
+            "requests": len(at_turn),
+            "failed": len(at_turn) - len(ok),
+            "latency": latency_summary([r['request_time'] for r in ok]),
+            "prompt_tokens": sum(r['prompt_tokens'] for r in ok) / n,
+            "output_tokens": sum(r['output_tokens'] for r in ok) / n,
+            "context_tokens": context,
+            "context_fill": context / num_ctx if num_ctx else None,
+            "truncated": sum(1 for r in ok if r['truncated']),
+            "prefill_tps": sum(_rate(r['prompt_tokens'], r['prefill_s']) for r in ok) / n,
+            "decode_tps": sum(_rate(r['output_tokens'], r['decode_s']) for r in ok) / n,
+        })
+    return turns
+
+
+def document_prompt(tag, n_words):
+    """A pasted-document prompt of n_words words; `tag` keeps it out of the prefix cache"""
+    body = " ".join(WORDS[(j * 5 + j // len(WORDS)) % len(WORDS)] for j in range(n_words))
+    return f"Document {tag}. Summarize the document below in one sentence.\n\n{body}"
+
+
+def words_for(n_tokens, tokens_per_word):
+    return max(int(n_tokens / tokens_per_word), 1)
+
+
+def context_for(n_tokens, reply_tokens):
+    """num_ctx fitting the prompt and reply, rounded up to a multiple of 256"""
+    return -(-(n_tokens + reply_tokens + 64) // 256) * 256
+
+
+def model_memory(running, model):
+    """VRAM and CPU-resident bytes of `model` in an /api/ps snapshot, on its largest backend"""
+    entries = [m for models in running.values() for m in models
+               if m.get('name') == model or m.get('name', '').split(':')[0] == model]
+    if not entries:
+        return {"vram_gb": None, "offload_gb": None}
+    biggest = max(entries, key=lambda m: m.get('size', 0))
+    return {"vram_gb": biggest.get('size_vram', 0) / 1e9,
+            "offload_gb": (biggest.get('size', 0) - biggest.get('size_vram', 0)) / 1e9}
+
+
+def sweep_point(results, length, n_clients, num_ctx, wall_time):
+    """Summary of one (length, clients) point of the prefill sweep"""
+    ok = [r for r in results if 'error' not in r]
+    n = len(ok) or 1
+    prompt_tokens = sum(r.get('prompt_eval_count', 0) for r in ok)
+    return {
+        "length": length,
+        "clients": n_clients,
+        "num_ctx": num_ctx,
+        "requests": len(results),
+        "failed": len(results) - len(ok),
+        "prompt_tokens": prompt_tokens / n,
+        "ttft": latency_summary([r['ttft'] for r in ok]),
+        "latency": latency_summary([r['request_time'] for r in ok]),
+        "prefill_tps": sum(_rate(r.get('prompt_eval_count', 0), r.get('prompt_eval_duration', 0) / 1e9)
+                           for r in ok) / n,
+        "aggregate_prefill_tps": _rate(prompt_tokens, wall_time),
+    }
+
+
+def surface(points, lengths, clients, metric):
+    """Grid of one metric (e.g. 'ttft.p50', 'prefill_tps'), rows = lengths, columns = clients"""
+    by_key = {(p['length'], p['clients']): p for p in points}
+    grid = []
+    for length in lengths:
+        row = []
+        for n_clients in clients:
+            value = by_key.get((length, n_clients))
+            for part in metric.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            row.append(value)
+        grid.append(row)
+    return grid
+
+
+SHARED_PREFIX_DEFAULTS = {'prefix_tokens': 1024, 'suffix_words': 32, 'n_prefixes': 1, 'hostile_fraction': 0.5}
+
+
+def shared_prefix(prefix_id, n_words):
+    """The shared text number `prefix_id`, n_words words long"""
+    body = " ".join(WORDS[(j * 3 + prefix_id) % len(WORDS)] for j in range(n_words))
+    return f"System policy {prefix_id}: you answer questions about this reference material.\n{body}\n"
+
+
+def shared_prefix_prompt(spec, client_id, request_id):
+    """(prompt, prefix_id, ordering) of one request of a shared_prefix workload"""
+    spec = {**SHARED_PREFIX_DEFAULTS, **spec}
+    rng = random.Random(f"{client_id}-{request_id}")
+    prefix_id = (client_id + request_id) % spec['n_prefixes']
+    prefix = shared_prefix(prefix_id, words_for(spec['prefix_tokens'], 1.3))
+    suffix = f"Client {client_id}, request {request_id}: " + " ".join(
+        rng.choice(WORDS) for _ in range(spec['suffix_words']))
+    if rng.random() < spec['hostile_fraction']:
+        return f"{suffix}\n{prefix}", prefix_id, 'hostile'
+    return f"{prefix}{suffix}", prefix_id, 'friendly'
+
+
+def prefix_cache_summary(results):
+    """Prefill time per ordering of a shared_prefix run and what the cache saved"""
+    summary = {}
+    for ordering in ('friendly', 'hostile'):
+        ok = [r for r in results if r.get('ordering') == ordering and 'error' not in r]
+        n = len(ok) or 1
+        summary[ordering] = {
+            "requests": len(ok),
+            "prompt_tokens": sum(r.get('prompt_eval_count', 0) for r in ok) / n,
+            "prefill_s": sum(r.get('prompt_eval_duration', 0) for r in ok) / 1e9 / n,
+            "latency": latency_summary([r['request_time'] for r in ok]),
+        }
+    friendly, hostile = summary['friendly'], summary['hostile']
+    summary['prefill_saved_s'] = hostile['prefill_s'] - friendly['prefill_s']
+    summary['prefill_speedup'] = hostile['prefill_s'] / friendly['prefill_s'] if friendly['prefill_s'] > 0 else None
+    # Ollama counts only the tokens it evaluated, so the shortfall is the cached share
+    summary['cached_share'] = (1 - friendly['prompt_tokens'] / hostile['prompt_tokens']
+                               if hostile['prompt_tokens'] > 0 and friendly['requests'] else None)
+    return summary
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Energy-efficiency metrics of a benchmark run.
+
+GPU power samples exported by prometheusExport.py (hardware.npz, `power`
+in W, one row per GPU) are integrated with the trapezoidal rule over the
+run window (first request sent to last response) and joined with the
+token totals of the run's request records:
+
+- energy_j                 GPU energy over the window (all GPUs)
+- tokens_per_joule         output tokens / energy_j
+- tokens_per_gpu_hour      output tokens / (n_gpus x window hours)
+- energy_per_request_j     energy_j / successful requests
+- joules_per_token         energy_j / output tokens
+
+The result is saved as energy.json in the run directory. Given several run
+directories, the script prints them side by side with model and memory.
+Recorded Prometheus responses (prometheusExport.py --record/--replay) make
+the computation reproducible without a cluster.
+
+Usage:
+    python3 energyMetrics.py output/runs/<run_id> [more run dirs...]
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+import runRecords
+from prometheusExport import run_window
+
+
+def integrate_power(timestamps, watts, start, end):
+    """Joules of each power series over [start, end]
+
+    Missing samples (NaN) are skipped; the series is linearly interpolated at
+    the window edges (held constant beyond the first/last sample). Rows with
+    no samples integrate to NaN.
+    """
+    watts = np.atleast_2d(watts)
+    energy = np.full(len(watts), np.nan)
+    inside = (timestamps > start) & (timestamps < end)
+    for row, series in enumerate(watts):
+        valid = ~np.isnan(series)
+        if not valid.any():
+            continue
+        t, w = timestamps[valid], series[valid]
+        grid = np.concatenate([[start], timestamps[inside & valid], [end]])
+        power = np.interp(grid, t, w)
+        energy[row] = float(((power[1:] + power[:-1]) * np.diff(grid)).sum() / 2)
+    return energy
+
+
+def energy_metrics(records, timestamps, watts):
+    """Energy-efficiency metrics from request records and GPU power series"""
+    start, end = run_window(records, padding=0)
+    window = end - start
+    per_gpu = integrate_power(timestamps, watts, start, end)
+    measured = ~np.isnan(per_gpu)
+    n_gpus = int(measured.sum())
+    energy = float(per_gpu[measured].sum()) if n_gpus else None
+
+    ok = records['ok']
+    output_tokens = int(records['output_tokens'][ok].sum())
+    prompt_tokens = int(records['prompt_tokens'][ok].sum())
+    n_ok = int(ok.sum())
+    gpu_hours = n_gpus * window / 3600.0
+
+    def ratio(a, b):
+        return float(a / b) if a is not None and b else None
+
+    return {
+        'window_start': start,
+        'window_seconds': window,
+        'n_gpus': n_gpus,
+        'energy_j': energy,
+        'energy_per_gpu_j': [float(e) if not np.isnan(e) else None for e in per_gpu],
+        'avg_power_w': ratio(energy, window),
+        'requests': n_ok,
+        'output_tokens': output_tokens,
+        'prompt_tokens': prompt_tokens,
+        'gpu_hours': gpu_hours,
+        'tokens_per_joule': ratio(output_tokens, energy),
+        'joules_per_token': ratio(energy, output_tokens),
+        'tokens_per_gpu_hour': ratio(output_tokens, gpu_hours),
+        'energy_per_request_j': ratio(energy, n_ok),
+    }
+
+
+def run_energy(run_dir, save=True):
+    """Compute and (by default) save energy.json for a run with hardware.npz"""
+    records, manifest = runRecords.load_run(run_dir)
+    hardware = np.load(os.path.join(run_dir, "hardware.npz"))
+    metrics = energy_metrics(records, hardware['power_t'], hardware['power'])
+
+    recipe = manifest.get('recipe') or {}
+    job = recipe.get('job', {})
+    metrics.update({
+        'run_id': manifest.get('run_id'),
+        'model': job.get('service', {}).get('model'),
+        'mem_gb': job.get('infrastructure', {}).get('mem_gb'),
+        'partition': job.get('infrastructure', {}).get('partition'),
+    })
+    if save:
+        with open(os.path.join(run_dir, "energy.json"), 'w') as f:
+            json.dump(metrics, f, indent=2)
+    return metrics
+
+
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else "-"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 energyMetrics.py <run_dir> [<run_dir> ...]")
+        sys.exit(1)
+
+    print(f"{'run':<24} {'model':<14} {'mem':>5} {'GPUs':>4} {'energy kJ':>10} {'avg W':>8} "
+          f"{'tok/J':>8} {'tok/GPU-h':>11} {'J/req':>9}")
+    for run_dir in sys.argv[1:]:
+        m = run_energy(run_dir)
+        print(f"{m['run_id']:<24} {str(m['model']):<14} {str(m['mem_gb']):>5} {m['n_gpus']:>4} "
+              f"{_fmt(m['energy_j'] and m['energy_j'] / 1000, '10.2f')} {_fmt(m['avg_power_w'], '8.1f')} "
+              f"{_fmt(m['tokens_per_joule'], '8.3f')} {_fmt(m['tokens_per_gpu_hour'], '11.0f')} "
+              f"{_fmt(m['energy_per_request_j'], '9.1f')}")
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Node-local staging of the Ollama container image and model blobs.
+
+Runs inside the Ollama SLURM job (before `ollama serve`) and copies the SIF and
+the blobs of the requested model(s) from the shared filesystem to node-local
+storage. Every copy is sha256-verified and renamed into place only after the
+check passes. The digest, size and mtime of each verified copy are recorded in
+VERIFIED_RECORD at the root of the destination, and a later job that lands on
+the same node skips a file only when that record matches what it expects.
+
+Usage:
+    python3 nodeStaging.py --dest /tmp/$USER/ollama_stage --model llama2 \
+        [--sif output/containers/ollama_latest.sif] [--models-dir output/ollama_models] \
+        [--report output/logs/ollama_staging_<jobid>.json] [--sync-back]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+CHUNK_SIZE = 16 * 1024 * 1024
+REGISTRY = "registry.ollama.ai"
+# Kept outside the Ollama store: Ollama prunes unknown files from models/blobs
+VERIFIED_RECORD = ".verified_sha256.json"
+
+
+def _sha256_file(path):
+    """Compute the sha256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy_verified(src, dst, expected_sha256):
+    """Copy src to dst hashing on the fly; keep the copy only if the digest matches"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + ".part"
+    digest = hashlib.sha256()
+    with open(src, 'rb') as fin, open(tmp, 'wb') as fout:
+        for chunk in iter(lambda: fin.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            fout.write(chunk)
+    if digest.hexdigest() != expected_sha256:
+        os.remove(tmp)
+        raise IOError(f"checksum mismatch for {src}: expected {expected_sha256}, got {digest.hexdigest()}")
+    shutil.copystat(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _load_verified(root):
+    """Verified copies under `root`: relative path -> {sha256, size, mtime}"""
+    path = os.path.join(root, VERIFIED_RECORD)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return {}
+
+
+def _save_verified(root, verified):
+    path = os.path.join(root, VERIFIED_RECORD)
+    with open(path + ".part", 'w') as f:
+        json.dump(verified, f, indent=1, sort_keys=True)
+    os.replace(path + ".part", path)
+
+
+def _sif_digest(sif_path):
+    """Return the SIF digest from its .sha256 sidecar, (re)computing it when stale"""
+    sidecar = sif_path + ".sha256"
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(sif_path):
+        with open(sidecar, 'r') as f:
+            return f.read().split()[0]
+    digest = _sha256_file(sif_path)
+    with open(sidecar, 'w') as f:
+        f.write(f"{digest}  {os.path.basename(sif_path)}\n")
+    return digest
+
+
+def _manifest_path(models_dir, model):
+    """Locate the manifest of `model` (name[:tag], optionally namespace/name) in an Ollama store"""
+    name, _, tag = model.partition(':')
+    if '/' not in name:
+        name = f"library/{name}"
+    return os.path.join(models_dir, "models", "manifests", REGISTRY, name, tag or "latest")
+
+
+def model_files(models_dir, model):
+    """List (relative_path, sha256) of the manifest and blobs that make up `model`
+
+    Returns None when the model is not present in `models_dir`.
+    """
+    manifest = _manifest_path(models_dir, model)
+    if not os.path.exists(manifest):
+        return None
+    with open(manifest, 'r') as f:
+        spec = json.load(f)
+
+    files = [(os.path.relpath(manifest, models_dir), None)]
+    layers = [spec.get('config', {})] + spec.get('layers', [])
+    for layer in layers:
+        digest = layer.get('digest')
+        if not digest:
+            continue
+        algo, _, hexdigest = digest.partition(':')
+        files.append((os.path.join("models", "blobs", f"{algo}-{hexdigest}"), hexdigest))
+    return files
+
+
+def _stage_file(src, dst, sha256, stats, root, verified):
+    """Copy a single file unless `verified` records a copy with this digest, unchanged since"""
+    if sha256 is None:
+        sha256 = _sha256_file(src)
+    key = os.path.relpath(dst, root)
+    entry = verified.get(key)
+    if (entry and entry['sha256'] == sha256 and os.path.exists(dst)
+            and os.path.getsize(dst) == entry['size'] and os.path.getmtime(dst) == entry['mtime']):
+        stats['skipped'] += 1
+        return
+    verified.pop(key, None)
+    _copy_verified(src, dst, sha256)
+    verified[key] = {'sha256': sha256, 'size': os.path.getsize(dst), 'mtime': os.path.getmtime(dst)}
+    stats['copied'] += 1
+    stats['bytes'] += os.path.getsize(dst)
+
+
+def stage_models(src_models_dir, dst_models_dir, models, stats):
+    """Stage the manifests and blobs of `models` from one Ollama store to another
+
+    Returns the list of models that were not found in the source store.
+    """
+    verified = _load_verified(dst_models_dir)
+    try:
+        return _stage_models(src_models_dir, dst_models_dir, models, stats, verified)
+    finally:
+        _save_verified(dst_models_dir, verified)
+
+
+def _stage_models(src_models_dir, dst_models_dir, models, stats, verified):
+    missing = []
+    for model in models:
+        files = model_files(src_models_dir, model)
+        if files is None:
+            missing.append(model)
+            continue
+        for rel_path, sha256 in files:
+            src = os.path.join(src_models_dir, rel_path)
+            dst = os.path.join(dst_models_dir, rel_path)
+            if rel_path.startswith(os.path.join("models", "manifests")):
+                # Manifests are tiny and may be re-tagged: always refresh them
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(src, dst)
+                continue
+            _stage_file(src, dst, sha256, stats, dst_models_dir, verified)
+    return missing
+
+
+def stage(dest, models, sif=None, models_dir="output/ollama_models", sync_back=False):
+    """Stage the SIF and model blobs to `dest` and return a timing/size report
+
+    With sync_back=True the direction of the model copy is reversed (node-local
+    store -> shared store), used after a model had to be pulled on the node.
+    """
+    stats = {'copied': 0, 'skipped': 0, 'bytes': 0}
+    local_models_dir = os.path.join(dest, "ollama_models")
+    os.makedirs(local_models_dir, exist_ok=True)
+    start = time.time()
+
+    if sync_back:
+        missing = stage_models(local_models_dir, models_dir, models, stats)
+    else:
+        if sif:
+            verified = _load_verified(dest)
+            try:
+                _stage_file(sif, os.path.join(dest, os.path.basename(sif)), _sif_digest(sif), stats,
+                            dest, verified)
+            finally:
+                _save_verified(dest, verified)
+        missing = stage_models(models_dir, local_models_dir, models, stats)
+
+    elapsed = time.time() - start
+    return {
+        'direction': 'sync_back' if sync_back else 'stage_in',
+        'dest': dest,
+        'models': models,
+        'missing_models': missing,
+        'files_copied': stats['copied'],
+        'files_skipped': stats['skipped'],
+        'bytes_copied': stats['bytes'],
+        'seconds': elapsed,
+        'throughput_mb_s': stats['bytes'] / elapsed / 1e6 if elapsed > 0 else 0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage Ollama SIF and model blobs to node-local storage")
+    parser.add_argument('--dest', required=True, help="Node-local staging directory")
+    parser.add_argument('--model', action='append', required=True, help="Model to stage (repeatable)")
+    parser.add_argument('--sif', help="Container image to stage")
+    parser.add_argument('--models-dir', default="output/ollama_models", help="Shared Ollama model store")
+    parser.add_argument('--report', help="Write the staging report as JSON to this path")
+    parser.add_argument('--sync-back', action='store_true',
+                        help="Copy models from the node-local store back to the shared store")
+    args = parser.parse_args()
+
+    try:
+        report = stage(args.dest, args.model, sif=args.sif, models_dir=args.models_dir,
+                       sync_back=args.sync_back)
+    except (IOError, OSError) as e:
+        print(f"✗ Staging failed: {e}")
+        sys.exit(1)
+
+    print(f"✓ Staging ({report['direction']}) finished in {report['seconds']:.2f}s: "
+          f"{report['files_copied']} copied, {report['files_skipped']} skipped, "
+          f"{report['bytes_copied'] / 1e9:.2f} GB ({report['throughput_mb_s']:.1f} MB/s)")
+    if report['missing_models']:
+        print(f"  Models not in source store: {report['missing_models']}")
+
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or '.', exist_ok=True)
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Ollama server-parameter autotuner.
+
+Runs inside the Ollama SLURM job. For each candidate configuration it restarts
+only the `ollama serve` process (same allocation, same node), warms the model
+up, drives a fixed generation workload against it and records throughput and
+latency. The search is a coordinate descent over the knobs listed in the
+recipe (`service.autotune.search`), starting from the configured values.
+
+The report is written to output/autotune/<model>_<gpu_mem>gb.json and the
+throughput-optimal server environment to the file given by --best-env as
+`--env KEY=VALUE` apptainer arguments (one argument per line), which the job
+script reads back for the final server start.
+
+Usage:
+    python3 ollamaAutotune.py --spec output/scripts/ollama_autotune.json \
+        --sif <ollama.sif> --models-dir <models dir> --best-env <file>
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchStats import percentile
+from ollamaService import OLLAMA_SERVER_KNOBS, env_value
+
+OLLAMA_URL = "http://127.0.0.1:11434"
+
+
+def _post_json(path, payload, timeout):
+    """POST a JSON payload to the local Ollama server and decode the reply"""
+    req = urllib.request.Request(
+        f"{OLLAMA_URL}{path}",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def _wait_ready(timeout=120):
+    """Poll the server until it answers or `timeout` seconds pass"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{OLLAMA_URL}/api/version", timeout=2):
+                return True
+        except Exception:
+            time.sleep(1)
+    return False
+
+
+def gpu_memory_gb():
+    """Total memory of the first visible GPU in GB (0 if nvidia-smi is unavailable)"""
+    try:
+        out = subprocess.run(
+            ['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'],
+            capture_output=True, text=True, timeout=10).stdout.split()
+        return int(round(int(out[0]) / 1024)) if out else 0
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return 0
+
+
+class OllamaServer:
+    """An `ollama serve` process started through Apptainer with a given configuration"""
+
+    def __init__(self, sif, models_dir, config):
+        self.sif = sif
+        self.models_dir = models_dir
+        self.config = config
+        self.process = None
+
+    def env_args(self):
+        args = []
+        for knob, value in self.config.items():
+            args += ['--env', f"{OLLAMA_SERVER_KNOBS[knob]}={env_value(value)}"]
+        return args
+
+    def start(self):
+        cmd = (['apptainer', 'exec', '--nv'] + self.env_args() +
+               ['--bind', f"{self.models_dir}:/root/.ollama", self.sif, 'ollama', 'serve'])
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                        start_new_session=True)
+        return _wait_ready()
+
+    def stop(self):
+        if self.process is None:
+            return
+        os.killpg(self.process.pid, signal.SIGTERM)
+        try:
+            self.process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        self.process = None
+
+
+def run_workload(model, workload):
+    """Drive the target workload against the running server and summarise it"""
+    n_clients = workload.get('n_clients', 4)
+    n_requests = workload.get('n_requests', 4 * n_clients)
+    timeout = workload.get('timeout', 300)
+    payload = {
+        "model": model,
+        "prompt": workload.get('prompt', 'Explain the theory of relativity in simple terms.'),
+        "stream": False,
+        "options": {"num_predict": workload.get('num_predict', 128)},
+    }
+
+    def one_request(_):
+        start = time.time()
+        try:
+            reply = _post_json('/api/generate', payload, timeout)
+            return time.time() - start, reply.get('eval_count', 0), True
+        except Exception:
+            return time.time() - start, 0, False
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=n_clients) as pool:
+        results = list(pool.map(one_request, range(n_requests)))
+    wall = time.time() - start
+
+    latencies = [lat for lat, _, ok in results if ok]
+    tokens = sum(tok for _, tok, _ in results)
+    return {
+        'requests': n_requests,
+        'failed': sum(1 for _, _, ok in results if not ok),
+        'wall_time': wall,
+        'tokens_per_second': tokens / wall if wall > 0 else 0,
+        'requests_per_second': len(latencies) / wall if wall > 0 else 0,
+        'p50_latency': percentile(latencies, 50),
+        'p95_latency': percentile(latencies, 95),
+    }
+
+
+def evaluate(config, spec, sif, models_dir):
+    """Restart the server with `config`, warm the model up and measure the workload"""
+    print(f"[autotune] Trying {config}")
+    server = OllamaServer(sif, models_dir, config)
+    try:
+        if not server.start():
+            print("[autotune]   server did not become ready")
+            return None
+        warm_start = time.time()
+        _post_json('/api/generate', {"model": spec['model'], "prompt": "", "stream": False}, 600)
+        result = run_workload(spec['model'], spec.get('workload', {}))
+        result['load_time'] = time.time() - warm_start - result['wall_time']
+    except Exception as e:
+        print(f"[autotune]   trial failed: {e}")
+        return None
+    finally:
+        server.stop()
+    print(f"[autotune]   {result['tokens_per_second']:.1f} tok/s, "
+          f"p95={result['p95_latency']:.2f}s, failed={result['failed']}")
+    return result
+
+
+def _score(result, max_p95):
+    """Throughput objective; trials violating the latency bound or failing rank last"""
+    if result is None or result['failed'] > 0:
+        return -1.0
+    if max_p95 is not None and result['p95_latency'] > max_p95:
+        return -1.0
+    return result['tokens_per_second']
+
+
+def autotune(spec, sif, models_dir):
+    """Coordinate-descent search over the knobs in spec['search']"""
+    search = spec.get('search', {})
+    max_p95 = spec.get('max_p95_latency')
+    best = dict(spec.get('base', {}))
+    trials = []
+    seen = {}
+
+    def trial(config):
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen[key] = evaluate(config, spec, sif, models_dir)
+            trials.append({'config': dict(config), 'result': seen[key]})
+        return seen[key]
+
+    best_result = trial(best)
+    for _ in range(spec.get('rounds', 1)):
+        for knob, candidates in search.items():
+            for value in candidates:
+                candidate = dict(best, **{knob: value})
+                result = trial(candidate)
+                if _score(result, max_p95) > _score(best_result, max_p95):
+                    best, best_result = candidate, result
+
+    valid = [t for t in trials if t['result'] and t['result']['failed'] == 0]
+    best_latency = min(valid, key=lambda t: t['result']['p95_latency']) if valid else None
+    return {
+        'model': spec['model'],
+        'gpu_memory_gb': gpu_memory_gb(),
+        'workload': spec.get('workload', {}),
+        'max_p95_latency': max_p95,
+        'best_throughput': {'config': best, 'result': best_result},
+        'best_latency': best_latency,
+        'trials': trials,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search Ollama server parameters for a target workload")
+    parser.add_argument('--spec', required=True, help="Autotune spec written by setup_ollama")
+    parser.add_argument('--sif', required=True, help="Ollama container image")
+    parser.add_argument('--models-dir', required=True, help="Ollama model store to bind")
+    parser.add_argument('--best-env', required=True, help="Where to write the winning --env arguments")
+    args = parser.parse_args()
+
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+
+    report = autotune(spec, args.sif, args.models_dir)
+
+    os.makedirs("output/autotune", exist_ok=True)
+    model_tag = spec['model'].replace(':', '_').replace('/', '_')
+    report_path = f"output/autotune/{model_tag}_{report['gpu_memory_gb']}gb.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    best_server = OllamaServer(args.sif, args.models_dir, report['best_throughput']['config'])
+    with open(args.best_env, 'w') as f:
+        f.write("\n".join(best_server.env_args()) + "\n")
+
+    print(f"✓ Autotune report: {report_path}")
+    print(f"✓ Throughput-optimal config: {report['best_throughput']['config']}")
+    if report['best_latency']:
+        print(f"✓ Latency-optimal config:    {report['best_latency']['config']}")
@@ -2,6 +2,143 @@ import json
 import subprocess
 import os
 
+# Recipe knobs (job.service.ollama.<knob>) and the server environment variable each one sets
+OLLAMA_SERVER_KNOBS = {
+    'num_parallel': 'OLLAMA_NUM_PARALLEL',
+    'max_loaded_models': 'OLLAMA_MAX_LOADED_MODELS',
+    'context_length': 'OLLAMA_CONTEXT_LENGTH',
+    'kv_cache_type': 'OLLAMA_KV_CACHE_TYPE',
+    'flash_attention': 'OLLAMA_FLASH_ATTENTION',
+    'keep_alive': 'OLLAMA_KEEP_ALIVE',
+}
+
+
+def env_value(value):
+    """Render a recipe value the way Ollama expects it in the environment"""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+
+def service_models(service):
+    """All models the Ollama server must provide for this recipe, target model first"""
+    models = [service.get('model', 'llama2')]
+    for extra in [service.get('embedding_model')] + service.get('preload_models', []):
+        if extra and extra not in models:
+            models.append(extra)
+    return models
+
+
+def server_config(service):
+    """Resolve the Ollama server knobs from the recipe's service section
+
+    Only knobs set in the recipe are passed to the server, except the two
+    concurrency knobs: OLLAMA_NUM_PARALLEL defaults to n_clients (for RAG
+    runs to the largest rag.client_counts, so generations do not queue
+    inside Ollama unless the recipe asks for it) and
+    OLLAMA_MAX_LOADED_MODELS to the number of models the recipe needs
+    (usually 1; 2 for RAG with a separate embedding model), and
+    OLLAMA_KEEP_ALIVE, which defaults to -1 so that the models preloaded by
+    the orchestrator stay resident for the whole run. The knobs searched by
+    service.autotune are checked here too, before anything is submitted.
+    """
+    knobs = service.get('ollama', {})
+    unknown = set(knobs) - set(OLLAMA_SERVER_KNOBS)
+    if unknown:
+        raise ValueError(f"Unknown Ollama server knobs in recipe: {sorted(unknown)}")
+    unknown = set(service.get('autotune', {}).get('search', {})) - set(OLLAMA_SERVER_KNOBS)
+    if unknown:
+        raise ValueError(f"Unknown Ollama server knobs in service.autotune.search: {sorted(unknown)} "
+                         f"(expected some of {list(OLLAMA_SERVER_KNOBS)})")
+    num_parallel = service.get('n_clients', 1)
+    if service.get('type') == 'rag':
+        from ragBenchmark import rag_config
+        num_parallel = max(rag_config(service)['client_counts'])
+    config = {
+        'num_parallel': num_parallel,
+        'max_loaded_models': len(service_models(service)),
+        'keep_alive': '-1',
+    }
+    config.update(knobs)
+    return config
+
+
+def _env_args_block(config):
+    """Bash array with the apptainer --env arguments for a server configuration"""
+    lines = "\n".join(f"  --env {OLLAMA_SERVER_KNOBS[k]}={env_value(v)}" for k, v in config.items())
+    return f"OLLAMA_ENV_ARGS=(\n{lines}\n)"
+
+
+def _autotune_block(model):
+    """Job-script snippet that runs ollamaAutotune.py and restarts the server with the winner"""
+    return f"""
+#============================================
+# AUTOTUNE SERVER PARAMETERS
+#============================================
+
+echo "Autotuning Ollama server parameters for {model}..."
+kill $OLLAMA_PID
+wait $OLLAMA_PID 2>/dev/null
+module load Python
+if python3 ollamaAutotune.py \\
+    --spec output/scripts/ollama_autotune.json \\
+    --sif ${{OLLAMA_SIF}} \\
+    --models-dir ${{OLLAMA_MODELS_DIR}} \\
+    --best-env output/autotune/best_env_${{JOB_ID}}.txt; then
+    mapfile -t OLLAMA_ENV_ARGS < output/autotune/best_env_${{JOB_ID}}.txt
+else
+    echo "Autotune failed, restarting with the recipe configuration"
+fi
+
+echo "Restarting Ollama with: ${{OLLAMA_ENV_ARGS[*]}}"
+apptainer exec --nv \\
+  "${{OLLAMA_ENV_ARGS[@]}}" \\
+  --bind ${{OLLAMA_MODELS_DIR}}:/root/.ollama \\
+  ${{OLLAMA_SIF}} \\
+  ollama serve &
+OLLAMA_PID=$!
+sleep 15
+echo $NODE_IP > output/ollama_ip_${{JOB_ID}}.txt
+"""
+
+
+def _staging_block(models, stage_dir):
+    """Job-script snippet that stages the SIF and model blobs to node-local storage"""
+    model_args = " ".join(f"--model {m}" for m in models)
+    return f"""
+#============================================
+# NODE-LOCAL STAGING (SIF + MODEL BLOBS)
+#============================================
+
+echo "Staging Ollama image and model blobs to {stage_dir}..."
+module load Python
+mkdir -p {stage_dir}
+if python3 nodeStaging.py \\
+    --dest {stage_dir} \\
+    {model_args} \\
+    --sif output/containers/ollama_latest.sif \\
+    --models-dir output/ollama_models \\
+    --report output/logs/ollama_staging_${{JOB_ID}}.json; then
+    OLLAMA_SIF={stage_dir}/ollama_latest.sif
+    OLLAMA_MODELS_DIR={stage_dir}/ollama_models
+    echo "✓ Using node-local image and models from {stage_dir}"
+else
+    echo "Staging failed, falling back to shared filesystem"
+fi
+"""
+
+
+def _sync_back_block(stage_dir):
+    """Job-script snippet that copies a freshly pulled model ($MODEL) back to the shared store"""
+    return f"""        if [ "$OLLAMA_MODELS_DIR" != "output/ollama_models" ]; then
+            echo "Syncing $MODEL back to the shared model store..."
+            python3 nodeStaging.py --sync-back \\
+              --dest {stage_dir} \\
+              --model $MODEL \\
+              --models-dir output/ollama_models
+        fi
+"""
+
 
 def setup_ollama(data):
     # Estraggo parametri dalla ricetta
@@ -15,10 +152,33 @@ def setup_ollama(data):
     account = infrastructure.get('account', 'p200981')
     nodes = infrastructure.get('nodes', 1)
     mem_gb = infrastructure.get('mem_gb', 64)
+    # Independent Ollama jobs, each publishing its own ollama_ip_<jobid>.txt;
+    # the client service routes across all of them
+    replicas = infrastructure.get('replicas', 1)
     
     # Parametri del servizio
     model = service.get('model', 'llama2')
-    n_clients = service.get('n_clients', 1)  # For OLLAMA_NUM_PARALLEL
+    models = service_models(service)
+    models_str = " ".join(models)
+
+    # Ollama server knobs (OLLAMA_NUM_PARALLEL, context length, KV cache, ...)
+    config = server_config(service)
+    num_parallel = config['num_parallel']
+    env_args_block = _env_args_block(config)
+
+    # Optional autotune: search server knobs inside this allocation before serving
+    autotune = service.get('autotune', {})
+    autotune_enabled = autotune.get('enabled', False)
+    autotune_block = _autotune_block(model) if autotune_enabled else ""
+    # The orchestrator treats the IP file as "server is up": publish it only
+    # once the final configuration is serving
+    publish_ip = "" if autotune_enabled else "echo $NODE_IP > output/ollama_ip_${JOB_ID}.txt"
+
+    # Optional node-local staging of the SIF and model blobs (see nodeStaging.py)
+    stage_local = infrastructure.get('stage_local', False)
+    stage_dir = infrastructure.get('stage_dir', '/tmp/$USER/ollama_stage')
+    staging_block = _staging_block(models, stage_dir) if stage_local else ""
+    sync_back_block = _sync_back_block(stage_dir) if stage_local else ""
     
     job_script = f"""#!/bin/bash -l
 #SBATCH --time=01:00:00
@@ -41,7 +201,7 @@ NODE_NAME=$(hostname)
 JOB_ID=$SLURM_JOB_ID
 
 echo "Job ID: $JOB_ID running on $NODE_NAME ($NODE_IP)"
-echo $NODE_IP > output/ollama_ip_${{JOB_ID}}.txt
+{publish_ip}
 
 # Create persistent directory for Ollama models
 mkdir -p output/ollama_models
@@ -144,18 +304,21 @@ if [ ! -f output/containers/ollama_latest.sif ]; then
     apptainer pull output/containers/ollama_latest.sif docker://ollama/ollama:latest
 fi
 
+OLLAMA_SIF=output/containers/ollama_latest.sif
+OLLAMA_MODELS_DIR=output/ollama_models
+{staging_block}
 # Start Ollama with persistent model storage
 echo "Starting Ollama service..."
+{env_args_block}
 apptainer exec --nv \\
-  --env OLLAMA_NUM_PARALLEL={n_clients} \\
-  --env OLLAMA_MAX_LOADED_MODELS={n_clients} \\
-  --bind output/ollama_models:/root/.ollama \\
-  output/containers/ollama_latest.sif \\
+  "${{OLLAMA_ENV_ARGS[@]}}" \\
+  --bind ${{OLLAMA_MODELS_DIR}}:/root/.ollama \\
+  ${{OLLAMA_SIF}} \\
   ollama serve &
 
 OLLAMA_PID=$!
 echo "Ollama started with PID: $OLLAMA_PID"
-echo "Parallel requests enabled: {n_clients}"
+echo "Parallel requests enabled: {num_parallel}"
 
 # Wait for Ollama to be ready
 sleep 15
@@ -164,23 +327,25 @@ sleep 15
 # DOWNLOAD MODEL (IF NOT ALREADY PRESENT)
 #============================================
 
-echo "Checking if model {model} is available..."
-MODEL_CHECK=$(apptainer exec --nv \\
-  --bind output/ollama_models:/root/.ollama \\
-  output/containers/ollama_latest.sif \\
-  ollama list | grep -w "{model}" || echo "")
-
-if [ -z "$MODEL_CHECK" ]; then
-    echo "Model {model} not found. Downloading..."
-    apptainer exec --nv \\
-      --bind output/ollama_models:/root/.ollama \\
-      output/containers/ollama_latest.sif \\
-      ollama pull {model}
-    echo "✓ Model {model} downloaded successfully"
-else
-    echo "✓ Model {model} already exists, skipping download"
-fi
-
+for MODEL in {models_str}; do
+    echo "Checking if model $MODEL is available..."
+    MODEL_CHECK=$(apptainer exec --nv \\
+      --bind ${{OLLAMA_MODELS_DIR}}:/root/.ollama \\
+      ${{OLLAMA_SIF}} \\
+      ollama list | grep -w "$MODEL" || echo "")
+
+    if [ -z "$MODEL_CHECK" ]; then
+        echo "Model $MODEL not found. Downloading..."
+        apptainer exec --nv \\
+          --bind ${{OLLAMA_MODELS_DIR}}:/root/.ollama \\
+          ${{OLLAMA_SIF}} \\
+          ollama pull $MODEL
+        echo "✓ Model $MODEL downloaded successfully"
+{sync_back_block}    else
+        echo "✓ Model $MODEL already exists, skipping download"
+    fi
+done
+{autotune_block}
 #============================================
 # SUMMARY
 #============================================
@@ -197,9 +362,9 @@ echo "  Ollama:        http://${{NODE_IP}}:11434"
 echo "  Node Exporter: http://${{NODE_IP}}:9100"
 echo "  DCGM Exporter: http://${{NODE_IP}}:9400"
 echo ""
-echo "Model:         {model}"
-echo "Parallel reqs: {n_clients}"
-echo "Model Storage: $(pwd)/output/ollama_models"
+echo "Models:        {models_str}"
+echo "Server env:    ${{OLLAMA_ENV_ARGS[*]}}"
+echo "Model Storage: ${{OLLAMA_MODELS_DIR}}"
 echo ""
 echo "Target files:"
 echo "  - node_targets_${{JOB_ID}}.json"
@@ -215,8 +380,12 @@ wait $OLLAMA_PID $NODE_EXPORTER_PID $DCGM_PID
     job_name = job.get('name', 'ollama_service')
     print("received JSON:", data)
     print(f"Using job: name={job_name}")
-    print(f"Using infrastructure: partition={partition}, account={account}, nodes={nodes}, mem={mem_gb}GB")
-    print(f"Using service: model={model}")
+    print(f"Using infrastructure: partition={partition}, account={account}, nodes={nodes}, "
+          f"replicas={replicas}, mem={mem_gb}GB")
+    print(f"Using service: models={models}")
+    print(f"Using Ollama server config: {config}")
+    if stage_local:
+        print(f"Node-local staging enabled: {stage_dir}")
     
     # Ensure output directories exist
     os.makedirs("output/scripts", exist_ok=True)
@@ -228,16 +397,31 @@ wait $OLLAMA_PID $NODE_EXPORTER_PID $DCGM_PID
     with open("output/scripts/ollama_service.sh", "w") as f:
         f.write(job_script)
 
-    # Submit to SLURM
-    result = subprocess.run(
-        ["sbatch", "output/scripts/ollama_service.sh"], 
-        stdout=subprocess.PIPE, 
-        stderr=subprocess.PIPE, 
-        universal_newlines=True
-    )
-    
-    print(f"SLURM submission output: {result.stdout}")
-    if result.stderr:
-        print(f"SLURM submission errors: {result.stderr}")
+    if autotune_enabled:
+        os.makedirs("output/autotune", exist_ok=True)
+        spec = {
+            'model': model,
+            'base': config,
+            'search': autotune.get('search', {}),
+            'workload': dict({'n_clients': service.get('n_clients', 1)}, **autotune.get('workload', {})),
+            'max_p95_latency': autotune.get('max_p95_latency'),
+            'rounds': autotune.get('rounds', 1),
+        }
+        with open("output/scripts/ollama_autotune.json", "w") as f:
+            json.dump(spec, f, indent=2)
+        print(f"Autotune enabled: searching {list(spec['search'])}")
+
+    # Submit to SLURM, once per replica
+    for replica in range(replicas):
+        result = subprocess.run(
+            ["sbatch", "output/scripts/ollama_service.sh"], 
+            stdout=subprocess.PIPE, 
+            stderr=subprocess.PIPE, 
+            universal_newlines=True
+        )
+        
+        print(f"SLURM submission output (replica {replica + 1}/{replicas}): {result.stdout}")
+        if result.stderr:
+            print(f"SLURM submission errors: {result.stderr}")
     
     return result
@@ -5,8 +5,16 @@ import os
 import json
 import time
 import glob
+import re
 import requests
 import ollamaService
+import qdrantService
+import qdrantBenchmark
+import ragBenchmark
+import runRecords
+import requestTrace
+import prometheusExport
+import energyMetrics
 import client.clientServiceHandler as clientServiceHandler
 import client.testClientService as testClientService
 
@@ -14,6 +22,10 @@ print("All packages imported successfully.")
 
 """ 
 Ollama Orchestrator - Deploy server and client services. Launches the monitoring script (Prometheus)
+
+The recipe's job.service.type selects the flow: "inference" (default, Ollama +
+client service), "vector_search" (Qdrant + vector-search workload driver) or
+"rag" (Ollama + Qdrant, end-to-end retrieval-augmented generation).
 """
 
 
@@ -89,90 +101,154 @@ def prepare_monitoring():
         print("Waiting 10 seconds for Prometheus to fully initialize...")
         time.sleep(10)
 
-if __name__ == "__main__":
-    # Accept: orch.py <json_file_path> [--no-monitoring]
-    if len(sys.argv) < 2:
-        print("Usage: python3 orch.py <json_file_path> [--no-monitoring]")
-        sys.exit(1)
+def _with_tag(model):
+    """Normalise a model name to name:tag as Ollama reports it"""
+    return model if ':' in model else f"{model}:latest"
 
-    # Simple flag parsing: look for --no-monitoring anywhere
-    no_monitoring = '--no-monitoring' in sys.argv[1:]
 
-    # First non-flag argument is the JSON file
-    json_file_path = None
-    for a in sys.argv[1:]:
-        if not a.startswith('-'):
-            json_file_path = a
-            break
+def wait_for_ollama(models, max_wait=3600, replicas=1):
+    """Wait until `replicas` Ollama servers are up and list all `models` on disk
 
-    if json_file_path is None:
-        print("Error: recipe json file path not provided")
-        sys.exit(1)
-    
-    try:
-        with open(json_file_path, 'r') as f:
-            data = json.load(f)
-        print(f"Loaded recipe: {json_file_path}")
-    except FileNotFoundError:
-        print(f"Error: File '{json_file_path}' not found")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON: {e}")
-        sys.exit(1)
-    
-    if not no_monitoring:
-        prepare_monitoring()
-    else:
-        print("Skipping monitoring setup (--no-monitoring)")
-
-    # Deploy Ollama server
-    print("Deploying Ollama server...")
-    ollamaService.setup_ollama(data)
-
-    # Wait for Ollama to be ready with model loaded
-    print("\nWaiting for Ollama server to be ready with model loaded...")
-    max_wait = 3600  
+    /api/tags only shows pulled models, not loaded ones: loading is done
+    separately by preload_models(). Returns the ready server IPs (oldest
+    first) or None on timeout.
+    """
+    print(f"\nWaiting for {replicas} Ollama server(s) to be ready with model available...")
+    wanted = {_with_tag(m) for m in models}
+    ready = []
     elapsed = 0
     
     while elapsed < max_wait:
-        ollama_files = glob.glob('output/ollama_ip_*.txt')
+        ollama_files = sorted(glob.glob('output/ollama_ip_*.txt'), key=os.path.getmtime)
         
-        if ollama_files:
-            with open(sorted(ollama_files, key=os.path.getmtime)[-1], 'r') as f:
+        for path in ollama_files:
+            with open(path, 'r') as f:
                 ollama_ip = f.read().strip()
+            if ollama_ip in ready:
+                continue
             
             try:
-                # Check if Ollama has models loaded
                 response = requests.get(f"http://{ollama_ip}:11434/api/tags", timeout=5)
                 
                 if response.status_code == 200:
-                    models = response.json().get('models', [])
-                    if models:
+                    available = {m.get('name') for m in response.json().get('models', [])}
+                    if wanted <= available:
                         print(f"  Ollama ready at {ollama_ip}:11434")
-                        print(f"  Loaded models: {[m.get('name') for m in models]}")
-                        break
+                        print(f"  Models on disk: {sorted(available)}")
+                        ready.append(ollama_ip)
                     else:
-                        print(f"  Waiting for models to load... ({elapsed}s)")
+                        print(f"  {ollama_ip}: waiting for models {sorted(wanted - available)}... ({elapsed}s)")
                 else:
-                    print(f"  Ollama responding but not ready... ({elapsed}s)")
-            except:
-                print(f"  Waiting for Ollama... ({elapsed}s)")
-        else:
+                    print(f"  {ollama_ip}: responding but not ready... ({elapsed}s)")
+            except Exception:
+                print(f"  Waiting for Ollama at {ollama_ip}... ({elapsed}s)")
+        
+        if len(ready) >= replicas:
+            return ready
+        if not ollama_files:
             print(f"  Waiting for ollama_ip file... ({elapsed}s)")
         
         time.sleep(10)
         elapsed += 10
     
-    if elapsed >= max_wait:
-        print("ERROR: Ollama server timeout - no models loaded")
-        sys.exit(1)
+    return None
 
-    print("Deploying client service...")
-    clientServiceHandler.setup_client_service(data)
 
-    # Wait for client service to be ready
+def _api_keep_alive(keep_alive):
+    """keep_alive for the API body: a bare number ("-1", "300") must be sent as a number
+
+    OLLAMA_KEEP_ALIVE accepts "-1", but a string in a request body is parsed as
+    a Go duration ("5m", "24h") and one without a unit is rejected with HTTP 400.
+    """
+    try:
+        return int(keep_alive)
+    except (TypeError, ValueError):
+        return keep_alive
+
+
+def _preload_one(ollama_ip, model, keep_alive, max_wait):
+    """Load one model on one server; returns (generate response, /api/ps entry, seconds) or None"""
+    base_url = f"http://{ollama_ip}:11434"
+    start = time.time()
+    try:
+        response = requests.post(
+            f"{base_url}/api/generate",
+            json={"model": model, "keep_alive": _api_keep_alive(keep_alive), "stream": False},
+            timeout=max_wait
+        )
+        if response.status_code != 200:
+            print(f"  Preload of {model} on {ollama_ip} failed: HTTP {response.status_code}: {response.text}")
+            return None
+    except Exception as e:
+        print(f"  Preload of {model} on {ollama_ip} failed: {e}")
+        return None
+
+    running = None
+    while running is None and time.time() - start < max_wait:
+        try:
+            ps = requests.get(f"{base_url}/api/ps", timeout=5).json().get('models', [])
+        except Exception:
+            ps = []
+        running = next((m for m in ps if m.get('name') == _with_tag(model)), None)
+        if running is None:
+            time.sleep(1)
+    if running is None:
+        print(f"  {model} never appeared in /api/ps of {ollama_ip}")
+        return None
+    return response.json(), running, time.time() - start
+
+
+def preload_models(ollama_ips, models, keep_alive="-1", max_wait=1800):
+    """Load `models` into memory on every server and pin them before measurement starts
+
+    Sends an empty generate request with `keep_alive` for each model, then
+    polls /api/ps (running models) until it is resident. The load time of
+    each model (on the first server, with every server's time under
+    `replicas` when there are several) is written to
+    output/preload_metrics.json and pushed to Pushgateway as
+    `model_load_seconds`. Returns the metrics, or None if a model could not
+    be loaded.
+    """
+    if isinstance(ollama_ips, str):
+        ollama_ips = [ollama_ips]
+    pushgateway_ip = testClientService._load_pushgateway_ip()
+    metrics = {}
+    
+    for model in models:
+        print(f"Preloading {model} (keep_alive={keep_alive}) on {len(ollama_ips)} server(s)...")
+        start = time.time()
+        loaded = {}
+        for ollama_ip in ollama_ips:
+            result = _preload_one(ollama_ip, model, keep_alive, max_wait)
+            if result is None:
+                return None
+            loaded[ollama_ip] = result
+
+        generate, running, load_seconds = loaded[ollama_ips[0]]
+        metrics[model] = {
+            'load_seconds': load_seconds,
+            'reported_load_duration': generate.get('load_duration', 0) / 1e9,
+            'keep_alive': keep_alive,
+            'size_vram': running.get('size_vram', 0),
+            'expires_at': running.get('expires_at'),
+            'timestamp': start,
+        }
+        if len(ollama_ips) > 1:
+            metrics[model]['replicas'] = {ip: seconds for ip, (_, _, seconds) in loaded.items()}
+        testClientService.push_gauge("model_load_seconds", load_seconds, {"model": model},
+                                     f"preload_{model}", pushgateway_ip)
+        print(f"  ✓ {model} resident after {load_seconds:.2f}s "
+              f"({running.get('size_vram', 0) / 1e9:.1f} GB in VRAM)")
+    
+    os.makedirs("output", exist_ok=True)
+    with open("output/preload_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+    return metrics
+
+
+def wait_for_client_service(max_wait=3600):
+    """Wait until the client service answers /health; returns its IP or None on timeout"""
     print("\nWaiting for client service to be ready...")
-    max_wait = 3600 
     elapsed = 0
     
     while elapsed < max_wait:
@@ -191,7 +267,7 @@ if __name__ == "__main__":
                     # Give extra time for Flask to fully initialize
                     print("Waiting 10 more seconds for Flask to stabilize...")
                     time.sleep(10)
-                    break
+                    return client_ip
             except Exception as e:
                 print(f"  Waiting... ({elapsed}s) - {e}")
         else:
@@ -200,24 +276,315 @@ if __name__ == "__main__":
         time.sleep(5)
         elapsed += 5
     
-    if elapsed >= max_wait:
+    return None
+
+
+def wait_for_qdrant(max_wait=3600):
+    """Wait until Qdrant answers /readyz; returns its IP or None on timeout"""
+    print("\nWaiting for Qdrant to be ready...")
+    elapsed = 0
+    
+    while elapsed < max_wait:
+        qdrant_files = glob.glob('output/qdrant_ip_*.txt')
+        
+        if qdrant_files:
+            with open(sorted(qdrant_files, key=os.path.getmtime)[-1], 'r') as f:
+                qdrant_ip = f.read().strip()
+            
+            try:
+                if requests.get(f"http://{qdrant_ip}:6333/readyz", timeout=3).status_code == 200:
+                    print(f"✓ Qdrant ready at {qdrant_ip}:6333")
+                    return qdrant_ip
+            except Exception as e:
+                print(f"  Waiting for Qdrant... ({elapsed}s) - {e}")
+        else:
+            print(f"  Waiting for qdrant_ip file... ({elapsed}s)")
+        
+        time.sleep(5)
+        elapsed += 5
+    
+    return None
+
+
+def export_hardware_metrics(run_dir, settle=15):
+    """Pull the run's GPU and node metrics from Prometheus into the run directory
+
+    Waits `settle` seconds first so the last samples of the run are scraped.
+    Failures are reported but do not fail the benchmark.
+    """
+    try:
+        url = prometheusExport.prometheus_url()
+    except FileNotFoundError:
+        print("Prometheus not deployed: skipping hardware metrics export")
+        return None
+    time.sleep(settle)
+    try:
+        return prometheusExport.export_run(run_dir, prometheusExport.PrometheusClient(url))
+    except Exception as e:
+        print(f"WARNING: hardware metrics export failed: {e}")
+        return None
+
+
+def capacity_plan(service, models_dir="output/capacity_models"):
+    """Size the deployment from a fitted USL model (metrics_collection/capacity_model.py)
+
+    Uses service.capacity.target_rps and the model stored for service.model;
+    returns the sizing dict, or None when there is no target or no usable
+    model (none fitted, fitted on tokens/s, or without a finite peak).
+    """
+    capacity = service.get('capacity', {})
+    target = capacity.get('target_rps')
+    # File name as written by capacity_model.py for a series keyed by model
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', service.get('model', 'llama2')).strip('_')
+    path = os.path.join(models_dir, f"{slug}.json")
+    if not target or not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        model = json.load(f)
+    # target_rps is in requests/s; a model fitted with --metric tokens is in tokens/s
+    metric = model.get('metric', 'requests')
+    if metric != 'requests':
+        print(f"Capacity model {path} was fitted on {metric}/s, not requests/s: not sizing the deployment")
+        return None
+    x_max = model.get('x_max')
+    if x_max is None:
+        x_max = model.get('amdahl', {}).get('x_limit')
+    if not x_max or x_max <= 0:
+        print(f"Capacity model {path} has no finite peak throughput: not sizing the deployment")
+        return None
+    utilization = capacity.get('utilization', 0.8)
+    nodes = int(-(-target // (utilization * x_max)))
+    plan = {
+        'target_rps': target,
+        'utilization': utilization,
+        'x_max': x_max,
+        'n_star': model.get('n_star'),
+        'nodes': nodes,
+        'model_file': path,
+    }
+    print(f"Capacity model: peak {x_max:.2f} req/s per node at N*={model.get('n_star')}; "
+          f"{target} req/s needs {nodes} node(s) at {utilization:.0%} of peak")
+    return plan
+
+
+def run_inference(data):
+    """Deploy Ollama and the client service, then run the generation benchmark"""
+    service = data.get('job', {}).get('service', {})
+
+    # Size the deployment from a previously fitted capacity model, if any;
+    # an explicit infrastructure.replicas wins
+    plan = capacity_plan(service)
+    infrastructure = data.setdefault('job', {}).setdefault('infrastructure', {})
+    if plan is not None and 'replicas' not in infrastructure:
+        infrastructure['replicas'] = plan['nodes']
+    replicas = infrastructure.get('replicas', 1)
+
+    # Deploy Ollama server(s)
+    print(f"Deploying {replicas} Ollama server(s)...")
+    ollamaService.setup_ollama(data)
+
+    # Wait for every replica to be up with the target model(s) pulled
+    model_name = service.get('model', 'llama2')
+    preload = ollamaService.service_models(service)
+    ollama_ips = wait_for_ollama(preload, replicas=replicas)
+    if ollama_ips is None:
+        print("ERROR: Ollama server timeout - model not available")
+        sys.exit(1)
+
+    # Load the model(s) into GPU memory before anything is measured
+    keep_alive = ollamaService.server_config(service)['keep_alive']
+    preload_metrics = preload_models(ollama_ips, preload, keep_alive)
+    if preload_metrics is None:
+        print("ERROR: Model preload failed")
+        sys.exit(1)
+
+    print("Deploying client service...")
+    clientServiceHandler.setup_client_service(data)
+
+    if wait_for_client_service() is None:
         print("ERROR: Client service timeout")
         sys.exit(1)
 
     print("\nDeployment complete. Starting test queries...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "--user", "idna", "charset_normalizer"])
     
     # Extract parameters from recipe
-    model_name = data.get('job', {}).get('service', {}).get('model', 'llama2')
-    n_clients = data.get('job', {}).get('service', {}).get('n_clients', 1)
-    n_requests_per_client = data.get('job', {}).get('service', {}).get('n_requests_per_client', 5)
+    n_clients = service.get('n_clients', 1)
+    n_requests_per_client = service.get('n_requests_per_client', 5)
     
     print(f"Model: {model_name}")
     print(f"Clients: {n_clients}")
     print(f"Requests per client: {n_requests_per_client}")
 
-    # Run benchmark with correct parameters
-    testClientService.run_benchmark(n_clients, n_requests_per_client, model_name)
+    # Optional profiling window over the harness itself while the benchmark runs
+    client_profile = service.get('client_profile')
+    if client_profile:
+        testClientService.start_client_profile(**client_profile)
+
+    # Run benchmark with correct parameters, or replay a captured one for an A/B comparison
+    replay = service.get('replay')
+    if replay:
+        result = testClientService.run_replay(replay['capture'],
+                                              speed=replay.get('speed', 1.0),
+                                              max_workers=replay.get('max_workers', 256),
+                                              model=replay.get('model'),
+                                              limit=replay.get('limit'))
+    else:
+        result = testClientService.run_benchmark(n_clients, n_requests_per_client, model_name,
+                                                 routing=service.get('routing'),
+                                                 deadline=service.get('admission', {}).get('deadline'),
+                                                 policy=service.get('request_policy'),
+                                                 workload=service.get('workload'),
+                                                 cache=service.get('cache'),
+                                                 options=service.get('options'),
+                                                 capture=service.get('capture', False))
+    if 'prefix_cache' in result:
+        # Cache reuse depends on the number of slots the server keeps a prefix in
+        result['prefix_cache']['num_parallel'] = ollamaService.server_config(service)['num_parallel']
+
+    # Optional embedding workload, reported next to the generation results
+    embedding = service.get('embedding')
+    if embedding:
+        # Embedding batches are routed over every replica: normalise by all their GPUs
+        gpus = data.get('job', {}).get('infrastructure', {}).get('gpus', 1) * len(ollama_ips)
+        result['embedding'] = testClientService.run_embedding_benchmark(
+            model=service.get('embedding_model', 'nomic-embed-text'),
+            batch_sizes=embedding.get('batch_sizes', [1, 8, 32, 128]),
+            input_words=embedding.get('input_words', 128),
+            n_clients=embedding.get('n_clients', 1),
+            n_batches=embedding.get('n_batches', 10),
+            gpus=gpus)
+
+    # Optional multi-turn chat sessions, reported per turn as the context grows
+    chat = service.get('chat')
+    if chat:
+        result['chat'] = testClientService.run_chat_benchmark(
+            model=model_name,
+            n_clients=chat.get('n_clients', n_clients),
+            n_turns=chat.get('n_turns', 8),
+            user_words=chat.get('user_words', 64),
+            reply_tokens=chat.get('reply_tokens', 128),
+            num_ctx=chat.get('num_ctx'))
+
+    # Optional long-context sweep: prompt length x client count
+    prefill = service.get('prefill_sweep')
+    if prefill:
+        result['prefill_sweep'] = testClientService.run_prefill_sweep(
+            model=model_name,
+            lengths=prefill.get('lengths', [512, 1024, 2048, 4096, 8192]),
+            clients=prefill.get('clients', [1, 2, 4, 8]),
+            n_requests=prefill.get('n_requests', 2),
+            reply_tokens=prefill.get('reply_tokens', 16),
+            gpu_memory_gb=prefill.get('gpu_memory_gb'))
+
+    # Typed per-request records plus a run manifest (see runRecords.py)
+    if 'results' in result:
+        records = runRecords.records_from_results(result['results'], preload)
+        summary = {k: v for k, v in result.items() if k not in ('results', 'embedding', 'chat', 'prefill_sweep')}
+        chat_turns = result['chat'].get('turns') if 'chat' in result else None
+        prefill_surface = result['prefill_sweep'].get('surface') if 'prefill_sweep' in result else None
+        run_dir = runRecords.write_run(records, data, preload,
+                                       extra={'summary': summary, 'embedding': result.get('embedding'),
+                                              'chat': chat_turns, 'prefill_surface': prefill_surface,
+                                              'capacity_plan': plan})
+        print(f"✓ Request records saved to {run_dir}")
+        requestTrace.export_run(run_dir)
+        if export_hardware_metrics(run_dir) is not None:
+            energy = energyMetrics.run_energy(run_dir)
+            print(f"✓ Energy: {energy['energy_j'] or 0:.0f} J over {energy['n_gpus']} GPU(s), "
+                  f"{energy['tokens_per_joule'] or 0:.3f} tokens/J, "
+                  f"{energy['tokens_per_gpu_hour'] or 0:.0f} tokens/GPU-hour, "
+                  f"{energy['energy_per_request_j'] or 0:.1f} J/request")
+
+    return result
+
+
+def run_vector_search(data):
+    """Deploy Qdrant and run the vector-search workload against it"""
+    print("Deploying Qdrant service...")
+    qdrantService.setup_qdrant(data)
+
+    qdrant_ip = wait_for_qdrant()
+    if qdrant_ip is None:
+        print("ERROR: Qdrant service timeout")
+        sys.exit(1)
+
+    return qdrantBenchmark.run_vector_benchmark(qdrant_ip, data.get('job', {}).get('service', {}))
+
+
+def run_rag(data):
+    """Deploy Ollama and Qdrant side by side, then run the RAG pipeline benchmark"""
+    service = data.get('job', {}).get('service', {})
+
+    print("Deploying Ollama server...")
+    ollamaService.setup_ollama(data)
+    print("Deploying Qdrant service...")
+    qdrantService.setup_qdrant(data)
+
+    # Generator and embedding model must both be resident before timing starts
+    models = ollamaService.service_models(service)
+    ollama_ips = wait_for_ollama(models)
+    if ollama_ips is None:
+        print("ERROR: Ollama server timeout - model not available")
+        sys.exit(1)
+
+    keep_alive = ollamaService.server_config(service)['keep_alive']
+    ollama_ip = ollama_ips[0]
+    if preload_models(ollama_ip, models, keep_alive) is None:
+        print("ERROR: Model preload failed")
+        sys.exit(1)
+
+    qdrant_ip = wait_for_qdrant()
+    if qdrant_ip is None:
+        print("ERROR: Qdrant service timeout")
+        sys.exit(1)
+
+    return ragBenchmark.run_rag_benchmark(ollama_ip, qdrant_ip, service)
+
+
+if __name__ == "__main__":
+    # Accept: orch.py <json_file_path> [--no-monitoring]
+    if len(sys.argv) < 2:
+        print("Usage: python3 orch.py <json_file_path> [--no-monitoring]")
+        sys.exit(1)
+
+    # Simple flag parsing: look for --no-monitoring anywhere
+    no_monitoring = '--no-monitoring' in sys.argv[1:]
+
+    # First non-flag argument is the JSON file
+    json_file_path = None
+    for a in sys.argv[1:]:
+        if not a.startswith('-'):
+            json_file_path = a
+            break
+
+    if json_file_path is None:
+        print("Error: recipe json file path not provided")
+        sys.exit(1)
+    
+    try:
+        with open(json_file_path, 'r') as f:
+            data = json.load(f)
+        print(f"Loaded recipe: {json_file_path}")
+    except FileNotFoundError:
+        print(f"Error: File '{json_file_path}' not found")
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON: {e}")
+        sys.exit(1)
+    
+    if not no_monitoring:
+        prepare_monitoring()
+    else:
+        print("Skipping monitoring setup (--no-monitoring)")
+
+    service_type = data.get('job', {}).get('service', {}).get('type', 'inference')
+    if service_type == 'vector_search':
+        run_vector_search(data)
+    elif service_type == 'rag':
+        run_rag(data)
+    else:
+        run_inference(data)
     
     # Cancel all jobs for current user
     # print("\n" + "="*60)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Export the hardware metrics of a benchmark run from Prometheus.
+
+For a run saved by runRecords.py, the time window (first request start to
+last request end) and the SLURM job ids in its manifest select range
+queries against the Prometheus HTTP API for:
+
+- gpu_util     DCGM_FI_DEV_GPU_UTIL      (%)
+- fb_used      DCGM_FI_DEV_FB_USED       (MiB of GPU memory used)
+- sm_clock     DCGM_FI_DEV_SM_CLOCK      (MHz)
+- power        DCGM_FI_DEV_POWER_USAGE   (W)
+- cpu_busy     1 - idle fraction of node_cpu_seconds_total, per node
+
+The series are stored next to the run's request records:
+
+- hardware.npz          per metric `<name>_t` (timestamps, shared by its
+                        series) and `<name>` (n_series x n_steps, NaN where
+                        Prometheus had no sample)
+- hardware_labels.json  per metric, the label set of every row
+
+Responses can be recorded (--record DIR) and replayed (--replay DIR), and
+--serve DIR runs a local stand-in of the query_range endpoint that answers
+from recorded responses, so the exporter can be tested without a cluster.
+
+Usage:
+    python3 prometheusExport.py output/runs/<run_id> [--prometheus http://ip:9090] [--step 5]
+    python3 prometheusExport.py --serve DIR [--port 9090]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import requests
+
+import runRecords
+
+# name -> PromQL template; {jobs} is a regex of the run's SLURM job ids
+QUERIES = {
+    'gpu_util': 'DCGM_FI_DEV_GPU_UTIL{{slurm_job_id=~"{jobs}"}}',
+    'fb_used': 'DCGM_FI_DEV_FB_USED{{slurm_job_id=~"{jobs}"}}',
+    'sm_clock': 'DCGM_FI_DEV_SM_CLOCK{{slurm_job_id=~"{jobs}"}}',
+    'power': 'DCGM_FI_DEV_POWER_USAGE{{slurm_job_id=~"{jobs}"}}',
+    'cpu_busy': '1 - avg by (instance, node, node_type, slurm_job_id) '
+                '(rate(node_cpu_seconds_total{{mode="idle",slurm_job_id=~"{jobs}"}}[{rate_window}]))',
+}
+
+
+def prometheus_url():
+    """Prometheus base URL from the monitoring stack's IP file"""
+    with open("output/prometheus_data/prometheus_ip.txt", 'r') as f:
+        return f"http://{f.read().strip()}:9090"
+
+
+def _response_key(query, start, end, step):
+    return hashlib.sha256(f"{query}|{start:.3f}|{end:.3f}|{step}".encode('utf-8')).hexdigest()[:20]
+
+
+class PrometheusClient:
+    """query_range against a live Prometheus, optionally recording or replaying responses"""
+
+    def __init__(self, base_url=None, record_dir=None, replay_dir=None, timeout=30):
+        self.base_url = base_url
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.timeout = timeout
+
+    def query_range(self, query, start, end, step):
+        """Return the `result` list of a range query (matrix of series)"""
+        key = _response_key(query, start, end, step)
+        if self.replay_dir:
+            with open(os.path.join(self.replay_dir, f"{key}.json"), 'r') as f:
+                body = json.load(f)
+        else:
+            response = requests.get(f"{self.base_url}/api/v1/query_range", params={
+                'query': query, 'start': f"{start:.3f}", 'end': f"{end:.3f}", 'step': step,
+            }, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+            if self.record_dir:
+                os.makedirs(self.record_dir, exist_ok=True)
+                with open(os.path.join(self.record_dir, f"{key}.json"), 'w') as f:
+                    json.dump(body, f)
+        if body.get('status') != 'success':
+            raise RuntimeError(f"Prometheus query failed: {body.get('error', body)}")
+        return body['data']['result']
+
+
+def run_window(records, padding):
+    """(start, end) of a run: first request sent to last response, padded on both sides"""
+    ok = records['latency'] > 0
+    starts = records['start'][ok] if ok.any() else records['start']
+    ends = (records['start'] + records['latency'])[ok] if ok.any() else starts
+    return float(starts.min()) - padding, float(ends.max()) + padding
+
+
+def to_columns(result, start, end, step):
+    """Prometheus matrix -> (timestamps, values[n_series, n_steps], labels)
+
+    Range query samples fall on start + k * step, so every series is placed
+    on that common grid.
+    """
+    timestamps = np.arange(start, end + step / 2, step, dtype=np.float64)
+    values = np.full((len(result), len(timestamps)), np.nan)
+    labels = []
+    for row, series in enumerate(result):
+        labels.append(series.get('metric', {}))
+        if series.get('values'):
+            samples = np.array(series['values'], dtype=np.float64)
+            idx = np.rint((samples[:, 0] - start) / step).astype(np.int64)
+            keep = (idx >= 0) & (idx < len(timestamps))
+            values[row, idx[keep]] = samples[keep, 1]
+    return timestamps, values, labels
+
+
+def export_run(run_dir, client, step=5, padding=30, rate_window='1m'):
+    """Pull every metric in QUERIES for the run and save it next to its records"""
+    records, manifest = runRecords.load_run(run_dir)
+    if len(records) == 0:
+        raise ValueError(f"{run_dir}: run has no requests")
+    job_ids = sorted({job for ids in manifest.get('jobs', {}).values() for job in ids})
+    if not job_ids:
+        raise ValueError(f"{run_dir}: manifest lists no SLURM job ids")
+
+    # Align the window to the step so recorded responses replay with the same keys
+    start, end = run_window(records, padding)
+    start, end = np.floor(start / step) * step, np.ceil(end / step) * step
+    jobs = "|".join(job_ids)
+
+    arrays, labels = {}, {}
+    for name, template in QUERIES.items():
+        query = template.format(jobs=jobs, rate_window=rate_window)
+        timestamps, values, series_labels = to_columns(client.query_range(query, start, end, step), start, end, step)
+        arrays[f"{name}_t"] = timestamps
+        arrays[name] = values
+        labels[name] = series_labels
+        print(f"  {name}: {len(series_labels)} series × {len(timestamps)} steps")
+
+    tmp_path = os.path.join(run_dir, "hardware.tmp.npz")
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, os.path.join(run_dir, "hardware.npz"))
+    with open(os.path.join(run_dir, "hardware_labels.json"), 'w') as f:
+        json.dump({'start': start, 'end': end, 'step': step, 'job_ids': job_ids,
+                   'queries': {name: t.format(jobs=jobs, rate_window=rate_window) for name, t in QUERIES.items()},
+                   'series': labels}, f, indent=2)
+    print(f"✓ Hardware metrics saved to {run_dir}/hardware.npz")
+    return arrays, labels
+
+
+def serve_recorded(record_dir, port=9090):
+    """Local stand-in for /api/v1/query_range that answers from recorded responses"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/api/v1/query_range':
+                self.send_error(404)
+                return
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            key = _response_key(params.get('query', ''), float(params.get('start', 0)),
+                                float(params.get('end', 0)), int(float(params.get('step', 0))))
+            path = os.path.join(record_dir, f"{key}.json")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    body, status = f.read(), 200
+            else:
+                body, status = json.dumps({'status': 'success', 'data': {'resultType': 'matrix', 'result': []}}).encode(), 200
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"Serving recorded Prometheus responses from {record_dir} on port {port}")
+    ThreadingHTTPServer(('0.0.0.0', port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Prometheus hardware metrics for a benchmark run")
+    parser.add_argument('run_dir', nargs='?', help="Run directory (output/runs/<run_id>)")
+    parser.add_argument('--prometheus', help="Prometheus base URL (default: from output/prometheus_data)")
+    parser.add_argument('--step', type=int, default=5, help="Range query step in seconds (default: 5)")
+    parser.add_argument('--padding', type=float, default=30, help="Seconds added around the run window")
+    parser.add_argument('--record', help="Save every Prometheus response to this directory")
+    parser.add_argument('--replay', help="Answer queries from responses recorded in this directory")
+    parser.add_argument('--serve', help="Run a stand-in Prometheus serving responses recorded in this directory")
+    parser.add_argument('--port', type=int, default=9090)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_recorded(args.serve, args.port)
+        sys.exit(0)
+    if not args.run_dir:
+        parser.error("run_dir is required unless --serve is given")
+
+    url = args.prometheus if (args.prometheus or args.replay) else prometheus_url()
+    client = PrometheusClient(url, record_dir=args.record, replay_dir=args.replay)
+    started = time.time()
+    export_run(args.run_dir, client, args.step, args.padding)
+    print(f"  ({time.time() - started:.1f}s)")
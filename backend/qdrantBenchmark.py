@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Vector-search workload driver for Qdrant.
+
+Talks to any Qdrant-compatible HTTP API (the deployed service, or a local
+`qdrant/qdrant` container as a stand-in) and measures:
+
+- bulk upsert throughput (vectors/s)
+- collection build time (upload start until the collection is indexed/green)
+- kNN query QPS and latency percentiles at each configured concurrency
+- recall@k of every concurrency point against exact neighbours (qdrantGroundTruth)
+
+Usage:
+    python3 qdrantBenchmark.py <recipe.json> [--host localhost] [--port 6333]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from benchStats import latency_summary
+from qdrantGroundTruth import QDRANT_DISTANCES, ground_truth, recall_at_k
+from vectorDataset import open_vectors, upload_pipelined
+
+DEFAULTS = {
+    'collection': 'benchmark',
+    'dataset': None,        # {"base": <.npy/.fvecs/.bvecs>, "queries": <same>}; synthetic if unset
+    'dim': 128,             # synthetic data only
+    'n_vectors': None,      # rows of the dataset to load (synthetic default: 100000)
+    'distance': 'Cosine',
+    'batch_size': 1000,
+    'upload_in_flight': 4,
+    'n_queries': 1000,
+    'k': 10,
+    'concurrency': [1, 4, 16],
+    'hnsw': {'m': 16, 'ef_construct': 100},
+    'search_params': {},
+    'seed': 42,
+    'build_timeout': 3600,
+}
+
+
+def vector_search_config(service):
+    """Merge the recipe's service.vector_search section over the defaults"""
+    config = dict(DEFAULTS)
+    config.update(service.get('vector_search', {}))
+    return config
+
+
+class QdrantClient:
+    """Minimal Qdrant REST client (one requests.Session per thread)"""
+
+    def __init__(self, host, port=6333, timeout=60):
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _call(self, method, path, **kwargs):
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {path}: HTTP {response.status_code}: {response.text[:200]}")
+        return response.json().get('result')
+
+    def recreate_collection(self, name, dim, distance, hnsw):
+        self.session.delete(f"{self.base_url}/collections/{name}", timeout=self.timeout)
+        return self._call('PUT', f"/collections/{name}", json={
+            "vectors": {"size": dim, "distance": distance},
+            "hnsw_config": hnsw,
+        })
+
+    def collection_info(self, name):
+        return self._call('GET', f"/collections/{name}")
+
+    def upsert(self, name, ids, vectors, wait=True, payloads=None):
+        points = [{"id": int(i), "vector": v} for i, v in zip(ids, vectors)]
+        if payloads is not None:
+            for point, payload in zip(points, payloads):
+                point["payload"] = payload
+        return self._call('PUT', f"/collections/{name}/points?wait={'true' if wait else 'false'}",
+                          json={"points": points})
+
+    def search(self, name, vector, k, params=None, with_payload=False):
+        body = {"vector": vector, "limit": k, "with_payload": with_payload}
+        if params:
+            body["params"] = params
+        return self._call('POST', f"/collections/{name}/points/search", json=body)
+
+
+def synthetic_dataset(n, dim, seed, data_dir="output/datasets"):
+    """Memory-mapped Gaussian base vectors, generated once per (n, dim, seed)"""
+    path = os.path.join(data_dir, f"synthetic_{n}x{dim}_s{seed}.npy")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        rng = np.random.default_rng(seed)
+        out = np.lib.format.open_memmap(path + ".tmp", mode='w+', dtype=np.float32, shape=(n, dim))
+        for start in range(0, n, 100000):
+            stop = min(start + 100000, n)
+            out[start:stop] = rng.standard_normal((stop - start, dim), dtype=np.float32)
+        out.flush()
+        del out
+        os.replace(path + ".tmp", path)
+    return np.load(path, mmap_mode='r')
+
+
+def load_dataset(config):
+    """Return memory-mapped (base, queries) from the recipe dataset or synthetic data"""
+    dataset = config.get('dataset')
+    if not dataset:
+        n = config['n_vectors'] or 100000
+        base = synthetic_dataset(n, config['dim'], config['seed'])
+        queries = np.random.default_rng(config['seed'] + 1).standard_normal(
+            (config['n_queries'], config['dim']), dtype=np.float32)
+        return base, queries
+
+    base = open_vectors(dataset['base'])
+    if config['n_vectors']:
+        base = base[:config['n_vectors']]
+    queries = np.asarray(open_vectors(dataset['queries'])[:config['n_queries']], dtype=np.float32)
+    return base, queries
+
+
+def load_collection(client, config, base):
+    """Create the collection, stream the base vectors in and wait for indexing"""
+    name = config['collection']
+    client.recreate_collection(name, base.shape[1], config['distance'], config['hnsw'])
+
+    start = time.time()
+    upload = upload_pipelined(client, name, base, config['batch_size'], config['upload_in_flight'])
+
+    # The collection is "built" once the optimizer has indexed it (status green)
+    info = client.collection_info(name)
+    while info.get('status') != 'green' and time.time() - start < config['build_timeout']:
+        time.sleep(1)
+        info = client.collection_info(name)
+
+    return {
+        'n_vectors': upload['uploaded'],
+        'dim': base.shape[1],
+        'upload_wall_seconds': upload['wall_seconds'],
+        'upsert_vectors_per_second': upload['vectors_per_second'],
+        'upload_in_flight': upload['in_flight'],
+        'batch_latency': upload['batch_latency'],
+        'build_seconds': time.time() - start,
+        'status': info.get('status'),
+        'indexed_vectors_count': info.get('indexed_vectors_count'),
+    }
+
+
+def run_queries(client, config, queries, concurrency, true_ids=None):
+    """Run all queries with `concurrency` parallel clients
+
+    Returns QPS, latency percentiles and, when exact neighbours are given,
+    recall@k of the returned ids.
+    """
+    name, k, params = config['collection'], config['k'], config['search_params']
+
+    def one_query(vector):
+        start = time.time()
+        try:
+            hits = client.search(name, vector, k, params)
+            return time.time() - start, [hit['id'] for hit in hits]
+        except Exception as e:
+            print(f"  Query failed: {e}")
+            return None, None
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_query, queries.tolist()))
+    wall = time.time() - start
+
+    latencies = [lat for lat, _ in results if lat is not None]
+    point = {
+        'concurrency': concurrency,
+        'n_queries': len(queries),
+        'failed': len(queries) - len(latencies),
+        'wall_seconds': wall,
+        'qps': len(latencies) / wall if wall > 0 else 0,
+        'latency': latency_summary(latencies),
+    }
+    if true_ids is not None:
+        point[f"recall@{k}"] = recall_at_k([ids for _, ids in results], true_ids, k)
+    return point
+
+
+def run_vector_benchmark(host, service, port=6333):
+    """Full vector-search benchmark: load, build, then query at each concurrency"""
+    config = vector_search_config(service)
+    client = QdrantClient(host, port)
+    base, queries = load_dataset(config)
+
+    print(f"\nVECTOR SEARCH BENCHMARK ({host}:{port})")
+    print(f"  Collection: {config['collection']} ({base.shape[0]} x {base.shape[1]}, {config['distance']})")
+    print(f"  Queries: {len(queries)} (k={config['k']}) at concurrency {config['concurrency']}\n")
+
+    build = load_collection(client, config, base)
+    print(f"✓ Upserted {build['n_vectors']} vectors at {build['upsert_vectors_per_second']:.0f} vec/s, "
+          f"collection built in {build['build_seconds']:.1f}s (status={build['status']})")
+
+    # Exact neighbours for recall (cached per dataset and metric)
+    gt_start = time.time()
+    true_ids = ground_truth(base, queries, config['k'], QDRANT_DISTANCES[config['distance']])
+    print(f"✓ Ground truth ready in {time.time() - gt_start:.1f}s")
+
+    recall_key = f"recall@{config['k']}"
+    points = []
+    for concurrency in config['concurrency']:
+        point = run_queries(client, config, queries, concurrency, true_ids)
+        points.append(point)
+        print(f"  concurrency={concurrency:<4} QPS={point['qps']:.1f}  "
+              f"p50={point['latency']['p50'] * 1000:.1f}ms  p95={point['latency']['p95'] * 1000:.1f}ms  "
+              f"p99={point['latency']['p99'] * 1000:.1f}ms  {recall_key}={point[recall_key]:.4f}  "
+              f"failed={point['failed']}")
+
+    result = {'config': config, 'build': build, 'queries': points, 'timestamp': time.time()}
+
+    os.makedirs("output/results", exist_ok=True)
+    result_path = f"output/results/vector_search_{int(result['timestamp'])}.json"
+    with open(result_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\n✓ Results saved to {result_path}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the vector-search benchmark against a Qdrant endpoint")
+    parser.add_argument('recipe', help="Recipe JSON with a job.service.vector_search section")
+    parser.add_argument('--host', default='localhost', help="Qdrant host (default: localhost)")
+    parser.add_argument('--port', type=int, default=6333, help="Qdrant HTTP port (default: 6333)")
+    args = parser.parse_args()
+
+    with open(args.recipe, 'r') as f:
+        recipe = json.load(f)
+
+    result = run_vector_benchmark(args.host, recipe.get('job', {}).get('service', {}), args.port)
+    sys.exit(0 if all(p['failed'] == 0 for p in result['queries']) else 1)
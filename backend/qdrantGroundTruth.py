@@ -0,0 +1,157 @@
+"""
+Exact k-nearest-neighbour ground truth for recall measurement.
+
+Scores are computed with batched NumPy matrix products over chunks of the
+base vectors, so the base can be a memory-mapped array far larger than RAM.
+Chunks are spread over a thread pool (the matrix products release the GIL)
+and each worker keeps a running top-k that is merged at the end.
+
+All metrics are expressed as "higher is better" scores:
+
+- cosine: q.b / (|q| |b|)
+- dot:    q.b
+- l2:     2 q.b - |b|^2  (= |q|^2 - |q - b|^2, same ranking as -|q - b|^2)
+
+Results are cached in output/ground_truth/ per (dataset, queries, metric), so
+they are computed once and reused for any k up to the cached one.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+METRICS = ('cosine', 'dot', 'l2')
+
+# Qdrant collection distance -> ground-truth metric
+QDRANT_DISTANCES = {'Cosine': 'cosine', 'Dot': 'dot', 'Euclid': 'l2'}
+
+
+def _normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _merge_topk(ids_a, scores_a, ids_b, scores_b, k):
+    """Keep the k best of two (ids, scores) candidate sets, row by row"""
+    ids = np.concatenate([ids_a, ids_b], axis=1)
+    scores = np.concatenate([scores_a, scores_b], axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ids = np.take_along_axis(ids, keep, axis=1)
+        scores = np.take_along_axis(scores, keep, axis=1)
+    return ids, scores
+
+
+def _scan_range(base, queries, k, metric, lo, hi, chunk_size):
+    """Running top-k of `queries` against base rows [lo, hi)"""
+    n_queries = queries.shape[0]
+    best_ids = np.empty((n_queries, 0), dtype=np.int64)
+    best_scores = np.empty((n_queries, 0), dtype=np.float32)
+
+    for start in range(lo, hi, chunk_size):
+        stop = min(start + chunk_size, hi)
+        chunk = np.ascontiguousarray(base[start:stop], dtype=np.float32)
+        if metric == 'cosine':
+            chunk = _normalize(chunk)
+        scores = queries @ chunk.T
+        if metric == 'l2':
+            scores = 2.0 * scores - np.einsum('ij,ij->i', chunk, chunk)[None, :]
+
+        kk = min(k, stop - start)
+        top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        chunk_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids, best_scores = _merge_topk(best_ids, best_scores, top + start, chunk_scores, k)
+
+    return best_ids, best_scores
+
+
+def exact_knn(base, queries, k, metric='cosine', chunk_size=16384, n_workers=None):
+    """Exact top-k neighbours of each query in `base`
+
+    base may be any 2-D array-like supporting row slicing (e.g. np.memmap).
+    Returns (ids, scores), both shaped (n_queries, k) and sorted best first.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+    n_base = base.shape[0]
+    k = min(k, n_base)
+    queries = np.asarray(queries, dtype=np.float32)
+    if metric == 'cosine':
+        queries = _normalize(queries)
+
+    n_workers = n_workers or os.cpu_count() or 1
+    # One contiguous range of whole chunks per task
+    n_chunks = max(1, -(-n_base // chunk_size))
+    per_worker = -(-n_chunks // n_workers) * chunk_size
+    ranges = [(lo, min(lo + per_worker, n_base)) for lo in range(0, n_base, per_worker)]
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        partials = list(pool.map(
+            lambda r: _scan_range(base, queries, k, metric, r[0], r[1], chunk_size), ranges))
+
+    ids, scores = partials[0]
+    for part_ids, part_scores in partials[1:]:
+        ids, scores = _merge_topk(ids, scores, part_ids, part_scores, k)
+
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def _fingerprint(dataset, queries):
+    """Cache key for a (dataset, queries) pair
+
+    Datasets backed by a file (path string or np.memmap) are identified by
+    path, size, mtime and the shape of the mapped view (so a row subset of a
+    file gets its own entry); in-memory arrays by a hash of their bytes.
+    """
+    digest = hashlib.sha256()
+    path = dataset if isinstance(dataset, str) else getattr(dataset, 'filename', None)
+    if path:
+        st = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode('utf-8'))
+        digest.update(str(getattr(dataset, 'shape', '')).encode('utf-8'))
+    else:
+        digest.update(np.ascontiguousarray(dataset).tobytes())
+    digest.update(np.ascontiguousarray(queries, dtype=np.float32).tobytes())
+    return digest.hexdigest()[:24]
+
+
+def ground_truth(base, queries, k, metric='cosine', cache_dir="output/ground_truth", dataset=None, **kwargs):
+    """Cached exact_knn(): reuse a stored result with at least k neighbours
+
+    `dataset` identifies the base for caching (defaults to `base` itself,
+    which works for file-backed memmaps). Returns the neighbour ids (n_queries, k).
+    """
+    key = _fingerprint(dataset if dataset is not None else base, queries)
+    cache_path = os.path.join(cache_dir, f"{key}_{metric}.npz")
+
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if cached['ids'].shape[1] >= k:
+            return cached['ids'][:, :k]
+
+    ids, scores = exact_knn(base, queries, k, metric, **kwargs)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + ".tmp.npz"
+    np.savez(tmp_path, ids=ids, scores=scores)
+    os.replace(tmp_path, cache_path)
+    return ids
+
+
+def recall_at_k(found_ids, true_ids, k):
+    """Mean recall@k of search results against exact neighbours
+
+    found_ids may be ragged (a list of per-query id lists, possibly shorter
+    than k); missing entries simply count as misses.
+    """
+    n_queries = len(true_ids)
+    found = np.full((n_queries, k), -1, dtype=np.int64)
+    for row, ids in enumerate(found_ids):
+        ids = list(ids or [])[:k]
+        found[row, :len(ids)] = ids
+    true = np.asarray(true_ids)[:, :k]
+    hits = (found[:, :, None] == true[:, None, :]).any(axis=2).sum(axis=1)
+    return float(hits.mean() / k) if n_queries else 0.0
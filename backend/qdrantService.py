@@ -1,62 +1,177 @@
 import json
 import subprocess
+import os
 
-"""
-TODO: Daniele will parse the jsonData
-TODO: Daniele will setup the qudrant sbatch script.
-
-some of the sbatch params must come from data, being a sub-object of the recipe,
-as well as some other params that specific to qudrant.
 
-ATTENZIONE DEVI PULLARE QDRANT AL POSTO DI OLLAMA
-"""
 def setup_qdrant(data):
-    job_script = f"""#!/bin/bash
-#SBATCH --job-name=ollama_service
-#SBATCH --nodes=1
-#SBATCH --ntasks=1
-#SBATCH --cpus-per-task=4
-#SBATCH --mem-per-cpu=4G
-#SBATCH --time=00:40:00
+    """Deploy a Qdrant vector database on SLURM for service.type "vector_search" or "rag"
+
+    Mirrors setup_ollama: the sbatch script is generated from the recipe,
+    the node IP is published in output/qdrant_ip_<jobid>.txt and the node is
+    registered with Prometheus through node_exporter.
+    """
+    # Extract parameters from recipe
+    job = data.get('job', {})
+    infrastructure = job.get('infrastructure', {})
+    service = job.get('service', {})
+    qdrant = service.get('qdrant', {})
+
+    # SLURM parameters from recipe
+    # A RAG recipe's infrastructure targets the GPU node; Qdrant can be sent elsewhere
+    partition = qdrant.get('partition', infrastructure.get('partition', 'cpu'))
+    time = infrastructure.get('time', '01:00:00')
+    account = infrastructure.get('account', 'p200981')
+    cpus = infrastructure.get('cpus', 8)
+    mem_gb = infrastructure.get('mem_gb', 32)
+
+    # Qdrant parameters
+    version = qdrant.get('version', 'latest')
+    # Node-local storage by default: a benchmark should not measure the parallel filesystem
+    storage_dir = qdrant.get('storage_dir', '/tmp/$USER/qdrant_storage_${JOB_ID}')
+    http_port = qdrant.get('http_port', 6333)
+    grpc_port = qdrant.get('grpc_port', 6334)
+    # Seconds to wait for /readyz before giving the allocation back
+    ready_timeout = qdrant.get('ready_timeout', 600)
+    qdrant_sif = f"output/containers/qdrant_{version}.sif"
+
+    job_script = f"""#!/bin/bash -l
+#SBATCH --job-name=qdrant_service
+#SBATCH --partition={partition}
 #SBATCH --qos=default
-#SBATCH --partition=cpu
-#SBATCH --account=p200981
-#SBATCH --output=qdrant_service.out
-#SBATCH --error=qdrant_service.err
+#SBATCH --time={time}
+#SBATCH --account={account}
+#SBATCH --nodes=1
+#SBATCH --ntasks-per-node=1
+#SBATCH --cpus-per-task={cpus}
+#SBATCH --mem={mem_gb}G
+#SBATCH --output=output/logs/qdrant_service_%j.out
+#SBATCH --error=output/logs/qdrant_service_%j.err
 
+module load env/release/2024.1
 module load Apptainer
 
 NODE_IP=$(hostname -i)
-echo $NODE_IP > /home/users/{data['username']}/qdrant_ip.txt
+NODE_NAME=$(hostname)
+JOB_ID=$SLURM_JOB_ID
+
+echo "Job ID: $JOB_ID running on $NODE_NAME ($NODE_IP)"
+
+#============================================
+# CLEANUP FUNCTION (removes targets when job ends)
+#============================================
 
-# Pull Ollama image if not already present
-if [ ! -f ollama.sif ]; then
-    apptainer pull ollama.sif docker://ollama/ollama:latest
+cleanup() {{
+  echo "Job $JOB_ID terminating, cleaning up..."
+  rm -f output/prometheus_assets/node_targets_qdrant_${{JOB_ID}}.json
+  rm -rf {storage_dir}
+  echo "✓ Cleanup completed"
+}}
+
+trap cleanup EXIT
+
+#============================================
+# START NODE EXPORTER FOR HARDWARE METRICS
+#============================================
+
+if [ ! -f output/containers/node_exporter.sif ]; then
+    echo "Pulling Node Exporter container..."
+    apptainer pull output/containers/node_exporter.sif docker://prom/node-exporter:latest
 fi
 
-# Start Ollama service on all interfaces
-apptainer exec --nv --env OLLAMA_HOST=0.0.0.0:11434 ollama.sif ollama serve &
+apptainer exec output/containers/node_exporter.sif /bin/node_exporter &
+NODE_EXPORTER_PID=$!
 
-# Capture PID
-OLLAMA_PID=$!
+cat > output/prometheus_assets/node_targets_qdrant_${{JOB_ID}}.json <<EOF
+[
+  {{
+    "targets": ["${{NODE_IP}}:9100"],
+    "labels": {{
+      "job": "node_exporter",
+      "node": "${{NODE_NAME}}",
+      "node_type": "qdrant",
+      "slurm_job_id": "${{JOB_ID}}"
+    }}
+  }}
+]
+EOF
+echo "✓ Node Exporter registered: node_targets_qdrant_${{JOB_ID}}.json"
+
+#============================================
+# START QDRANT SERVICE
+#============================================
+
+echo "Setting up Qdrant service..."
+if [ ! -f {qdrant_sif} ]; then
+    mkdir -p output/containers
+    apptainer pull {qdrant_sif} docker://qdrant/qdrant:{version}
+fi
 
-# Wait for service to start
-sleep 10
+mkdir -p {storage_dir}
+apptainer exec \\
+  --pwd /qdrant \\
+  --bind {storage_dir}:/qdrant/storage \\
+  --env QDRANT__SERVICE__HTTP_PORT={http_port} \\
+  --env QDRANT__SERVICE__GRPC_PORT={grpc_port} \\
+  --env QDRANT__TELEMETRY_DISABLED=true \\
+  {qdrant_sif} \\
+  /qdrant/qdrant &
 
-# Preload mistral model
-apptainer exec --nv --env OLLAMA_HOST=0.0.0.0:11434 ollama.sif ollama pull mistral
+QDRANT_PID=$!
+echo "Qdrant started with PID: $QDRANT_PID"
 
-# Keep Ollama alive
-wait $OLLAMA_PID
+# Publish the IP only once the HTTP API answers
+WAITED=0
+until curl -sf http://localhost:{http_port}/readyz > /dev/null; do
+    if [ $WAITED -ge {ready_timeout} ] || ! kill -0 $QDRANT_PID 2>/dev/null; then
+        echo "ERROR: Qdrant not ready after ${{WAITED}}s, giving up" >&2
+        kill $QDRANT_PID $NODE_EXPORTER_PID 2>/dev/null
+        exit 1
+    fi
+    sleep 2
+    WAITED=$((WAITED + 2))
+done
+echo $NODE_IP > output/qdrant_ip_${{JOB_ID}}.txt
+
+echo ""
+echo "========================================="
+echo "   QDRANT SERVICE READY (Job $JOB_ID)"
+echo "========================================="
+echo "Node:          ${{NODE_NAME}}"
+echo "IP:            ${{NODE_IP}}"
+echo "Qdrant HTTP:   http://${{NODE_IP}}:{http_port}"
+echo "Qdrant gRPC:   ${{NODE_IP}}:{grpc_port}"
+echo "Storage:       {storage_dir}"
+echo "========================================="
+echo ""
+
+# Keep all services alive
+wait $QDRANT_PID $NODE_EXPORTER_PID
 """
-    
-    print("received JSON:", data) #print statements will be shown in .out file
-    with open("ollama_service.sh", "w") as f:
+
+    # Debug logging
+    print("received JSON:", data)
+    print(f"Using infrastructure: partition={partition}, account={account}, cpus={cpus}, mem={mem_gb}GB")
+    print(f"Using Qdrant: version={version}, storage={storage_dir}")
+
+    # Ensure output directories exist
+    os.makedirs("output/scripts", exist_ok=True)
+    os.makedirs("output/logs", exist_ok=True)
+    os.makedirs("output/containers", exist_ok=True)
+    os.makedirs("output/prometheus_assets", exist_ok=True)
+
+    with open("output/scripts/qdrant_service.sh", "w") as f:
         f.write(job_script)
 
     # Submit to SLURM
-    result = subprocess.run(["sbatch", "ollama_service.sh"], capture_output=True, text=True)
-    print("SLURM submission output:", result.stdout)
-    print("SLURM submission error:", result.stderr)
+    result = subprocess.run(
+        ["sbatch", "output/scripts/qdrant_service.sh"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
 
+    print(f"SLURM submission output: {result.stdout}")
+    if result.stderr:
+        print(f"SLURM submission errors: {result.stderr}")
 
+    return result
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+End-to-end retrieval-augmented generation (RAG) benchmark.
+
+Drives the chain embed query (Ollama /api/embed) -> vector search (Qdrant)
+-> generate with the retrieved context (Ollama /api/generate) against the
+deployed services, for each configured client count. Every request records
+per-stage latency:
+
+- embed:   wall time of the /api/embed call
+- search:  wall time of the Qdrant search
+- prefill: prompt_eval_duration reported by Ollama for the generation
+- decode:  eval_duration reported by Ollama for the generation
+- queue:   the rest of the generate call's wall time (generate - prefill -
+           decode): waiting for a free slot in Ollama (OLLAMA_NUM_PARALLEL)
+           plus HTTP overhead
+- e2e:     wall time of the whole chain
+
+For each stage the report gives percentiles per client count and the client
+count at which its p50 first exceeds `saturation_factor` x its single-client
+p50, and by at least `saturation_min_seconds` (so that a near-zero baseline,
+typical of queue, does not saturate on noise); the stage that gets there
+first is reported as saturating first.
+
+Usage:
+    python3 ragBenchmark.py <recipe.json> --ollama <host> --qdrant <host>
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchStats import latency_summary
+from qdrantBenchmark import QdrantClient
+
+STAGES = ('embed', 'search', 'prefill', 'decode', 'queue', 'e2e')
+
+DEFAULTS = {
+    'collection': 'rag',
+    'corpus': None,             # text file, one document per line; synthetic if unset
+    'n_documents': 2000,        # synthetic corpus size
+    'queries': None,            # list of questions; derived from the corpus if unset
+    'embed_batch_size': 32,
+    'top_k': 3,
+    'client_counts': [1, 2, 4, 8],
+    'n_requests_per_client': 5,
+    'num_predict': 128,
+    'saturation_factor': 1.5,
+    'saturation_min_seconds': 0.05,
+    'seed': 42,
+}
+
+TOPICS = ['GPU scheduling', 'parallel filesystems', 'MPI collectives', 'container runtimes',
+          'vector databases', 'tokenizers', 'KV caches', 'batch schedulers', 'InfiniBand',
+          'mixed precision', 'checkpointing', 'job arrays', 'memory bandwidth', 'quantization']
+
+
+def rag_config(service):
+    """Merge the recipe's service.rag section over the defaults"""
+    config = dict(DEFAULTS)
+    config.update(service.get('rag', {}))
+    return config
+
+
+def load_corpus(config):
+    """Documents from the configured corpus file, or a reproducible synthetic corpus"""
+    if config['corpus']:
+        with open(config['corpus'], 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    rng = random.Random(config['seed'])
+    docs = []
+    for i in range(config['n_documents']):
+        topic, other = rng.sample(TOPICS, 2)
+        docs.append(f"Note {i}: on the cluster, {topic} interacts with {other}; "
+                    f"tuning {topic} changed throughput by {rng.randint(2, 60)} percent "
+                    f"in run {rng.randint(100, 999)}.")
+    return docs
+
+
+def make_queries(config, n):
+    """Questions to ask, cycled from the recipe list or generated from the topics"""
+    if config['queries']:
+        return [config['queries'][i % len(config['queries'])] for i in range(n)]
+    rng = random.Random(config['seed'] + 1)
+    return [f"How does {rng.choice(TOPICS)} affect throughput on the cluster?" for _ in range(n)]
+
+
+class RagPipeline:
+    """Embed -> search -> generate against one Ollama server and one Qdrant instance"""
+
+    def __init__(self, ollama_host, qdrant_host, model, embedding_model, config):
+        self.ollama_url = f"http://{ollama_host}:11434"
+        self.qdrant = QdrantClient(qdrant_host)
+        self.model = model
+        self.embedding_model = embedding_model
+        self.config = config
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def embed(self, inputs):
+        response = self.session.post(f"{self.ollama_url}/api/embed",
+                                     json={"model": self.embedding_model, "input": inputs}, timeout=300)
+        response.raise_for_status()
+        return response.json()['embeddings']
+
+    def ingest(self, docs):
+        """Embed the corpus and load it into a fresh collection; returns ingest timings"""
+        batch_size = self.config['embed_batch_size']
+        start = time.time()
+        embed_time = 0.0
+        dim = None
+
+        for offset in range(0, len(docs), batch_size):
+            batch = docs[offset:offset + batch_size]
+            t0 = time.time()
+            vectors = self.embed(batch)
+            embed_time += time.time() - t0
+            if dim is None:
+                # The collection dimension is whatever the embedding model produces
+                dim = len(vectors[0])
+                self.qdrant.recreate_collection(self.config['collection'], dim, 'Cosine', {})
+            self.qdrant.upsert(self.config['collection'], range(offset, offset + len(batch)), vectors,
+                               payloads=[{"text": doc} for doc in batch])
+        return {'documents': len(docs), 'dim': dim, 'embed_seconds': embed_time,
+                'ingest_seconds': time.time() - start}
+
+    def ask(self, question):
+        """Run one RAG request and return its per-stage timings"""
+        start = time.time()
+        vector = self.embed(question)[0]
+        t_embed = time.time()
+        hits = self.qdrant.search(self.config['collection'], vector, self.config['top_k'], with_payload=True)
+        t_search = time.time()
+
+        context = "\n".join(hit['payload']['text'] for hit in hits)
+        prompt = f"Answer using only this context:\n{context}\n\nQuestion: {question}\nAnswer:"
+        response = self.session.post(f"{self.ollama_url}/api/generate", json={
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"num_predict": self.config['num_predict']},
+        }, timeout=600)
+        response.raise_for_status()
+        reply = response.json()
+        end = time.time()
+        prefill = reply.get('prompt_eval_duration', 0) / 1e9
+        decode = reply.get('eval_duration', 0) / 1e9
+
+        return {
+            'embed': t_embed - start,
+            'search': t_search - t_embed,
+            'generate': end - t_search,
+            'prefill': prefill,
+            'decode': decode,
+            'queue': max(end - t_search - prefill - decode, 0.0),
+            'prompt_tokens': reply.get('prompt_eval_count', 0),
+            'output_tokens': reply.get('eval_count', 0),
+            'e2e': end - start,
+        }
+
+
+def run_level(pipeline, questions, n_clients, n_requests):
+    """n_clients parallel clients, each sending n_requests sequential RAG requests"""
+    def client_worker(client_id):
+        records = []
+        for i in range(n_requests):
+            question = questions[(client_id * n_requests + i) % len(questions)]
+            try:
+                records.append(pipeline.ask(question))
+            except Exception as e:
+                print(f"  [Client {client_id}] request {i} failed: {e}")
+        return records
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=n_clients) as pool:
+        records = [r for client in pool.map(client_worker, range(n_clients)) for r in client]
+    wall = time.time() - start
+
+    return {
+        'n_clients': n_clients,
+        'requests': n_clients * n_requests,
+        'failed': n_clients * n_requests - len(records),
+        'wall_seconds': wall,
+        'requests_per_second': len(records) / wall if wall > 0 else 0,
+        'stages': {stage: latency_summary([r[stage] for r in records]) for stage in STAGES},
+    }
+
+
+def saturation(levels, factor, min_seconds=0.0):
+    """Client count at which each stage's p50 first exceeds factor x its baseline p50 (and by min_seconds)"""
+    baseline = levels[0]['stages']
+    result = {}
+    for stage in STAGES:
+        base_p50 = baseline[stage]['p50']
+        threshold = max(factor * base_p50, base_p50 + min_seconds)
+        result[stage] = next((lvl['n_clients'] for lvl in levels
+                              if lvl['stages'][stage]['p50'] > threshold), None)
+    # Among the per-request stages (not e2e), the one that saturates at the fewest clients;
+    # ties go to the stage whose latency grew the most at the highest load
+    candidates = [s for s in STAGES if s != 'e2e' and result[s] is not None]
+    growth = {s: levels[-1]['stages'][s]['p50'] / baseline[s]['p50'] if baseline[s]['p50'] > 0 else float('inf')
+              for s in candidates}
+    first = min(candidates, key=lambda s: (result[s], -growth.get(s, 0)), default=None)
+    return result, first
+
+
+def run_rag_benchmark(ollama_host, qdrant_host, service):
+    """Ingest the corpus, then sweep client counts over the RAG chain"""
+    config = rag_config(service)
+    model = service.get('model', 'llama2')
+    embedding_model = service.get('embedding_model', 'nomic-embed-text')
+    pipeline = RagPipeline(ollama_host, qdrant_host, model, embedding_model, config)
+
+    print(f"\nRAG BENCHMARK (Ollama {ollama_host}, Qdrant {qdrant_host})")
+    print(f"  Generator: {model}   Embeddings: {embedding_model}   top_k={config['top_k']}")
+    print(f"  Client counts: {config['client_counts']} x {config['n_requests_per_client']} requests\n")
+
+    docs = load_corpus(config)
+    ingest = pipeline.ingest(docs)
+    print(f"✓ Ingested {ingest['documents']} documents (dim={ingest['dim']}) in {ingest['ingest_seconds']:.1f}s")
+
+    questions = make_queries(config, max(config['client_counts']) * config['n_requests_per_client'])
+    levels = []
+    for n_clients in config['client_counts']:
+        level = run_level(pipeline, questions, n_clients, config['n_requests_per_client'])
+        levels.append(level)
+        stages = level['stages']
+        print(f"  clients={n_clients:<4} rps={level['requests_per_second']:.2f}  " +
+              "  ".join(f"{s}={stages[s]['p50'] * 1000:.0f}/{stages[s]['p95'] * 1000:.0f}ms" for s in STAGES) +
+              f"  failed={level['failed']}")
+
+    saturation_points, first = saturation(levels, config['saturation_factor'], config['saturation_min_seconds'])
+    print(f"\nSaturation (p50 > {config['saturation_factor']}x single-client): {saturation_points}")
+    print(f"Stage saturating first: {first}")
+
+    result = {'config': config, 'model': model, 'embedding_model': embedding_model, 'ingest': ingest,
+              'levels': levels, 'saturation_clients': saturation_points, 'first_saturated_stage': first,
+              'timestamp': time.time()}
+    os.makedirs("output/results", exist_ok=True)
+    result_path = f"output/results/rag_{int(result['timestamp'])}.json"
+    with open(result_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"✓ Results saved to {result_path}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the RAG pipeline benchmark")
+    parser.add_argument('recipe', help="Recipe JSON with job.service.type == 'rag'")
+    parser.add_argument('--ollama', default='localhost', help="Ollama host")
+    parser.add_argument('--qdrant', default='localhost', help="Qdrant host")
+    args = parser.parse_args()
+
+    with open(args.recipe, 'r') as f:
+        recipe = json.load(f)
+
+    result = run_rag_benchmark(args.ollama, args.qdrant, recipe.get('job', {}).get('service', {}))
+    sys.exit(0 if all(level['failed'] == 0 for level in result['levels']) else 1)
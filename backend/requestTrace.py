@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Per-request timeline tracing.
+
+The client service stamps every request with monotonic timestamps
+(time.perf_counter) at four points:
+
+- scheduled   the client decided to send it (for a client's first request:
+              when its worker was submitted to the thread pool, so time
+              spent waiting for a free thread shows up as queueing)
+- dispatched  the HTTP request is about to be sent
+- first_byte  the response headers arrived
+- completed   the response body was read
+
+plus the worker (thread) that sent it and the connection it used (local TCP
+port). Monotonic stamps are mapped to Unix time through one anchor taken at
+import, so they line up with the other run records and Prometheus samples.
+Recording costs a few clock reads and one dict per request.
+
+From a run directory written by runRecords.py this module exports:
+
+- trace.json        Chrome trace / Perfetto timeline: one track per worker,
+                    queued / request / waiting / receiving spans and
+                    in-flight and queued counters
+- concurrency.npz   `<name>_t`, `<name>` step series of requests in flight
+                    (dispatched to completed) and queued (scheduled to
+                    dispatched)
+
+Usage:
+    python3 requestTrace.py output/runs/<run_id>
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+# numpy is imported inside the export functions only: they run orchestrator-side,
+# while the client service container (flask and requests only) imports this
+# module for the recording half
+
+_ANCHOR_WALL = time.time()
+_ANCHOR_MONO = time.perf_counter()
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def now():
+    """Monotonic timestamp for the trace points"""
+    return time.perf_counter()
+
+
+def worker_id():
+    """Small integer id of the calling thread (stable for the process lifetime)"""
+    ident = threading.get_ident()
+    wid = _workers.get(ident)
+    if wid is None:
+        with _workers_lock:
+            wid = _workers.setdefault(ident, len(_workers))
+    return wid
+
+
+def connection_id(response):
+    """Local TCP port of a streamed `requests` response (-1 if unavailable)
+
+    Only valid before the body is read: the connection then goes back to the pool.
+    """
+    try:
+        # urllib3 2.x hands the socket over to the response, so go through its fd
+        with socket.socket(fileno=os.dup(response.raw.fileno())) as sock:
+            return sock.getsockname()[1]
+    except (AttributeError, OSError, ValueError):
+        return -1
+
+
+def wall(t):
+    """Unix time of a now() timestamp (0 for None)"""
+    return _ANCHOR_WALL + (t - _ANCHOR_MONO) if t is not None else 0.0
+
+
+def span(scheduled, dispatched, first_byte, completed, connection=-1):
+    """Trace dict of one request; missing points (None) are stored as 0"""
+    return {
+        'scheduled': wall(scheduled),
+        'dispatched': wall(dispatched),
+        'first_byte': wall(first_byte),
+        'completed': wall(completed),
+        'worker': worker_id(),
+        'connection': connection,
+    }
+
+
+def step_series(begin, end):
+    """Number of intervals [begin, end) open over time, as (timestamps, level)
+
+    Ends are applied before begins at the same instant.
+    """
+    import numpy as np
+
+    keep = (begin > 0) & (end >= begin)
+    times = np.concatenate([begin[keep], end[keep]])
+    deltas = np.concatenate([np.ones(keep.sum(), dtype=np.int32), -np.ones(keep.sum(), dtype=np.int32)])
+    order = np.lexsort((deltas, times))
+    return times[order], np.cumsum(deltas[order])
+
+
+def concurrency(records):
+    """{'in_flight': (t, level), 'queued': (t, level)} of a run's records"""
+    return {
+        'in_flight': step_series(records['dispatched'], records['completed']),
+        'queued': step_series(records['scheduled'], records['dispatched']),
+    }
+
+
+def time_weighted_mean(timestamps, level):
+    import numpy as np
+
+    if len(timestamps) < 2:
+        return 0.0
+    span_s = timestamps[-1] - timestamps[0]
+    return float((level[:-1] * np.diff(timestamps)).sum() / span_s) if span_s > 0 else 0.0
+
+
+def chrome_trace(records, models, run_id=None):
+    """Chrome trace event dict (load in chrome://tracing or ui.perfetto.dev)"""
+    import numpy as np
+
+    traced = records[records['dispatched'] > 0]
+    t0 = float(traced['scheduled'][traced['scheduled'] > 0].min()) if len(traced) else 0.0
+
+    def us(t):
+        return round((float(t) - t0) * 1e6, 1)
+
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'client service'}}]
+    for wid in np.unique(traced['worker_id']):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': int(wid),
+                       'args': {'name': f"worker {wid}"}})
+
+    for r in traced:
+        tid = int(r['worker_id'])
+        model = models[r['model_id']] if 0 <= r['model_id'] < len(models) else 'unknown'
+        if 0 < r['scheduled'] < r['dispatched']:
+            events.append({'name': 'queued', 'cat': 'queue', 'ph': 'X', 'pid': 1, 'tid': tid,
+                           'ts': us(r['scheduled']), 'dur': us(r['dispatched']) - us(r['scheduled'])})
+        end = r['completed'] if r['completed'] > 0 else r['dispatched']
+        events.append({'name': 'request', 'cat': 'request', 'ph': 'X', 'pid': 1, 'tid': tid,
+                       'ts': us(r['dispatched']), 'dur': us(end) - us(r['dispatched']),
+                       'args': {'client': int(r['client_id']), 'request': int(r['request_id']),
+                                'model': model, 'ok': bool(r['ok']), 'connection': int(r['connection_id']),
+                                'prompt_tokens': int(r['prompt_tokens']),
+                                'output_tokens': int(r['output_tokens'])}})
+        if r['first_byte'] > 0:
+            events.append({'name': 'waiting', 'cat': 'request', 'ph': 'X', 'pid': 1, 'tid': tid,
+                           'ts': us(r['dispatched']), 'dur': us(r['first_byte']) - us(r['dispatched'])})
+            events.append({'name': 'receiving', 'cat': 'request', 'ph': 'X', 'pid': 1, 'tid': tid,
+                           'ts': us(r['first_byte']), 'dur': us(end) - us(r['first_byte'])})
+
+    for name, (timestamps, level) in concurrency(traced).items():
+        events.extend({'name': name, 'ph': 'C', 'pid': 1, 'ts': us(t), 'args': {'requests': int(n)}}
+                      for t, n in zip(timestamps, level))
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms',
+            'otherData': {'run_id': run_id, 'start_unix': t0}}
+
+
+def export_run(run_dir):
+    """Write trace.json and concurrency.npz for a saved run; returns a summary dict"""
+    import numpy as np
+    import runRecords
+
+    records, manifest = runRecords.load_run(run_dir)
+    if 'dispatched' not in records.dtype.names:
+        raise ValueError(f"{run_dir}: run records have no timeline (record version {manifest.get('version')})")
+    records = np.asarray(records)
+
+    with open(os.path.join(run_dir, "trace.json"), 'w') as f:
+        json.dump(chrome_trace(records, manifest.get('models', []), manifest.get('run_id')), f)
+
+    series = concurrency(records)
+    arrays = {}
+    for name, (timestamps, level) in series.items():
+        arrays[f"{name}_t"] = timestamps
+        arrays[name] = level
+    np.savez_compressed(os.path.join(run_dir, "concurrency.npz"), **arrays)
+
+    traced = records['dispatched'] > 0
+    queue_s = np.where(traced & (records['scheduled'] > 0), records['dispatched'] - records['scheduled'], 0)
+    summary = {
+        'max_in_flight': int(series['in_flight'][1].max()) if len(series['in_flight'][1]) else 0,
+        'mean_in_flight': time_weighted_mean(*series['in_flight']),
+        'max_queued': int(series['queued'][1].max()) if len(series['queued'][1]) else 0,
+        'mean_queue_s': float(queue_s[traced].mean()) if traced.any() else 0.0,
+        'workers': int(len(np.unique(records['worker_id'][traced]))),
+        'connections': int(len(np.unique(records['connection_id'][traced & (records['connection_id'] >= 0)]))),
+    }
+    print(f"✓ Timeline saved to {run_dir}/trace.json ({summary['max_in_flight']} max in flight, "
+          f"{summary['mean_in_flight']:.1f} on average, {summary['mean_queue_s'] * 1000:.1f} ms mean queueing)")
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 requestTrace.py <run_dir> [<run_dir> ...]")
+        sys.exit(1)
+    for run_dir in sys.argv[1:]:
+        export_run(run_dir)
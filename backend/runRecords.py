@@ -0,0 +1,156 @@
+"""
+Typed per-request records for benchmark runs.
+
+Every request of a run becomes one row of a NumPy structured array, saved as
+output/runs/<run_id>/requests.npy next to a manifest.json holding the recipe,
+the SLURM job ids of the services and the model preload metrics. The .npy
+header carries the dtype, so analysis code loads a run with a single
+np.load() (metrics_collection/runs.py) without any text parsing.
+
+Times are seconds; `start` is a Unix timestamp taken by the client just
+before the request was sent. Ollama's own timings (reported in ns) are
+converted to seconds; missing fields are 0. Version 2 adds the request
+timeline of requestTrace.py (scheduled, dispatched, first byte, completed as
+Unix times, worker and connection ids). Version 3 adds the request policy
+of requestPolicy.py: the number of attempts and which one won (-1 if none).
+Version 4 adds how the response cache of responseCache.py answered.
+"""
+
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+RECORD_VERSION = 4
+
+ATTEMPT_KINDS = ('primary', 'hedge', 'retry')
+CACHE_STATUSES = ('bypass', 'miss', 'hit', 'coalesced')
+
+REQUEST_DTYPE = np.dtype([
+    ('client_id', np.int32),
+    ('request_id', np.int32),
+    ('model_id', np.int16),          # index into manifest['models']
+    ('ok', np.bool_),
+    ('start', np.float64),           # Unix time the request was sent
+    ('latency', np.float64),         # client-side wall time
+    ('prompt_tokens', np.int32),     # prompt_eval_count
+    ('output_tokens', np.int32),     # eval_count
+    ('load_s', np.float32),          # load_duration
+    ('prefill_s', np.float32),       # prompt_eval_duration
+    ('decode_s', np.float32),        # eval_duration
+    ('total_s', np.float32),         # total_duration (server side)
+    ('scheduled', np.float64),       # timeline, see requestTrace.py
+    ('dispatched', np.float64),
+    ('first_byte', np.float64),
+    ('completed', np.float64),
+    ('worker_id', np.int16),
+    ('connection_id', np.int32),     # client-side TCP port
+    ('attempts', np.int16),          # request policy, see requestPolicy.py
+    ('winner', np.int16),            # index of the winning attempt, -1 if none
+    ('winner_kind', np.int8),        # index into ATTEMPT_KINDS, -1 if none
+    ('cache', np.int8),              # index into CACHE_STATUSES, -1 if unknown
+])
+
+
+def new_run_id():
+    """Sortable run id: start time plus the orchestrator's SLURM job id (or pid)"""
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getenv('SLURM_JOB_ID', os.getpid())}"
+
+
+def _tagged(model):
+    """Ollama reports 'llama2' as 'llama2:latest'"""
+    return model if ':' in model else f"{model}:latest"
+
+
+def records_from_results(results, models):
+    """Build the structured array from the client service's per-request results
+
+    `models` is the run's model list; each result's 'model' (default: the
+    first entry) is stored as its index.
+    """
+    records = np.zeros(len(results), dtype=REQUEST_DTYPE)
+    tagged = [_tagged(m) for m in models]
+    for row, result in zip(records, results):
+        row['client_id'] = result.get('client_id', -1)
+        row['request_id'] = result.get('request_id', -1)
+        model = _tagged(result.get('model', models[0]))
+        row['model_id'] = tagged.index(model) if model in tagged else -1
+        row['ok'] = 'error' not in result
+        row['start'] = result.get('start_time', 0.0)
+        row['latency'] = result.get('request_time', 0.0)
+        row['prompt_tokens'] = result.get('prompt_eval_count', 0)
+        row['output_tokens'] = result.get('eval_count', 0)
+        row['load_s'] = result.get('load_duration', 0) / 1e9
+        row['prefill_s'] = result.get('prompt_eval_duration', 0) / 1e9
+        row['decode_s'] = result.get('eval_duration', 0) / 1e9
+        row['total_s'] = result.get('total_duration', 0) / 1e9
+        trace = result.get('trace') or {}
+        for field in ('scheduled', 'dispatched', 'first_byte', 'completed'):
+            row[field] = trace.get(field, 0.0)
+        row['worker_id'] = trace.get('worker', -1)
+        row['connection_id'] = trace.get('connection', -1)
+        policy = result.get('policy')
+        if policy:
+            row['attempts'] = len(policy['attempts'])
+            row['winner'] = policy['winner'] if policy['winner'] is not None else -1
+            kind = policy['winning_kind']
+            row['winner_kind'] = ATTEMPT_KINDS.index(kind) if kind in ATTEMPT_KINDS else -1
+        else:
+            row['attempts'] = 1
+            row['winner'] = row['winner_kind'] = 0 if row['ok'] else -1
+        cache = result.get('cache')
+        row['cache'] = CACHE_STATUSES.index(cache) if cache in CACHE_STATUSES else -1
+    return records
+
+
+def collect_job_ids(output_dir="output"):
+    """SLURM job ids of the deployed services, from their published IP files"""
+    jobs = {}
+    for path in glob.glob(os.path.join(output_dir, '*_ip_*.txt')):
+        match = re.match(r'(\w+?)_ip_(\d+)\.txt$', os.path.basename(path))
+        if match:
+            jobs.setdefault(match.group(1), []).append(match.group(2))
+    return {service: sorted(ids) for service, ids in jobs.items()}
+
+
+def write_run(records, recipe, models, run_id=None, runs_dir="output/runs", extra=None):
+    """Save a run as <runs_dir>/<run_id>/{requests.npy,manifest.json}; returns the run directory"""
+    run_id = run_id or new_run_id()
+    run_dir = os.path.join(runs_dir, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+
+    tmp_path = os.path.join(run_dir, "requests.tmp.npy")
+    np.save(tmp_path, records)
+    os.replace(tmp_path, os.path.join(run_dir, "requests.npy"))
+
+    preload_metrics = None
+    if os.path.exists("output/preload_metrics.json"):
+        with open("output/preload_metrics.json", 'r') as f:
+            preload_metrics = json.load(f)
+
+    manifest = {
+        'run_id': run_id,
+        'version': RECORD_VERSION,
+        'created': time.time(),
+        'models': list(models),
+        'n_requests': int(len(records)),
+        'jobs': collect_job_ids(),
+        'orchestrator_job': os.getenv('SLURM_JOB_ID'),
+        'preload_metrics': preload_metrics,
+        'recipe': recipe,
+    }
+    manifest.update(extra or {})
+    with open(os.path.join(run_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return run_dir
+
+
+def load_run(run_dir):
+    """Return (records, manifest) of a saved run; records are memory-mapped"""
+    records = np.load(os.path.join(run_dir, "requests.npy"), mmap_mode='r')
+    with open(os.path.join(run_dir, "manifest.json"), 'r') as f:
+        manifest = json.load(f)
+    return records, manifest
@@ -11,12 +11,28 @@
 #SBATCH --error=orchestrator.err
 
 module load Python
-pip install -r requirements.txt
 
-# Clean previous output directory
+# Clean previous run files, keeping cached artifacts that are reused across jobs
+# (content-addressed containers, Ollama models, Python environments), run records
+# and fitted capacity models
 if [ -d "output" ]; then
-    echo "Removing existing output directory..."
-    rm -rf output
+    echo "Removing previous run files (keeping cached containers, models and environments)..."
+    find output -mindepth 1 -maxdepth 1 \
+      ! -name containers ! -name ollama_models ! -name venvs ! -name runs ! -name capacity_models ! -name client_data \
+      -exec rm -rf {} +
 fi
 
-python -u orch.py recipe_ex/inference_recipe.json "$@"
\ No newline at end of file
+# Python dependencies are installed once per requirements.txt content hash
+REQ_HASH=$(sha256sum requirements.txt | cut -c1-16)
+VENV_DIR=output/venvs/$REQ_HASH
+if [ ! -f "$VENV_DIR/.complete" ]; then
+    echo "Creating Python environment $VENV_DIR..."
+    rm -rf "$VENV_DIR"
+    python -m venv "$VENV_DIR"
+    "$VENV_DIR/bin/pip" install -r requirements.txt
+    touch "$VENV_DIR/.complete"
+else
+    echo "✓ Reusing Python environment $VENV_DIR"
+fi
+
+"$VENV_DIR/bin/python" -u orch.py recipe_ex/inference_recipe.json "$@"
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Memory-mapped vector datasets and streaming, pipelined upserts for Qdrant.
+
+Supported formats (all opened without reading the file into RAM):
+
+- .npy   NumPy array of shape (n, dim)
+- .fvecs float32 records, each prefixed by its int32 dimension (TEXMEX/ANN format)
+- .ivecs int32 records, same layout (ground-truth neighbour lists)
+- .bvecs uint8 records, each prefixed by its int32 dimension
+
+Batches are zero-copy views into the mapping; data is only materialised
+when a batch is serialised for upload, inside the uploader's worker threads.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from benchStats import latency_summary
+
+# extension -> (element dtype, bytes per element)
+VECS_FORMATS = {
+    '.fvecs': (np.float32, 4),
+    '.ivecs': (np.int32, 4),
+    '.bvecs': (np.uint8, 1),
+}
+
+
+def _open_vecs(path, dtype, itemsize):
+    """Map a *vecs file as an (n, dim) view that skips the per-record dimension header"""
+    dim = int(np.fromfile(path, dtype=np.int32, count=1)[0])
+    header = 4 // itemsize  # header length in elements
+    record = header + dim
+    size = os.path.getsize(path)
+    if size % (record * itemsize):
+        raise ValueError(f"{path}: size {size} is not a multiple of the record size {record * itemsize}")
+    records = np.memmap(path, dtype=dtype, mode='r', shape=(size // (record * itemsize), record))
+    return records[:, header:]
+
+
+def open_vectors(path):
+    """Open a vector file as a read-only, memory-mapped (n, dim) array"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        vectors = np.load(path, mmap_mode='r')
+        if vectors.ndim != 2:
+            raise ValueError(f"{path}: expected a 2-D array, got shape {vectors.shape}")
+        return vectors
+    if ext in VECS_FORMATS:
+        return _open_vecs(path, *VECS_FORMATS[ext])
+    raise ValueError(f"Unsupported vector file format: {path}")
+
+
+def iter_batches(vectors, batch_size, start=0, stop=None):
+    """Yield (offset, batch) views of `vectors` without copying"""
+    stop = vectors.shape[0] if stop is None else min(stop, vectors.shape[0])
+    for offset in range(start, stop, batch_size):
+        yield offset, vectors[offset:min(offset + batch_size, stop)]
+
+
+def upload_pipelined(client, collection, vectors, batch_size=1000, in_flight=4, limit=None):
+    """Stream `vectors` into `collection` keeping up to `in_flight` batches outstanding
+
+    Each batch is serialised and sent by a worker thread, so parsing and
+    encoding on the client overlap with the server ingesting the previous
+    batches. Point ids are row offsets in `vectors`. Returns upload statistics.
+    """
+    def send(offset, batch):
+        start = time.time()
+        client.upsert(collection, range(offset, offset + len(batch)), batch.tolist())
+        return len(batch), time.time() - start
+
+    batch_latencies = []
+    uploaded = 0
+    pending = set()
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=in_flight) as pool:
+        for offset, batch in iter_batches(vectors, batch_size, stop=limit):
+            if len(pending) >= in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    count, latency = future.result()
+                    uploaded += count
+                    batch_latencies.append(latency)
+            pending.add(pool.submit(send, offset, batch))
+        for future in pending:
+            count, latency = future.result()
+            uploaded += count
+            batch_latencies.append(latency)
+    wall = time.time() - start
+
+    return {
+        'uploaded': uploaded,
+        'batch_size': batch_size,
+        'in_flight': in_flight,
+        'wall_seconds': wall,
+        'vectors_per_second': uploaded / wall if wall > 0 else 0,
+        'batch_latency': latency_summary(batch_latencies),
+    }
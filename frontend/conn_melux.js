@@ -42,10 +42,28 @@ async function doBenchmarking(res, uploadSourceFiles) {
       { local: '../backend/orch.py', remote: 'orch.py' },
       { local: '../backend/requirements.txt', remote: 'requirements.txt' },
       { local: '../backend/client/clientService.py', remote: 'client/clientService.py' },
+      { local: '../backend/client/profilingHooks.py', remote: 'client/profilingHooks.py' },
+      { local: '../backend/client/backendPool.py', remote: 'client/backendPool.py' },
+      { local: '../backend/client/admissionControl.py', remote: 'client/admissionControl.py' },
+      { local: '../backend/client/requestPolicy.py', remote: 'client/requestPolicy.py' },
+      { local: '../backend/client/workloads.py', remote: 'client/workloads.py' },
+      { local: '../backend/client/responseCache.py', remote: 'client/responseCache.py' },
+      { local: '../backend/client/trafficCapture.py', remote: 'client/trafficCapture.py' },
       { local: '../backend/client/clientServiceHandler.py', remote: 'client/clientServiceHandler.py' },
       { local: '../backend/client/testClientService.py', remote: 'client/testClientService.py' },
       { local: '../backend/ollamaService.py', remote: 'ollamaService.py' },
       { local: '../backend/qdrantService.py', remote: 'qdrantService.py' },
+      { local: '../backend/benchStats.py', remote: 'benchStats.py' },
+      { local: '../backend/nodeStaging.py', remote: 'nodeStaging.py' },
+      { local: '../backend/ollamaAutotune.py', remote: 'ollamaAutotune.py' },
+      { local: '../backend/qdrantBenchmark.py', remote: 'qdrantBenchmark.py' },
+      { local: '../backend/qdrantGroundTruth.py', remote: 'qdrantGroundTruth.py' },
+      { local: '../backend/vectorDataset.py', remote: 'vectorDataset.py' },
+      { local: '../backend/ragBenchmark.py', remote: 'ragBenchmark.py' },
+      { local: '../backend/runRecords.py', remote: 'runRecords.py' },
+      { local: '../backend/requestTrace.py', remote: 'requestTrace.py' },
+      { local: '../backend/prometheusExport.py', remote: 'prometheusExport.py' },
+      { local: '../backend/energyMetrics.py', remote: 'energyMetrics.py' },
       { local: 'recipe.json', remote: 'recipe.json' },
       { local: '../backend/pushgateway_service.sh', remote: 'pushgateway_service.sh' },
       { local: '../backend/client/client_service.def', remote: 'client/client_service.def' },
@@ -696,9 +696,24 @@ function generateJobSH(username){
 #SBATCH --error=/home/users/${username}/output/logs/%x_%j.err
 
 mkdir -p /home/users/${username}/output/logs
+cd /home/users/${username}
 
 module load Python
-python /home/users/u103038/orch.py /home/users/${username}/recipe.json 
+
+# Same environment as slurm_orch.sh: installed once per requirements.txt content hash
+REQ_HASH=$(sha256sum requirements.txt | cut -c1-16)
+VENV_DIR=output/venvs/$REQ_HASH
+if [ ! -f "$VENV_DIR/.complete" ]; then
+    echo "Creating Python environment $VENV_DIR..."
+    rm -rf "$VENV_DIR"
+    python -m venv "$VENV_DIR"
+    "$VENV_DIR/bin/pip" install -r requirements.txt
+    touch "$VENV_DIR/.complete"
+else
+    echo "✓ Reusing Python environment $VENV_DIR"
+fi
+
+"$VENV_DIR/bin/python" -u orch.py recipe.json
 `;
 // writing to file in local
 
@@ -1,194 +1,438 @@
-#anova 0.5 alpha + boxplots for mistral64 and mistral128
-import pandas as pd
+"""
+N-group statistical analysis of recorded benchmark runs.
+
+Runs written by backend/runRecords.py (see runs.py) are grouped by any
+recipe setting -- model, memory, partition, client count or any dotted
+recipe path -- and a per-request metric (tps by default) is compared across
+the groups:
+
+- descriptive statistics with bootstrap confidence intervals of the mean
+- one-way ANOVA (with eta squared) and Welch pairwise t-tests, Holm-corrected
+- Kruskal-Wallis (with epsilon squared) and Dunn pairwise tests, Holm-corrected
+- boxplots of the groups and saturation lines (metric vs client count)
+
+ANOVA and the Welch tests only need per-group moments, which are
+accumulated chunk by chunk straight from the memory-mapped record files.
+Legacy tps_csvs/*.csv files can be compared too with --csv label=path.
+
+Examples:
+    python analyses.py --runs ../backend/output/runs --by memory --where model=mistral
+    python analyses.py --csv 64GB=tps_csvs/mistral64.csv --csv 128GB=tps_csvs/mistral128.csv
+    python analyses.py --runs ../backend/output/runs --saturation --series model
+"""
+
+import argparse
+import itertools
 import numpy as np
-from scipy import stats
 import matplotlib.pyplot as plt
-
-# Load the two CSV files
-mistral64 = pd.read_csv('tps_csvs/mistral64.csv')
-mistral128 = pd.read_csv('tps_csvs/mistral128.csv')
-
-# Add a grouping column to each dataframe
-mistral64['memory'] = '64GB'
-mistral128['memory'] = '128GB'
-
-# Combine into single dataframe for analysis
-df = pd.concat([mistral64, mistral128], ignore_index=True)
-
-print("="*60)
-print("ANOVA ANALYSIS: Mistral 64GB vs 128GB")
-print("="*60)
-
-# Descriptive Statistics
-print("\nDESCRIPTIVE STATISTICS:")
-print("-"*60)
-summary = df.groupby('memory')['tps'].agg(['count', 'mean', 'std', 'min', 'max', 'median'])
-print(summary)
-
-# One-way ANOVA
-print("\n" + "="*60)
-print("ONE-WAY ANOVA (α = 0.05)")
-print("="*60)
-
-group_64 = mistral64['tps'].values
-group_128 = mistral128['tps'].values
-
-f_stat, p_value = stats.f_oneway(group_64, group_128)
-
-print(f"\nNull Hypothesis (H0): No difference in mean TPS between 64GB and 128GB")
-print(f"Alternative Hypothesis (H1): Significant difference in mean TPS")
-print(f"\nF-statistic: {f_stat:.4f}")
-print(f"P-value: {p_value:.6f}")
-print(f"\nSignificance level (α): 0.05")
-
-if p_value < 0.05:
-    print(f"Result: REJECT H0 (p = {p_value:.6f} < 0.05)")
-    print("Conclusion: Significant difference in TPS between 64GB and 128GB")
-else:
-    print(f"Result: FAIL TO REJECT H0 (p = {p_value:.6f} >= 0.05)")
-    print("Conclusion: No significant difference in TPS between 64GB and 128GB")
-
-# Effect size (Cohen's d)
-mean_64 = group_64.mean()
-mean_128 = group_128.mean()
-pooled_std = np.sqrt(((len(group_64)-1)*group_64.std()**2 + (len(group_128)-1)*group_128.std()**2) / (len(group_64)+len(group_128)-2))
-cohens_d = (mean_128 - mean_64) / pooled_std
-
-print(f"\nEffect size (Cohen's d): {cohens_d:.4f}")
-print(f"Interpretation: ", end="")
-if abs(cohens_d) < 0.2:
-    print("Negligible effect")
-elif abs(cohens_d) < 0.5:
-    print("Small effect")
-elif abs(cohens_d) < 0.8:
-    print("Medium effect")
-else:
-    print("Large effect")
-
-# Create boxplot
-print("\n" + "="*60)
-print("GENERATING BOXPLOT...")
-print("="*60)
-
-fig, ax = plt.subplots(figsize=(10, 6))
-
-# Create boxplot
-bp = ax.boxplot([group_64, group_128], 
-                 labels=['64GB', '128GB'],
-                 patch_artist=True,
-                 widths=0.6)
-
-# Customize colors
-colors = ['#ff9999', '#66b3ff']
-for patch, color in zip(bp['boxes'], colors):
-    patch.set_facecolor(color)
-    patch.set_alpha(0.7)
-
-# Styling
-ax.set_xlabel('Memory Allocation', fontsize=12, fontweight='bold')
-ax.set_ylabel('Tokens Per Second (TPS)', fontsize=12, fontweight='bold')
-ax.set_title(f'Mistral TPS Comparison: 64GB vs 128GB\n(p-value = {p_value:.6f} 100 parallel clients)', 
-             fontsize=14, fontweight='bold')
-ax.grid(axis='y', alpha=0.3, linestyle='--')
-
-# Add mean markers
-means = [mean_64, mean_128]
-ax.plot([1, 2], means, 'D', color='red', markersize=8, label='Mean', zorder=3)
-
-# Add sample size annotations
-ax.text(1, ax.get_ylim()[0] + 0.02*(ax.get_ylim()[1]-ax.get_ylim()[0]), 
-        f'n={len(group_64)}', ha='center', fontsize=10)
-ax.text(2, ax.get_ylim()[0] + 0.02*(ax.get_ylim()[1]-ax.get_ylim()[0]), 
-        f'n={len(group_128)}', ha='center', fontsize=10)
-
-# Add significance annotation
-y_max = max(group_64.max(), group_128.max())
-y_range = ax.get_ylim()[1] - ax.get_ylim()[0]
-
-if p_value < 0.05:
-    # Draw significance bar
-    ax.plot([1, 1, 2, 2], [y_max + 0.05*y_range, y_max + 0.08*y_range, 
-                            y_max + 0.08*y_range, y_max + 0.05*y_range], 
-            'k-', linewidth=1.5)
-    ax.text(1.5, y_max + 0.09*y_range, '*', ha='center', fontsize=20)
-    ax.text(1.5, y_max + 0.12*y_range, f'p = {p_value:.4f}', ha='center', fontsize=10)
-else:
-    ax.text(1.5, y_max + 0.08*y_range, 'n.s.', ha='center', fontsize=4, style='italic')
-
-ax.legend()
-
-plt.tight_layout()
-plt.savefig('mistral_64gb_vs_128gb_boxplot.png', dpi=300, bbox_inches='tight')
-print("✓ Boxplot saved as: mistral_64gb_vs_128gb_boxplot.png")
-
-plt.show()
-
-print("\n" + "="*60)
-print("ANALYSIS COMPLETE")
-print("="*60)
-###### anova and saturation analysis(ie tps decay over parallel clients) for mistral 64gb
-import matplotlib.pyplot as plt
-import pandas as pd
-
-# Data from your table
-data = {
-    "clients": [1, 2, 4, 8, 16],
-    "heavy_seq": [129.85, 70.31, 48.69, 32.89, 17.57],   # 100 sequential requests
-    "light_seq": [114.23, 63.50, 57.85, 33.85, 16.90],  # 10 sequential requests
-    "fixed_total": [124.11, 73.65, 37.63, 20.01, 8.15], # clients * seq_reqs = 16
-}
-
-df = pd.DataFrame(data)
-
-fig, ax = plt.subplots(figsize=(8, 5))
-
-ax.plot(df["clients"], df["heavy_seq"],  marker="o", linewidth=2,
-        label="Heavy seq. (100 req/client)")
-ax.plot(df["clients"], df["light_seq"],  marker="s", linewidth=2,
-        label="Light seq. (10 req/client)")
-ax.plot(df["clients"], df["fixed_total"], marker="^", linewidth=2,
-        label="Fixed total (clients×reqs=16)")
-
-ax.set_xscale("log", base=2)  # 1,2,4,8,16 leggibili
-ax.set_xticks(df["clients"])
-ax.get_xaxis().set_major_formatter(plt.ScalarFormatter())
-
-ax.set_xlabel("Number of parallel clients", fontsize=11)
-ax.set_ylabel("Average TPS", fontsize=11)
-ax.set_title("Mistral – TPS vs parallel clients (RAM=64GB, GPU partition)", fontsize=12)
-ax.legend()
-ax.grid(alpha=0.3)
-
-plt.tight_layout()
-plt.savefig("mistral_saturation_lines.png", dpi=300)
-plt.show()
-
 import pandas as pd
-from scipy.stats import f_oneway
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-GPU_CSV = "../team9-EUMASTER4HPC2526/source/metrics_collection/tps_csvs/mistral_sequential_64gbGPU.csv"
-CPU_CSV = "../team9-EUMASTER4HPC2526/source/metrics_collection/tps_csvs/mistral_sequential_64GB_CPU.csv"
-
-# Load data (single column named 'tps')
-gpu = pd.read_csv(GPU_CSV)["tps"].dropna()
-cpu = pd.read_csv(CPU_CSV)["tps"].dropna()
+from scipy import stats
 
-# One-way ANOVA (2 groups)
-F, p = f_oneway(gpu, cpu)
-print(f"ANOVA: F={F:.6g}, p-value={p:.6g}")
+import runs
 
-# Boxplot
-df = pd.DataFrame({
-    "tps": pd.concat([gpu, cpu], ignore_index=True),
-    "group": ["GPU"] * len(gpu) + ["CPU"] * len(cpu),
-})
+# Grouping keys -> recipe path (any other key is read as a dotted recipe path)
+GROUP_KEYS = {
+    'model': 'job.service.model',
+    'memory': 'job.infrastructure.mem_gb',
+    'partition': 'job.infrastructure.partition',
+    'clients': 'job.service.n_clients',
+    'requests': 'job.service.n_requests_per_client',
+    'hedge': 'job.service.request_policy.hedge',
+}
 
-sns.set_theme(style="whitegrid")
-ax = sns.boxplot(data=df, x="group", y="tps")
-ax.set_title(f"TPS (GPU vs CPU) — ANOVA p={p:.3g}")
+# Derived metrics; any other name is read as a record field (latency, prefill_s, ...)
+METRICS = {
+    'tps': runs.tps,
+    'decode_tps': runs.decode_tps,
+}
 
-plt.tight_layout()
-plt.savefig("anova_boxplot_gpu_vs_cpu.png", dpi=200)
-plt.show()
+CHUNK_SIZE = 1 << 20
+
+
+# ----------------------------------------------------------------------------
+# Loading and grouping
+# ----------------------------------------------------------------------------
+
+def recipe_value(manifest, key):
+    """Value of a grouping key (GROUP_KEYS name or dotted path) in a run's recipe"""
+    node = manifest.get('recipe', {})
+    for part in GROUP_KEYS.get(key, key).split('.'):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node
+
+
+def group_runs(runs_dir, by, where=None):
+    """Map group label -> run directories, grouping on one or more keys
+
+    `where` is a dict of key -> required value (compared as strings).
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    groups = {}
+    for run_dir in runs.list_runs(runs_dir):
+        _, manifest = runs.load_run(run_dir)
+        if any(str(recipe_value(manifest, k)) != str(v) for k, v in (where or {}).items()):
+            continue
+        label = "/".join(str(recipe_value(manifest, k)) for k in by)
+        groups.setdefault(label, []).append(run_dir)
+    return groups
+
+
+def metric_values(records, metric):
+    if metric in METRICS:
+        return METRICS[metric](records)
+    return np.asarray(records[metric], dtype=np.float64)
+
+
+def load_group(run_dirs, metric='tps', chunk_size=CHUNK_SIZE):
+    """Metric values of the successful requests of some runs, plus their moments
+
+    Records are read chunk by chunk from the memory-mapped files; values are
+    kept as float32 and the moments (n, mean, M2) are merged per chunk.
+    """
+    values = []
+    moments = (0, 0.0, 0.0)
+    for run_dir in run_dirs:
+        records, _ = runs.load_run(run_dir)
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            chunk_values = metric_values(chunk, metric)[chunk['ok']]
+            moments = merge_moments(moments, chunk_moments(chunk_values))
+            values.append(chunk_values.astype(np.float32))
+    return (np.concatenate(values) if values else np.zeros(0, dtype=np.float32)), moments
+
+
+def load_csv_group(path, column='tps'):
+    """Legacy single-column CSV produced by get_csv.py"""
+    values = pd.read_csv(path)[column].dropna().to_numpy(dtype=np.float64)
+    return values.astype(np.float32), chunk_moments(values)
+
+
+# ----------------------------------------------------------------------------
+# Statistics
+# ----------------------------------------------------------------------------
+
+def chunk_moments(x):
+    """(n, mean, M2) of an array, M2 = sum of squared deviations"""
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == 0:
+        return (0, 0.0, 0.0)
+    mean = x.mean()
+    return (len(x), mean, float(((x - mean) ** 2).sum()))
+
+
+def merge_moments(a, b):
+    """Combine two (n, mean, M2) triples (Chan et al. parallel update)"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return (0, 0.0, 0.0)
+    delta = mean_b - mean_a
+    return (n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n)
+
+
+def holm(p_values):
+    """Holm-Bonferroni adjusted p-values"""
+    p = np.asarray(p_values, dtype=np.float64)
+    order = np.argsort(p)
+    m = len(p)
+    adjusted = np.maximum.accumulate((m - np.arange(m)) * p[order]).clip(max=1.0)
+    out = np.empty(m)
+    out[order] = adjusted
+    return out
+
+
+def anova(moments):
+    """One-way ANOVA from per-group moments: F, p, degrees of freedom, eta squared"""
+    n = np.array([m[0] for m in moments], dtype=np.float64)
+    means = np.array([m[1] for m in moments])
+    m2 = np.array([m[2] for m in moments])
+    k, total = len(n), n.sum()
+    grand_mean = (n * means).sum() / total
+    ss_between = (n * (means - grand_mean) ** 2).sum()
+    ss_within = m2.sum()
+    df_between, df_within = k - 1, total - k
+    f_stat = (ss_between / df_between) / (ss_within / df_within) if ss_within > 0 else np.inf
+    return {
+        'F': float(f_stat),
+        'p': float(stats.f.sf(f_stat, df_between, df_within)),
+        'df': (int(df_between), int(df_within)),
+        'eta_squared': float(ss_between / (ss_between + ss_within)) if ss_between + ss_within > 0 else 0.0,
+    }
+
+
+def pairwise_welch(moments, labels):
+    """Welch t-tests for every pair of groups (Holm-corrected), with Cohen's d"""
+    pairs = list(itertools.combinations(range(len(labels)), 2))
+    n = np.array([m[0] for m in moments], dtype=np.float64)
+    means = np.array([m[1] for m in moments])
+    var = np.array([m[2] for m in moments]) / np.maximum(n - 1, 1)
+    i, j = np.array(pairs).T
+    se2_i, se2_j = var[i] / n[i], var[j] / n[j]
+    t = (means[j] - means[i]) / np.sqrt(se2_i + se2_j)
+    dof = (se2_i + se2_j) ** 2 / (se2_i ** 2 / np.maximum(n[i] - 1, 1) + se2_j ** 2 / np.maximum(n[j] - 1, 1))
+    p = 2 * stats.t.sf(np.abs(t), dof)
+    pooled = np.sqrt(((n[i] - 1) * var[i] + (n[j] - 1) * var[j]) / (n[i] + n[j] - 2))
+    d = (means[j] - means[i]) / pooled
+    return [{'a': labels[a], 'b': labels[b], 't': float(t_), 'p': float(p_), 'p_holm': float(ph),
+             'cohens_d': float(d_)}
+            for (a, b), t_, p_, ph, d_ in zip(pairs, t, p, holm(p), d)]
+
+
+def _ranks(values):
+    """Average ranks (1-based) of a 1-D array, and the tie correction term sum(t^3 - t)"""
+    order = np.argsort(values, kind='mergesort')
+    sorted_values = values[order]
+    # Boundaries of runs of equal values
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    avg_rank = starts + (counts + 1) / 2.0
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat(avg_rank, counts)
+    return ranks, float((counts.astype(np.float64) ** 3 - counts).sum())
+
+
+def kruskal(groups, labels):
+    """Kruskal-Wallis H test plus Dunn pairwise tests (Holm-corrected)"""
+    sizes = np.array([len(g) for g in groups], dtype=np.float64)
+    pooled = np.concatenate([np.asarray(g, dtype=np.float64) for g in groups])
+    total = len(pooled)
+    ranks, ties = _ranks(pooled)
+    bounds = np.r_[0, np.cumsum(sizes).astype(np.int64)]
+    mean_ranks = np.add.reduceat(ranks, bounds[:-1]) / sizes
+
+    tie_factor = 1 - ties / (total ** 3 - total) if total > 1 else 1.0
+    h = (12.0 / (total * (total + 1)) * (sizes * (mean_ranks - (total + 1) / 2) ** 2).sum()) / tie_factor
+    k = len(groups)
+
+    pairs = list(itertools.combinations(range(k), 2))
+    i, j = np.array(pairs).T
+    sigma = np.sqrt((total * (total + 1) / 12.0 - ties / (12.0 * (total - 1))) * (1 / sizes[i] + 1 / sizes[j]))
+    z = (mean_ranks[j] - mean_ranks[i]) / sigma
+    p = 2 * stats.norm.sf(np.abs(z))
+
+    return {
+        'H': float(h),
+        'p': float(stats.chi2.sf(h, k - 1)),
+        'df': k - 1,
+        'epsilon_squared': float(h / ((total ** 2 - 1) / (total + 1))) if total > 1 else 0.0,
+        'mean_ranks': dict(zip(labels, mean_ranks.tolist())),
+        'dunn': [{'a': labels[a], 'b': labels[b], 'z': float(z_), 'p': float(p_), 'p_holm': float(ph)}
+                 for (a, b), z_, p_, ph in zip(pairs, z, p, holm(p))],
+    }
+
+
+def bootstrap_ci(values, statistic=np.mean, n_boot=2000, confidence=95, seed=0, max_elements=1 << 24):
+    """Percentile bootstrap confidence interval of `statistic`
+
+    Resamples are drawn in batches of replicates so that at most
+    `max_elements` resampled values exist at once. `statistic` must accept
+    an `axis` argument.
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return (np.nan, np.nan)
+    rng = np.random.default_rng(seed)
+    batch = max(1, min(n_boot, max_elements // len(values)))
+    estimates = []
+    for done in range(0, n_boot, batch):
+        size = min(batch, n_boot - done)
+        idx = rng.integers(0, len(values), size=(size, len(values)))
+        estimates.append(statistic(values[idx], axis=1))
+    estimates = np.concatenate(estimates)
+    tail = (100 - confidence) / 2
+    return tuple(float(v) for v in np.percentile(estimates, [tail, 100 - tail]))
+
+
+def describe(values, moments, n_boot=2000, confidence=95):
+    n, mean, m2 = moments
+    lo, hi = bootstrap_ci(values, n_boot=n_boot, confidence=confidence)
+    return {
+        'count': int(n),
+        'mean': float(mean),
+        'std': float(np.sqrt(m2 / (n - 1))) if n > 1 else 0.0,
+        'median': float(np.median(values)) if n else np.nan,
+        'min': float(values.min()) if n else np.nan,
+        'max': float(values.max()) if n else np.nan,
+        'ci_low': lo,
+        'ci_high': hi,
+    }
+
+
+def compare_groups(groups, alpha=0.05, n_boot=2000, confidence=95):
+    """Full N-group comparison; `groups` maps label -> (values, moments)"""
+    labels = [label for label, (values, _) in groups.items() if len(values) > 0]
+    values = [groups[label][0] for label in labels]
+    moments = [groups[label][1] for label in labels]
+    report = {
+        'alpha': alpha,
+        'groups': {label: describe(v, m, n_boot, confidence) for label, v, m in zip(labels, values, moments)},
+    }
+    if len(labels) >= 2:
+        report['anova'] = anova(moments)
+        report['welch'] = pairwise_welch(moments, labels)
+        report['kruskal'] = kruskal(values, labels)
+    return report
+
+
+def print_report(report, metric, confidence=95):
+    alpha = report['alpha']
+    print("=" * 60)
+    print(f"{metric.upper()} BY GROUP ({len(report['groups'])} groups, α = {alpha})")
+    print("=" * 60)
+    print(f"{'group':<24} {'n':>7} {'mean':>10} {'std':>10} {'median':>10}  {confidence}% CI of mean")
+    for label, d in report['groups'].items():
+        print(f"{label:<24} {d['count']:>7} {d['mean']:>10.3f} {d['std']:>10.3f} {d['median']:>10.3f}  "
+              f"[{d['ci_low']:.3f}, {d['ci_high']:.3f}]")
+    if 'anova' not in report:
+        print("\nFewer than two non-empty groups: no tests run")
+        return
+
+    a = report['anova']
+    verdict = "REJECT H0" if a['p'] < alpha else "FAIL TO REJECT H0"
+    print(f"\nOne-way ANOVA:   F({a['df'][0]}, {a['df'][1]}) = {a['F']:.4f}, p = {a['p']:.6g}, "
+          f"η² = {a['eta_squared']:.4f}  → {verdict}")
+    kw = report['kruskal']
+    verdict = "REJECT H0" if kw['p'] < alpha else "FAIL TO REJECT H0"
+    print(f"Kruskal-Wallis:  H({kw['df']}) = {kw['H']:.4f}, p = {kw['p']:.6g}, "
+          f"ε² = {kw['epsilon_squared']:.4f}  → {verdict}")
+
+    print("\nPairwise (Holm-corrected):")
+    print(f"{'pair':<36} {'Welch p':>10} {'d':>8} {'Dunn p':>10}")
+    for welch, dunn in zip(report['welch'], kw['dunn']):
+        mark = " *" if min(welch['p_holm'], dunn['p_holm']) < alpha else ""
+        print(f"{welch['a'] + ' vs ' + welch['b']:<36} {welch['p_holm']:>10.4g} {welch['cohens_d']:>8.3f} "
+              f"{dunn['p_holm']:>10.4g}{mark}")
+
+
+# ----------------------------------------------------------------------------
+# Plots
+# ----------------------------------------------------------------------------
+
+def plot_boxplot(groups, report, metric, path, title=None):
+    """Boxplot of every group with mean markers and sample sizes"""
+    labels = list(report['groups'])
+    data = [groups[label][0] for label in labels]
+
+    fig, ax = plt.subplots(figsize=(max(6, 1.6 * len(labels) + 3), 6))
+    bp = ax.boxplot(data, patch_artist=True, widths=0.6)
+    ax.set_xticks(range(1, len(labels) + 1))
+    ax.set_xticklabels(labels)
+    colors = plt.cm.tab10(np.arange(len(labels)) % 10)
+    for patch, color in zip(bp['boxes'], colors):
+        patch.set_facecolor(color)
+        patch.set_alpha(0.7)
+
+    means = [report['groups'][label]['mean'] for label in labels]
+    ax.plot(range(1, len(labels) + 1), means, 'D', color='red', markersize=8, label='Mean', zorder=3)
+    y_min, y_max = ax.get_ylim()
+    for pos, label in enumerate(labels, start=1):
+        ax.text(pos, y_min + 0.02 * (y_max - y_min), f"n={report['groups'][label]['count']}",
+                ha='center', fontsize=10)
+
+    if title is None:
+        title = f"{metric} by group"
+        if 'anova' in report:
+            title += f"\n(ANOVA p = {report['anova']['p']:.4g}, Kruskal-Wallis p = {report['kruskal']['p']:.4g})"
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.set_ylabel(metric, fontsize=12, fontweight='bold')
+    ax.grid(axis='y', alpha=0.3, linestyle='--')
+    ax.legend()
+    plt.tight_layout()
+    plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    print(f"✓ Boxplot saved as: {path}")
+
+
+def saturation_table(runs_dir, metric='tps', x='clients', series='model', where=None, n_boot=1000):
+    """Mean metric (with bootstrap CI) per x value for every series value"""
+    table = {}
+    for label, run_dirs in group_runs(runs_dir, [series, x], where).items():
+        series_value, x_value = label.rsplit('/', 1)
+        try:
+            x_value = float(x_value)
+        except ValueError:
+            continue
+        values, moments = load_group(run_dirs, metric)
+        if moments[0] == 0:
+            continue
+        lo, hi = bootstrap_ci(values, n_boot=n_boot)
+        table.setdefault(series_value, []).append((x_value, moments[1], lo, hi, moments[0]))
+    return {s: sorted(points) for s, points in table.items()}
+
+
+def plot_saturation(table, metric, path, x='clients', title=None):
+    """Metric vs x (log2 axis) per series, with the bootstrap CI as a band"""
+    fig, ax = plt.subplots(figsize=(8, 5))
+    markers = itertools.cycle("os^Dvp*")
+    xs = set()
+    for series_value, points in sorted(table.items()):
+        px, mean, lo, hi, _ = (np.array(col) for col in zip(*points))
+        ax.plot(px, mean, marker=next(markers), linewidth=2, label=series_value)
+        ax.fill_between(px, lo, hi, alpha=0.2)
+        xs.update(px.tolist())
+
+    ax.set_xscale("log", base=2)
+    ax.set_xticks(sorted(xs))
+    ax.get_xaxis().set_major_formatter(plt.ScalarFormatter())
+    ax.set_xlabel(f"Number of parallel {x}" if x == 'clients' else x, fontsize=11)
+    ax.set_ylabel(f"Average {metric}", fontsize=11)
+    ax.set_title(title or f"{metric} vs {x}", fontsize=12)
+    ax.legend()
+    ax.grid(alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+    plt.close(fig)
+    print(f"✓ Saturation plot saved as: {path}")
+
+
+# ----------------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------------
+
+def _parse_pairs(items):
+    pairs = {}
+    for item in items or []:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise SystemExit(f"Expected key=value, got '{item}'")
+        pairs[key] = value
+    return pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a per-request metric across groups of recorded runs")
+    parser.add_argument('--runs', default='../backend/output/runs', help="Run records directory")
+    parser.add_argument('--by', nargs='+', default=['model'],
+                        help=f"Grouping keys: {', '.join(GROUP_KEYS)} or a dotted recipe path")
+    parser.add_argument('--where', nargs='*', default=[], help="Filters as key=value")
+    parser.add_argument('--csv', action='append', help="Legacy CSV group as label=path (replaces --runs)")
+    parser.add_argument('--metric', default='tps', help="tps, decode_tps or a record field (latency, ...)")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--bootstrap', type=int, default=2000, help="Bootstrap replicates")
+    parser.add_argument('--confidence', type=float, default=95)
+    parser.add_argument('--boxplot', default='groups_boxplot.png', help="Boxplot output path ('' to skip)")
+    parser.add_argument('--saturation', action='store_true', help="Plot metric vs client count instead")
+    parser.add_argument('--series', default='model', help="Series key for --saturation")
+    parser.add_argument('--output', default='saturation_lines.png', help="Saturation plot path")
+    args = parser.parse_args()
+
+    where = _parse_pairs(args.where)
+
+    if args.saturation:
+        table = saturation_table(args.runs, args.metric, 'clients', args.series, where, args.bootstrap)
+        for series_value, points in table.items():
+            print(f"{series_value}: " + ", ".join(f"{int(x)}→{m:.2f}" for x, m, _, _, _ in points))
+        plot_saturation(table, args.metric, args.output)
+    else:
+        if args.csv:
+            groups = {label: load_csv_group(path) for label, path in _parse_pairs(args.csv).items()}
+        else:
+            groups = {label: load_group(run_dirs, args.metric)
+                      for label, run_dirs in sorted(group_runs(args.runs, args.by, where).items())}
+        report = compare_groups(groups, args.alpha, args.bootstrap, args.confidence)
+        print_report(report, args.metric, args.confidence)
+        if args.boxplot and report['groups']:
+            plot_boxplot(groups, report, args.metric, args.boxplot)
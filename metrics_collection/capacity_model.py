@@ -0,0 +1,245 @@
+"""
+Universal Scalability Law capacity model fitted from recorded sweeps.
+
+Throughput X (requests/s, or tokens/s with --metric tokens) of every
+recorded run is paired with its concurrency (recipe n_clients) and fitted
+with
+
+    X(N) = lambda * N / (1 + sigma * (N - 1) + kappa * N * (N - 1))
+
+where lambda is the single-client throughput, sigma the contention
+(serialisation) coefficient and kappa the coherency (crosstalk)
+coefficient. Amdahl's law is the kappa = 0 special case and is fitted too.
+
+From the fit:
+
+- N*    = sqrt((1 - sigma) / kappa), the concurrency of peak throughput
+- X_max = X(N*), the peak throughput of one node
+- nodes = ceil(target / (utilization * X_max)) for a target request rate
+
+Confidence bounds of the parameters come from the fit covariance; bounds of
+N* and X_max from sampling the parameters from it. The model is saved as
+JSON (default ../backend/output/capacity_models/<series>.json) where the
+orchestrator picks it up to size deployments (service.capacity.target_rps).
+
+Examples:
+    python capacity_model.py --runs ../backend/output/runs --where model=mistral
+    python capacity_model.py --runs ../backend/output/runs --series model --target-rps 20 --plot usl.png
+"""
+
+import os
+import re
+import json
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy import stats
+from scipy.optimize import curve_fit
+
+import runs
+from analyses import group_runs, recipe_value, _parse_pairs
+
+
+def usl(n, lam, sigma, kappa):
+    n = np.asarray(n, dtype=np.float64)
+    return lam * n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+
+def amdahl(n, lam, sigma):
+    return usl(n, lam, sigma, 0.0)
+
+
+def run_throughput(run_dir, metric='requests'):
+    """(concurrency, throughput) of one recorded run"""
+    records, manifest = runs.load_run(run_dir)
+    ok = records['ok']
+    if not ok.any():
+        return None
+    window = (records['start'] + records['latency'])[ok].max() - records['start'][ok].min()
+    if window <= 0:
+        return None
+    amount = ok.sum() if metric == 'requests' else records['output_tokens'][ok].sum()
+    return float(recipe_value(manifest, 'clients') or 1), float(amount / window)
+
+
+def sweep_points(run_dirs, metric='requests'):
+    points = [p for p in (run_throughput(d, metric) for d in run_dirs) if p is not None]
+    if not points:
+        return np.zeros(0), np.zeros(0)
+    n, x = np.array(points).T
+    return n, x
+
+
+def peak(lam, sigma, kappa):
+    """(N*, X_max); N* is infinite when kappa == 0 (throughput tends to lambda / sigma)"""
+    if kappa <= 0:
+        return np.inf, (lam / sigma if sigma > 0 else np.inf)
+    n_star = np.sqrt(max(1 - sigma, 0) / kappa)
+    n_star = max(n_star, 1.0)
+    return float(n_star), float(usl(n_star, lam, sigma, kappa))
+
+
+def fit_capacity(n, x, confidence=95, n_samples=4000, seed=0):
+    """Fit USL and Amdahl to (concurrency, throughput) points"""
+    if len(np.unique(n)) < 3:
+        raise ValueError("Need throughput at 3 or more distinct concurrency levels")
+    lam0 = float(x[np.argmin(n)] / n.min())
+    alpha = (100 - confidence) / 100
+
+    popt, pcov = curve_fit(usl, n, x, p0=[lam0, 0.05, 0.001],
+                           bounds=([0, 0, 0], [np.inf, 1, np.inf]), maxfev=20000)
+    dof = max(len(n) - 3, 1)
+    t_crit = stats.t.ppf(1 - alpha / 2, dof)
+    se = np.sqrt(np.clip(np.diag(pcov), 0, None))
+    names = ('lambda', 'sigma', 'kappa')
+    params = {name: {'value': float(v), 'se': float(s), 'ci_low': float(max(v - t_crit * s, 0)),
+                     'ci_high': float(v + t_crit * s)}
+              for name, v, s in zip(names, popt, se)}
+
+    residuals = x - usl(n, *popt)
+    ss_res = float((residuals ** 2).sum())
+    ss_tot = float(((x - x.mean()) ** 2).sum())
+
+    # Uncertainty of N* and X_max: sample parameters from the fit covariance
+    rng = np.random.default_rng(seed)
+    samples = rng.multivariate_normal(popt, np.nan_to_num(pcov), size=n_samples, check_valid='ignore')
+    samples[:, 0] = np.clip(samples[:, 0], 1e-12, None)
+    samples[:, 1] = np.clip(samples[:, 1], 0, 1)
+    samples[:, 2] = np.clip(samples[:, 2], 0, None)
+    peaks = np.array([peak(*s) for s in samples])
+    finite = np.isfinite(peaks).all(axis=1)
+    tail = (100 - confidence) / 2
+    n_star, x_max = peak(*popt)
+
+    def bounds(column):
+        if not finite.any():
+            return [None, None]
+        return [float(v) for v in np.percentile(peaks[finite, column], [tail, 100 - tail])]
+
+    amdahl_popt, _ = curve_fit(amdahl, n, x, p0=[lam0, 0.05], bounds=([0, 0], [np.inf, 1]), maxfev=20000)
+
+    return {
+        'model': 'usl',
+        'confidence': confidence,
+        'params': params,
+        'r_squared': 1 - ss_res / ss_tot if ss_tot > 0 else None,
+        'n_star': n_star if np.isfinite(n_star) else None,
+        'n_star_ci': bounds(0),
+        'x_max': x_max if np.isfinite(x_max) else None,
+        'x_max_ci': bounds(1),
+        'amdahl': {'lambda': float(amdahl_popt[0]), 'sigma': float(amdahl_popt[1]),
+                   'x_limit': float(amdahl_popt[0] / amdahl_popt[1]) if amdahl_popt[1] > 0 else None},
+        'points': {'concurrency': n.tolist(), 'throughput': x.tolist()},
+    }
+
+
+def size_deployment(model, target, utilization=0.8):
+    """Nodes needed to serve `target` throughput, each run at `utilization` of its peak
+
+    Also returns the per-node concurrency that delivers the per-node share
+    (None if one node cannot reach it). Returns None when the fit has no
+    finite, positive peak throughput.
+    """
+    x_max = model['x_max']
+    if x_max is None:
+        x_max = model['amdahl']['x_limit']
+    if not x_max or x_max <= 0:
+        return None
+    per_node = utilization * x_max
+    nodes = int(np.ceil(target / per_node))
+    share = target / nodes
+    lam, sigma, kappa = (model['params'][p]['value'] for p in ('lambda', 'sigma', 'kappa'))
+    grid = np.arange(1, int(model['n_star'] or 4096) + 1)
+    reach = np.flatnonzero(usl(grid, lam, sigma, kappa) >= share)
+    # Conservative bound: the pessimistic end of the X_max interval
+    x_low = model['x_max_ci'][0]
+    return {
+        'target': target,
+        'utilization': utilization,
+        'nodes': nodes,
+        'nodes_pessimistic': int(np.ceil(target / (utilization * x_low))) if x_low else None,
+        'per_node_throughput': share,
+        'per_node_concurrency': int(grid[reach[0]]) if len(reach) else None,
+    }
+
+
+def plot_fit(fits, path, metric='requests'):
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for label, model in fits.items():
+        n = np.array(model['points']['concurrency'])
+        x = np.array(model['points']['throughput'])
+        grid = np.linspace(1, max(n.max(), model['n_star'] or 0) * 1.5, 300)
+        p = model['params']
+        line, = ax.plot(grid, usl(grid, p['lambda']['value'], p['sigma']['value'], p['kappa']['value']),
+                        linewidth=2, label=f"{label} USL")
+        ax.scatter(n, x, color=line.get_color(), zorder=3)
+        if model['n_star']:
+            ax.axvline(model['n_star'], color=line.get_color(), linestyle=':', alpha=0.6)
+    ax.set_xlabel("Concurrency (parallel clients)", fontsize=11)
+    ax.set_ylabel(f"Throughput ({metric}/s)", fontsize=11)
+    ax.set_title("Universal Scalability Law fit", fontsize=12)
+    ax.legend()
+    ax.grid(alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+    plt.close(fig)
+    print(f"✓ USL plot saved as: {path}")
+
+
+def _slug(label):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'all'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit USL capacity models to recorded concurrency sweeps")
+    parser.add_argument('--runs', default='../backend/output/runs', help="Run records directory")
+    parser.add_argument('--series', nargs='*', default=['model'], help="Keys identifying one system under test")
+    parser.add_argument('--where', nargs='*', default=[], help="Filters as key=value")
+    parser.add_argument('--metric', choices=['requests', 'tokens'], default='requests')
+    parser.add_argument('--confidence', type=float, default=95)
+    parser.add_argument('--target-rps', type=float, help="Target throughput to size a deployment for")
+    parser.add_argument('--utilization', type=float, default=0.8, help="Fraction of peak each node may run at")
+    parser.add_argument('--output-dir', default='../backend/output/capacity_models')
+    parser.add_argument('--plot', help="Save a plot of the fits to this path")
+    args = parser.parse_args()
+
+    fits = {}
+    for label, run_dirs in sorted(group_runs(args.runs, args.series, _parse_pairs(args.where)).items()):
+        n, x = sweep_points(run_dirs, args.metric)
+        try:
+            model = fit_capacity(n, x, args.confidence)
+        except (ValueError, RuntimeError) as e:
+            print(f"{label}: cannot fit ({e})")
+            continue
+        model.update({'series': label, 'series_keys': args.series, 'metric': args.metric,
+                      'runs': [os.path.basename(d) for d in run_dirs]})
+        if args.target_rps:
+            model['sizing'] = size_deployment(model, args.target_rps, args.utilization)
+        fits[label] = model
+
+        p = model['params']
+        print(f"\n{label} ({len(n)} runs, R² = {model['r_squared']:.4f})")
+        for name in ('lambda', 'sigma', 'kappa'):
+            print(f"  {name:<7} = {p[name]['value']:.5g}  [{p[name]['ci_low']:.5g}, {p[name]['ci_high']:.5g}]")
+        if model['n_star']:
+            lo, hi = model['n_star_ci']
+            print(f"  N*      = {model['n_star']:.1f}  [{lo:.1f}, {hi:.1f}]")
+            lo, hi = model['x_max_ci']
+            print(f"  X_max   = {model['x_max']:.3f} {args.metric}/s  [{lo:.3f}, {hi:.3f}]")
+        else:
+            print(f"  No coherency penalty: throughput tends to {model['amdahl']['x_limit']:.3f} {args.metric}/s")
+        if args.target_rps and model['sizing'] is None:
+            print("  Cannot size a deployment: no finite peak throughput")
+        elif 'sizing' in model:
+            s = model['sizing']
+            print(f"  {args.target_rps} {args.metric}/s → {s['nodes']} node(s) at {args.utilization:.0%} of peak "
+                  f"(pessimistic: {s['nodes_pessimistic']}), {s['per_node_concurrency']} clients per node")
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = os.path.join(args.output_dir, f"{_slug(label)}.json")
+        with open(path, 'w') as f:
+            json.dump(model, f, indent=2)
+        print(f"  ✓ Saved {path}")
+
+    if args.plot and fits:
+        plot_fit(fits, args.plot, args.metric)
@@ -1,80 +1,195 @@
 import os
 import re
 import csv
-from pathlib import Path
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_tps_to_csvs_by_directory(root_directory, output_directory='tps_csvs'):
+TPS_PATTERN = re.compile(rb'TPS=(\d+\.?\d*)')
+MANIFEST_NAME = '.manifest.json'
+
+
+def _csv_name(filepath):
+    """CSV named after the parent directory of a .out file"""
+    parent_dir = os.path.basename(os.path.dirname(filepath))
+    if not parent_dir or parent_dir == '.':
+        parent_dir = 'root'
+    return f"{parent_dir}.csv"
+
+
+def _scan_file(filepath, offset, block_size=1 << 20):
+    """Stream a log from `offset` and return (filepath, tps_values, new_offset)
+
+    The file is read in fixed-size blocks and each block is scanned up to its
+    last newline, so memory stays bounded by the block size. Only complete
+    lines are consumed: a line still being written by a running job is left
+    for the next run, so new_offset always points after a newline.
     """
-    Recursively find all .out files, extract TPS values, 
+    values = []
+    carry = b''
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            block = carry + block
+            end = block.rfind(b'\n') + 1
+            carry = block[end:]
+            values.extend(float(v) for v in TPS_PATTERN.findall(block, 0, end))
+            offset += end
+    return filepath, values, offset
+
+
+def _load_manifest(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'files': {}, 'csvs': {}}
+
+
+def _save_manifest(path, manifest):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _csv_rows(csv_filepath):
+    """Data rows in an existing CSV (header excluded), None if missing"""
+    try:
+        with open(csv_filepath, 'rb') as f:
+            return max(0, sum(1 for _ in f) - 1)
+    except FileNotFoundError:
+        return None
+
+
+def _replaced(state, size, mtime):
+    """True if a tracked log shrank or was rewritten in place (not just appended to)"""
+    if state is None:
+        return False
+    return size < state['offset'] or (size == state['size'] and mtime != state['mtime'])
+
+
+def _find_logs(root_directory, output_directory):
+    """Yield (path, size, mtime_ns) for every .out file under root"""
+    skip = os.path.abspath(output_directory)
+    for root, dirs, files in os.walk(root_directory):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != skip]
+        for filename in files:
+            if filename.endswith('.out'):
+                filepath = os.path.join(root, filename)
+                try:
+                    st = os.stat(filepath)
+                except OSError:
+                    continue
+                yield filepath, st.st_size, st.st_mtime_ns
+
+
+def extract_tps_to_csvs_by_directory(root_directory, output_directory='tps_csvs', workers=None):
+    """
+    Recursively find all .out files, extract TPS values,
     and save to CSVs named after their parent directory.
     Multiple .out files in same directory append to same CSV.
+
+    Incremental and idempotent: a manifest in the output directory records
+    each log's size, mtime and the byte offset read so far, so re-running
+    only reads bytes appended since the last run. A CSV is rebuilt from
+    scratch when one of its logs shrank (truncated or replaced) or when its
+    row count no longer matches the manifest (e.g. an interrupted run).
+    Files are scanned line by line in a process pool.
     """
-    # Create output directory if it doesn't exist
     os.makedirs(output_directory, exist_ok=True)
-    
-    # Dictionary to track which CSVs we've created (to write header only once)
-    csv_files_created = set()
-    
+    manifest_path = os.path.join(output_directory, MANIFEST_NAME)
+    manifest = _load_manifest(manifest_path)
+    known_files = manifest['files']
+    csv_rows = manifest['csvs']
+
+    logs = sorted(_find_logs(root_directory, output_directory))
+    by_csv = {}
+    for filepath, size, mtime in logs:
+        by_csv.setdefault(_csv_name(filepath), []).append((filepath, size, mtime))
+
+    # Decide which CSVs must be rewritten and which only get appended to
+    rebuild = set()
+    for csv_filename, entries in by_csv.items():
+        csv_filepath = os.path.join(output_directory, csv_filename)
+        rows = _csv_rows(csv_filepath)
+        if rows is None or rows != csv_rows.get(csv_filename):
+            rebuild.add(csv_filename)
+        elif any(_replaced(known_files.get(filepath), size, mtime) for filepath, size, mtime in entries):
+            rebuild.add(csv_filename)
+
+    tasks = []
+    for csv_filename, entries in by_csv.items():
+        for filepath, size, mtime in entries:
+            state = known_files.get(filepath)
+            if csv_filename in rebuild or state is None:
+                tasks.append((filepath, 0))
+            elif size != state['size'] or mtime != state['mtime']:
+                tasks.append((filepath, state['offset']))
+
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(tasks) // (4 * workers))
+            scanned = {path: (values, offset) for path, values, offset in
+                       pool.map(_scan_file, *zip(*tasks), chunksize=chunksize)}
+    else:
+        scanned = {}
+
     processed_files = 0
     total_tps_values = 0
-    
-    # Walk through directory recursively
-    for root, dirs, files in os.walk(root_directory):
-        for filename in files:
-            if filename.endswith('.out'):
-                filepath = os.path.join(root, filename)
-                
-                # Get parent directory name
-                parent_dir = os.path.basename(os.path.dirname(filepath))
-                if not parent_dir or parent_dir == '.':
-                    parent_dir = 'root'
-                
-                # CSV filename based on parent directory
-                csv_filename = f"{parent_dir}.csv"
-                csv_filepath = os.path.join(output_directory, csv_filename)
-                
-                try:
-                    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        
-                        # Find all TPS values using regex
-                        tps_matches = re.findall(r'TPS=(\d+\.?\d*)', content)
-                        
-                        if tps_matches:
-                            # Determine write mode and whether to write header
-                            write_mode = 'a' if csv_filepath in csv_files_created else 'w'
-                            write_header = csv_filepath not in csv_files_created
-                            
-                            # Write TPS values to CSV (append mode if already exists)
-                            with open(csv_filepath, write_mode, newline='') as csvfile:
-                                writer = csv.writer(csvfile)
-                                if write_header:
-                                    writer.writerow(['tps'])  # Header
-                                for tps_value in tps_matches:
-                                    writer.writerow([float(tps_value)])
-                            
-                            csv_files_created.add(csv_filepath)
-                            processed_files += 1
-                            total_tps_values += len(tps_matches)
-                            
-                            mode_str = "appended to" if write_mode == 'a' else "created"
-                            print(f"✓ {filename} → {csv_filename} ({len(tps_matches)} values {mode_str})")
-                        
-                except Exception as e:
-                    print(f"✗ Error reading {filepath}: {e}")
-    
+    for csv_filename, entries in sorted(by_csv.items()):
+        csv_filepath = os.path.join(output_directory, csv_filename)
+        fresh = csv_filename in rebuild
+        new_values = []
+        for filepath, size, mtime in entries:
+            if filepath not in scanned:
+                continue
+            values, offset = scanned[filepath]
+            new_values.extend(values)
+            known_files[filepath] = {'csv': csv_filename, 'size': size, 'mtime': mtime, 'offset': offset}
+            if values:
+                processed_files += 1
+                total_tps_values += len(values)
+                print(f"✓ {filepath} → {csv_filename} ({len(values)} values)")
+
+        if not fresh and not new_values:
+            continue
+        with open(csv_filepath, 'w' if fresh else 'a', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            if fresh:
+                writer.writerow(['tps'])  # Header
+            writer.writerows([v] for v in new_values)
+        csv_rows[csv_filename] = (0 if fresh else csv_rows.get(csv_filename, 0)) + len(new_values)
+        mode_str = "rebuilt" if fresh else "appended to"
+        print(f"  {csv_filename}: {len(new_values)} values {mode_str}")
+
+    # Forget logs that no longer exist (their values stay in the CSVs)
+    present = {filepath for filepath, _, _ in logs}
+    for filepath in [p for p in known_files if p not in present]:
+        del known_files[filepath]
+    _save_manifest(manifest_path, manifest)
+
     # Summary
     print(f"\n{'='*60}")
-    print(f"SUCCESS: Processed {processed_files} .out files")
-    print(f"Created {len(csv_files_created)} unique CSV files")
-    print(f"Total TPS values extracted: {total_tps_values}")
+    print(f"SUCCESS: Processed {processed_files} .out files "
+          f"({len(tasks)} scanned, {len(logs) - len(tasks)} unchanged)")
+    print(f"Tracking {len(by_csv)} unique CSV files")
+    print(f"New TPS values extracted: {total_tps_values}")
     print(f"Output directory: {output_directory}/")
     print(f"{'='*60}")
-    
-    return processed_files, len(csv_files_created), total_tps_values
 
-# Usage
-root_dir = '.'  # Current directory, change to your target directory
-output_dir = 'tps_csvs'  # Directory where CSVs will be saved
+    return processed_files, len(by_csv), total_tps_values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract TPS values from .out logs into per-directory CSVs")
+    parser.add_argument('root', nargs='?', default='.', help="Directory to scan recursively (default: .)")
+    parser.add_argument('--output', default='tps_csvs', help="Directory where CSVs are saved (default: tps_csvs)")
+    parser.add_argument('--workers', type=int, default=None, help="Scanner processes (default: CPU count)")
+    args = parser.parse_args()
 
-processed, unique_csvs, total = extract_tps_to_csvs_by_directory(root_dir, output_dir)
+    processed, unique_csvs, total = extract_tps_to_csvs_by_directory(args.root, args.output, args.workers)
@@ -0,0 +1,140 @@
+"""
+Load benchmark runs written by backend/runRecords.py.
+
+Each run directory holds requests.npy (one structured row per request) and
+manifest.json (recipe, job ids, preload metrics). Everything here is
+vectorised over the record array; no log parsing is involved.
+
+    records, manifest = load_run('../backend/output/runs/20250101_120000_123456')
+    tps(records)                  # same definition as the legacy TPS= values
+    to_dataframe(records, manifest)
+    load_hardware(run_dir)        # GPU/node series from prometheusExport.py
+    load_concurrency(run_dir)     # requests in flight over time (requestTrace.py)
+"""
+
+import os
+import sys
+import json
+import numpy as np
+import numpy.lib.recfunctions as rfn
+import pandas as pd
+
+
+def load_run(run_dir):
+    """Return (records, manifest); records are a memory-mapped structured array"""
+    records = np.load(os.path.join(run_dir, 'requests.npy'), mmap_mode='r')
+    with open(os.path.join(run_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    return records, manifest
+
+
+def list_runs(runs_dir):
+    """Run directories under runs_dir, oldest first (run ids sort by start time)"""
+    return [os.path.join(runs_dir, d) for d in sorted(os.listdir(runs_dir))
+            if os.path.exists(os.path.join(runs_dir, d, 'requests.npy'))]
+
+
+def load_runs(runs_dir):
+    """Concatenate all runs: returns (records, run_index, manifests)
+
+    run_index[i] is the position in `manifests` of the run record i belongs to.
+    Runs of different record versions are joined on their common fields.
+    """
+    loaded = [load_run(d) for d in list_runs(runs_dir)]
+    if not loaded:
+        return np.zeros(0), np.zeros(0, dtype=np.int32), []
+    common = [name for name in loaded[0][0].dtype.names if all(name in r.dtype.names for r, _ in loaded)]
+    records = np.concatenate([rfn.repack_fields(np.asarray(r)[common]) for r, _ in loaded])
+    run_index = np.repeat(np.arange(len(loaded), dtype=np.int32), [len(r) for r, _ in loaded])
+    return records, run_index, [m for _, m in loaded]
+
+
+def load_hardware(run_dir):
+    """Hardware series exported by backend/prometheusExport.py
+
+    Returns {metric: (timestamps, values[n_series, n_steps], labels)}, or {}
+    if the run has no hardware.npz.
+    """
+    path = os.path.join(run_dir, 'hardware.npz')
+    if not os.path.exists(path):
+        return {}
+    arrays = np.load(path)
+    with open(os.path.join(run_dir, 'hardware_labels.json'), 'r') as f:
+        labels = json.load(f)['series']
+    return {name: (arrays[f"{name}_t"], arrays[name], labels[name]) for name in labels}
+
+
+def load_concurrency(run_dir):
+    """Requests in flight / queued over time, exported by backend/requestTrace.py
+
+    Returns {'in_flight': (timestamps, level), 'queued': (timestamps, level)},
+    or {} if the run has no concurrency.npz.
+    """
+    path = os.path.join(run_dir, 'concurrency.npz')
+    if not os.path.exists(path):
+        return {}
+    arrays = np.load(path)
+    return {name: (arrays[f"{name}_t"], arrays[name]) for name in ('in_flight', 'queued')}
+
+
+def hardware_at(hardware, metric, times, reduce=np.nanmean):
+    """Value of a hardware metric at each of `times` (e.g. records['start'])
+
+    Series are reduced across rows (mean over GPUs by default), then the
+    closest earlier sample is taken.
+    """
+    timestamps, values, _ = hardware[metric]
+    series = reduce(values, axis=0) if len(values) else np.full(len(timestamps), np.nan)
+    idx = np.clip(np.searchsorted(timestamps, times, side='right') - 1, 0, len(timestamps) - 1)
+    return series[idx]
+
+
+def tps(records):
+    """Output tokens per second of client wall time (the legacy TPS= value), 0 where undefined"""
+    latency = records['latency']
+    return np.divide(records['output_tokens'], latency, out=np.zeros(len(records)), where=latency > 0)
+
+
+def decode_tps(records):
+    """Server-side generation speed: output tokens per second of eval_duration"""
+    decode = records['decode_s'].astype(np.float64)
+    return np.divide(records['output_tokens'], decode, out=np.zeros(len(records)), where=decode > 0)
+
+
+def to_dataframe(records, manifest):
+    """pandas DataFrame of a run with model names resolved and tps columns added"""
+    df = pd.DataFrame(np.asarray(records))
+    models = np.array(manifest.get('models', []) + ['unknown'])
+    df['model'] = models[np.where(df['model_id'] >= 0, df['model_id'], len(models) - 1)]
+    df['tps'] = tps(records)
+    df['decode_tps'] = decode_tps(records)
+    df['run_id'] = manifest.get('run_id')
+    return df
+
+
+def summarize(records, manifest):
+    """One-line summary dict of a run"""
+    ok = records['ok']
+    latency = records['latency'][ok]
+    # Request policy cost: attempts sent per request (1.0 without hedging / retries)
+    attempts = float(records['attempts'].mean()) if 'attempts' in records.dtype.names and len(records) else 1.0
+    return {
+        'run_id': manifest.get('run_id'),
+        'models': ','.join(manifest.get('models', [])),
+        'requests': int(len(records)),
+        'ok': int(ok.sum()),
+        'mean_tps': float(tps(records)[ok].mean()) if ok.any() else 0.0,
+        'p50_latency': float(np.percentile(latency, 50)) if ok.any() else 0.0,
+        'p95_latency': float(np.percentile(latency, 95)) if ok.any() else 0.0,
+        'p99_latency': float(np.percentile(latency, 99)) if ok.any() else 0.0,
+        'attempts': attempts,
+    }
+
+
+if __name__ == "__main__":
+    runs_dir = sys.argv[1] if len(sys.argv) > 1 else '../backend/output/runs'
+    for run_dir in list_runs(runs_dir):
+        s = summarize(*load_run(run_dir))
+        print(f"{s['run_id']:<28} {s['models']:<20} {s['ok']:>5}/{s['requests']:<5} "
+              f"TPS={s['mean_tps']:.2f}  p50={s['p50_latency']:.2f}s  p95={s['p95_latency']:.2f}s  "
+              f"p99={s['p99_latency']:.2f}s  attempts={s['attempts']:.2f}")